@@ -1,16 +1,11 @@
 import os
-import json
-from flask import request, jsonify, redirect
+from flask import request, jsonify, redirect, Response, g
 from flask_openapi3 import OpenAPI, Info, Tag
 from flask_cors import CORS
-import requests
-import pudb
-import enum
-from datetime import datetime
 
 from models import GenericSchema, AuthHeader
-from schemas.queue import ProcessSyncSchema
-from schemas.event import EventBuscaIdSchema, EventSchema, EventBuscaSchema
+from schemas.queue import ProcessSyncSchema, SyncJobPathSchema
+from schemas.event import EventBuscaIdSchema, EventSchema, EventBuscaSchema, AppointmentBatchSchema
 from services.token_service import verify_token
 from services.auth_service import (
     login_auth,
@@ -19,7 +14,54 @@ from services.auth_service import (
     confirm_sign_up_auth,
     refresh_token_auth
 )
-from config import MICRO_QUEUE_API_URL, MICRO_APPOINTMENTS_URL
+from services.http_client import get_client
+from services.serialization import encode_json, encode_model
+from services.passthrough import proxy_response, content_response, is_json_response, may_contain_key
+from services.sync_batching import plan_chunks, send_chunks
+from services.appointments_batch import plan_operations, send_operations
+from services.sync_stream import SyncStreamEncoder, SyncStreamError, iter_sync_body, read_sync_head
+from services.sync_jobs import QueueFull, sync_jobs, wants_async
+from services.circuit_breaker import CircuitOpenError, breakers_snapshot
+from services.resilience import DeadlineExceeded, start_deadline
+from services.response_cache import appointments_cache
+from services.single_flight import credential_key, get_single_flight, single_flight_snapshot
+from services.rate_limit import RateLimitExceeded, rate_limiter, client_ip, client_key
+from services.idempotency import (
+    IDEMPOTENT_ROUTES,
+    IdempotencyConflict,
+    SyncItemDedup,
+    idempotency_keys,
+    request_fingerprint,
+    sync_item_outcomes
+)
+from services.tracing import span, start_trace, finish_trace
+from logger import access_log
+from services.compression import (
+    DecompressRequestMiddleware,
+    BodyDecodeError,
+    decode_body,
+    should_compress,
+    compress,
+    iter_compress,
+    weak_etag
+)
+from services.metrics import registry, phase, start_request, finish_request, set_request_user, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from config import (
+    RESPONSE_PASSTHROUGH,
+    SYNC_BATCH_ENABLED,
+    SYNC_STREAMING_ENABLED,
+    SYNC_MAX_BODY_BYTES,
+    SYNC_MAX_ITEMS,
+    APPOINTMENTS_CACHE_ENABLED,
+    SINGLE_FLIGHT_ENABLED,
+    COMPRESSION_ENABLED,
+    RATE_LIMIT_ENABLED,
+    IDEMPOTENCY_ENABLED,
+    IDEMPOTENCY_MAX_BODY_BYTES,
+    SYNC_ITEM_DEDUP_ENABLED,
+    APPOINTMENTS_BATCH_MAX_OPERATIONS,
+    APPOINTMENTS_HEDGING_ENABLED
+)
 from pydantic import BaseModel, Field
 
 # Default bearer token cache used when no Authorization header is provided.
@@ -36,6 +78,10 @@ info = Info(
 )
 app = OpenAPI(__name__, info=info)
 CORS(app)
+# Offline devices may upload their sync batches compressed (Content-Encoding: gzip).
+app.wsgi_app = DecompressRequestMiddleware(
+    app.wsgi_app, ["/queue/process-sync"], SYNC_MAX_BODY_BYTES, streaming=SYNC_STREAMING_ENABLED
+)
 
 # Definition of tags for documentation
 auth_tag = Tag(
@@ -50,13 +96,10 @@ appointments_tag = Tag(
     name="Micro Appointments API", 
     description="Endpoints for retrieving and manipulating appointments (authentication required)"
 )
-
-def json_converter(o):
-    if isinstance(o, enum.Enum):
-        return o.value
-    if isinstance(o, datetime):
-        return o.isoformat()
-    return str(o)
+gateway_tag = Tag(
+    name="Gateway",
+    description="Operational endpoints of the gateway itself (upstream health, diagnostics)"
+)
 
 class SetBearerTokenSchema(BaseModel):
     new_token: str = Field(..., description="New AccessToken that will be used as the default in the gateway")
@@ -74,8 +117,18 @@ def get_user_id_from_request():
     """
     Extracts and validates the Authorization token from the request and returns the user_id (from the 'sub' field)
     along with the complete header. Raises an exception if anything is wrong.
+    The result is kept for the rest of the request (the rate limiter may have asked first).
+    """
+    auth = g.get("auth")
+    if auth is None:
+        auth = g.auth = get_user_id_from_auth_header(request.headers.get("Authorization"))
+    return auth
+
+def get_user_id_from_auth_header(auth_header):
+    """
+    Validates an Authorization header value (falling back to the default bearer token)
+    and returns the user_id along with the header actually used.
     """
-    auth_header = request.headers.get("Authorization")
     if not auth_header:
         # Use the default token if not provided
         if not DEFAULT_BEARER_TOKEN_CACHE:
@@ -85,14 +138,68 @@ def get_user_id_from_request():
     if len(parts) != 2 or parts[0].lower() != "bearer":
         raise ValueError("Invalid Authorization header format")
     token = parts[1]
-    token_payload = verify_token(token)
+    with phase("token"), span("verify_token"):
+        token_payload = verify_token(token)
     if not token_payload:
         raise ValueError("Invalid or expired token")
     user_id = token_payload.get("sub")
     if not user_id:
         raise ValueError("User ID not found in token")
+    set_request_user(user_id)
     return user_id, auth_header
 
+def inject_user_id(items, user_id):
+    """
+    Inserts the user_id into the "data" object of each sync item.
+    Raises ValueError if an item is not a valid object.
+    """
+    for idx, item in enumerate(items):
+        if isinstance(item, dict):
+            if "data" not in item or not isinstance(item["data"], dict):
+                item["data"] = {}
+            item["data"]["user_id"] = user_id
+        else:
+            raise ValueError(f"Item at index {idx} is not a valid object")
+    return items
+
+def sync_result(response_data, status_code):
+    """
+    Builds the process-sync response body and status from the micro-queue-api result,
+    turning per-item errors into a single "Some items failed to process." error: 400,
+    unless the items failed because an upstream did not answer (5xx is kept).
+    """
+    if any("error" in item for item in response_data.get("data", [])):
+        return {
+            "status": "error",
+            "msg": "Some items failed to process.",
+            "data": response_data.get("data", [])
+        }, status_code if status_code >= 500 else 400
+    return response_data, status_code
+
+def upstream_error(e):
+    """
+    Builds the error response for a failed upstream call: 503 with Retry-After while the
+    upstream circuit is open (the call was not even attempted), 504 when the request
+    deadline ran out, 500 otherwise.
+    """
+    if isinstance(e, CircuitOpenError):
+        return circuit_open(e)
+    if isinstance(e, DeadlineExceeded):
+        return deadline_exceeded(e)
+    return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+
+@app.errorhandler(CircuitOpenError)
+def circuit_open(e):
+    return jsonify({"status": "error", "msg": str(e), "data": {}}), 503, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    return jsonify({"status": "error", "msg": str(e), "data": {}}), 504
+
+@app.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    return jsonify({"status": "error", "msg": str(e), "data": {}}), 429, {"Retry-After": str(e.retry_after)}
+
 @app.get('/')
 def home():
     """Redirects to the OpenAPI documentation."""
@@ -101,9 +208,33 @@ def home():
 @app.get('/hello-world')
 def hello_world():
     """Returns a simple hello world."""
-    print('testessssssss', flush=True)
     return jsonify({"message": "Hello World"})
 
+@app.get('/metrics', tags=[gateway_tag])
+def metrics():
+    """
+    Returns the gateway metrics in the Prometheus text format: request counts and
+    latency per route (split into token, upstream and gateway time), upstream calls,
+    connection pools, caches and circuit breakers. Counters are per worker process.
+    """
+    return Response(registry.render(), status=200, content_type=METRICS_CONTENT_TYPE)
+
+@app.get('/gateway/circuit-breakers', tags=[gateway_tag])
+def circuit_breakers():
+    """
+    Returns the circuit breaker state (closed, open or half_open) of each upstream,
+    with the error and slow-call rates of the current window.
+    """
+    return jsonify({"status": "ok", "data": breakers_snapshot()}), 200
+
+@app.get('/gateway/single-flight', tags=[gateway_tag])
+def single_flight():
+    """
+    Returns, per route, how many upstream calls were made and how many identical
+    concurrent calls were collapsed into them.
+    """
+    return jsonify({"status": "ok", "data": single_flight_snapshot()}), 200
+
 # ---- ******************* ----
 # MICRO AUTH API
 # ---- ******************* ----
@@ -244,40 +375,327 @@ def process_sync(body: ProcessSyncSchema):
     extracting the user ID from the Authorization token and inserting it into the "data" object of each item in the payload.
     If the header is not provided, the updated default token is used.
     """
+    if len(body.items) > SYNC_MAX_ITEMS:
+        return jsonify({"status": "error", "msg": f"Too many items (maximum is {SYNC_MAX_ITEMS})", "data": {}}), 413
     payload = body.dict(exclude_unset=True)
     try:
         user_id, auth_value = get_user_id_from_request()
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
 
-    items = payload.get("items", [])
-    for idx, item in enumerate(items):
-        if isinstance(item, dict):
-            if "data" not in item or not isinstance(item["data"], dict):
-                item["data"] = {}
-            item["data"]["user_id"] = user_id
-        else:
-            return jsonify({"status": "error", "msg": f"Item at index {idx} is not a valid object", "data": {}}), 400
-    payload["items"] = items
+    try:
+        with span("prepare_payload", items=len(payload.get("items", []))):
+            payload["items"] = inject_user_id(payload.get("items", []), user_id)
+    except ValueError as e:
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), 400
+
+    if sync_jobs is not None and wants_async(request.headers.get("Prefer")):
+        return accept_sync_job(user_id, auth_value, payload["items"])
+
+    dedup = None
+    if SYNC_ITEM_DEDUP_ENABLED:
+        # Items already synced by an earlier attempt are answered from their stored result.
+        dedup = SyncItemDedup(sync_item_outcomes, user_id)
+        payload["items"] = [item for item in payload["items"] if dedup.forward(item)]
+        if not payload["items"]:
+            return jsonify(dedup.known_response()[0]), 200
 
     try:
-        payload = json.loads(json.dumps(payload, default=json_converter))
+        with span("serialize"):
+            chunks = plan_chunks(payload["items"]) if SYNC_BATCH_ENABLED else []
+            data = chunks[0].body() if len(chunks) == 1 else encode_json(payload)
     except Exception as e:
         return jsonify({"status": "error", "msg": f"Error serializing payload: {str(e)}", "data": {}}), 500
 
     headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    touches_appointments = any(item.get("domain") == "appointment" for item in payload["items"])
+    if len(chunks) > 1:
+        # Large batch: chunks are sent concurrently and their results merged back in order.
+        try:
+            response_data, status = send_chunks(get_client("queue"), chunks, headers, len(payload["items"]))
+        except Exception as e:
+            return upstream_error(e)
+        finally:
+            if touches_appointments:
+                appointments_cache.invalidate(user_id)
+        if dedup is not None:
+            response_data, status = dedup.merge(response_data, status)
+        data, status = sync_result(response_data, status)
+        return jsonify(data), status
+
     try:
-        response = requests.post(f"{MICRO_QUEUE_API_URL}/process-sync", json=payload, headers=headers)
-        response_data = response.json()
-        if any("error" in item for item in response_data.get("data", [])):
-            return jsonify({
-                "status": "error",
-                "msg": "Some items failed to process.",
-                "data": response_data.get("data", [])
-            }), 400
-        return jsonify(response_data), response.status_code
+        response = get_client("queue").post("/process-sync", data=data, headers=headers)
+        return sync_response(response, dedup)
     except Exception as e:
-        return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+        return upstream_error(e)
+    finally:
+        if touches_appointments:
+            appointments_cache.invalidate(user_id)
+
+def sync_response(response, dedup=None):
+    """
+    Returns the micro-queue-api process-sync response to the client.
+    The body only needs to be parsed when it may carry per-item errors, or when
+    per-item results are merged with the ones of earlier attempts (dedup).
+    """
+    if dedup is None and RESPONSE_PASSTHROUGH and is_json_response(response) and not may_contain_key(response.content, "error"):
+        return content_response(response)
+    data, status = response.json(), response.status_code
+    if dedup is not None:
+        data, status = dedup.merge(data, status)
+    data, status = sync_result(data, status)
+    return jsonify(data), status
+
+def accept_sync_job(user_id, auth_value, items):
+    """
+    Writes the batch to the sync job log and answers 202 with the job id right away
+    (503 with Retry-After while too many jobs are waiting).
+    """
+    sync_jobs.start()
+    try:
+        with span("enqueue_sync_job", items=len(items)):
+            job = sync_jobs.enqueue(user_id, auth_value, items)
+    except QueueFull as e:
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), 503, {"Retry-After": str(e.retry_after)}
+    location = f"/queue/jobs/{job.id}"
+    return jsonify({
+        "status": "accepted",
+        "msg": "Sync batch accepted, poll the job for the results.",
+        "data": {"job_id": job.id, "status_url": location}
+    }), 202, {"Location": location, "Preference-Applied": "respond-async"}
+
+def run_sync_job(user_id, auth_value, items):
+    """
+    Sends a batch accepted as a job (its items already carry the user_id) and returns
+    the (body, status) process_sync would have answered. Runs in the job workers.
+    """
+    dedup = None
+    if SYNC_ITEM_DEDUP_ENABLED:
+        dedup = SyncItemDedup(sync_item_outcomes, user_id)
+        items = [item for item in items if dedup.forward(item)]
+        if not items:
+            return dedup.known_response()
+
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    chunks = plan_chunks(items) if SYNC_BATCH_ENABLED else []
+    try:
+        if len(chunks) > 1:
+            response_data, status = send_chunks(get_client("queue"), chunks, headers, len(items))
+        else:
+            data = chunks[0].body() if chunks else encode_json({"items": items})
+            response = get_client("queue").post("/process-sync", data=data, headers=headers)
+            response_data, status = response.json(), response.status_code
+    finally:
+        if any(item.get("domain") == "appointment" for item in items):
+            appointments_cache.invalidate(user_id)
+    if dedup is not None:
+        response_data, status = dedup.merge(response_data, status)
+    return sync_result(response_data, status)
+
+if sync_jobs is not None:
+    sync_jobs.runner = run_sync_job
+
+@app.get('/queue/jobs/<string:job_id>', tags=[queue_tag])
+def get_sync_job(path: SyncJobPathSchema):
+    """
+    Returns the state of a process-sync job accepted with 202 ("queued", "running" or
+    "done") and, once done, the status and body the synchronous call would have returned
+    (with the per-item results).
+    """
+    try:
+        user_id, _ = get_user_id_from_request()
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
+    job = sync_jobs.lookup(path.job_id, user_id) if sync_jobs is not None else None
+    if job is None:
+        return jsonify({"status": "error", "msg": "Job not found", "data": {}}), 404
+    sync_jobs.start()
+    return jsonify({"status": "ok", "data": job}), 200
+
+@app.before_request
+def start_request_instrumentation():
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    start_request()
+    start_deadline()
+    start_trace(request.headers.get("traceparent"), f"{request.method} {route}", route=route)
+
+@app.before_request
+def rate_limit_request():
+    """
+    Admits the request under its route's token bucket and the client's concurrency cap
+    (429 with Retry-After otherwise). Clients are keyed by the token's sub; the /auth/*
+    routes, and requests whose token does not validate, are keyed by IP.
+    """
+    if not RATE_LIMIT_ENABLED or request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    if rate_limiter.rule_for(route) is None:
+        return None
+    user_id = None
+    if not route.startswith("/auth/"):
+        try:
+            user_id, _ = get_user_id_from_request()
+        except Exception:
+            pass  # The route itself answers 401.
+    ip = client_ip(request.remote_addr, request.headers.get("X-Forwarded-For"))
+    g.rate_limit_lease = rate_limiter.admit(route, client_key(user_id, ip))
+    return None
+
+@app.teardown_request
+def release_rate_limit(exc):
+    lease = g.pop("rate_limit_lease", None)
+    if lease is not None:
+        lease.release()
+
+@app.after_request
+def finish_request_instrumentation(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    timer = finish_request(route, request.method, response.status_code)
+    root = finish_trace(status=response.status_code)
+    if timer is not None:
+        access_log(
+            route, request.method, response.status_code, timer.duration, timer.user_id,
+            timer.upstreams, timer.phases.get("upstream"), root.trace_id if root else None
+        )
+    return response
+
+@app.after_request
+def compress_response(response):
+    """
+    Compresses JSON/text responses with the best coding the client accepts (brotli or
+    gzip). Small and already encoded bodies, such as passed-through upstream bodies
+    that are already compressed, are sent as they are.
+    """
+    if not COMPRESSION_ENABLED or request.method == "HEAD":
+        return response
+    response.vary.add("Accept-Encoding")
+    size = None if response.is_streamed else response.content_length
+    encoding = should_compress(
+        request.headers.get("Accept-Encoding"), response.mimetype,
+        response.headers.get("Content-Encoding"), size, response.status_code
+    )
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = iter_compress(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    if "ETag" in response.headers:
+        response.headers["ETag"] = weak_etag(response.headers["ETag"])
+    return response
+
+@app.before_request
+def idempotency_replay():
+    """
+    Writes sent with an Idempotency-Key are answered with the stored response when the
+    same user retries them with the same key: 409 while the first attempt is still
+    running, 422 if the key was already used for a different request.
+    """
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not IDEMPOTENCY_ENABLED or not idempotency_key or request.url_rule is None:
+        return None
+    route = request.url_rule.rule
+    if (request.method, route) not in IDEMPOTENT_ROUTES:
+        return None
+    if request.content_length and request.content_length > SYNC_MAX_BODY_BYTES:
+        return None
+    try:
+        user_id, _ = get_user_id_from_request()
+    except Exception:
+        return None  # The route itself answers 401.
+    # A streamed process-sync body cannot be read twice; its key covers the route only.
+    streamed = route == "/queue/process-sync" and SYNC_STREAMING_ENABLED
+    body = None if streamed else request.get_data(cache=True)
+    fingerprint = request_fingerprint(request.method, route, request.query_string.decode("latin-1"), body)
+    key = (user_id, request.method, route, idempotency_key)
+    try:
+        stored = idempotency_keys.begin(key, fingerprint)
+    except IdempotencyConflict as e:
+        headers = {"Retry-After": "1"} if e.status == 409 else {}
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), e.status, headers
+    if stored is not None:
+        return Response(stored.body, status=stored.status, content_type=stored.content_type,
+                        headers={"Idempotent-Replayed": "true"})
+    g.idempotency = (key, fingerprint)
+    return None
+
+@app.after_request
+def store_idempotent_response(response):
+    """
+    Stores the response of a write sent with a new Idempotency-Key (runs before the
+    response is compressed, so the identity body is kept).
+    """
+    pending = g.pop("idempotency", None)
+    if pending is None:
+        return response
+    key, fingerprint = pending
+    try:
+        if response.is_streamed:
+            response.make_sequence()
+        body = response.get_data()
+        encoding = response.headers.get("Content-Encoding")
+        if encoding:
+            body = decode_body(body, encoding, IDEMPOTENCY_MAX_BODY_BYTES)
+    except Exception:
+        idempotency_keys.abandon(key)
+        return response
+    idempotency_keys.complete(key, fingerprint, response.status_code, body, response.content_type)
+    return response
+
+@app.teardown_request
+def abandon_idempotency_key(exc):
+    pending = g.pop("idempotency", None)
+    if pending is not None:
+        idempotency_keys.abandon(pending[0])
+
+@app.before_request
+def process_sync_limits():
+    """
+    Rejects oversized process-sync bodies before they are read and, when the streaming
+    mode is enabled, handles the request with process_sync_stream.
+    """
+    if request.path != "/queue/process-sync" or request.method != "POST":
+        return None
+    if request.content_length and request.content_length > SYNC_MAX_BODY_BYTES:
+        return jsonify({"status": "error", "msg": "Request body too large", "data": {}}), 413
+    if SYNC_STREAMING_ENABLED and not (sync_jobs is not None and wants_async(request.headers.get("Prefer"))):
+        # Jobs are written whole to the job log, so they take the buffered path.
+        return process_sync_stream()
+    return None
+
+def process_sync_stream():
+    """
+    Streaming variant of process_sync: the "items" array is parsed incrementally,
+    each item is validated, gets the user_id and is forwarded to the micro-queue-api
+    right away, so the whole batch is never held in memory.
+    The upstream request is only opened once the first item is valid; an invalid item
+    further down aborts it (the client still gets the 422).
+    """
+    try:
+        user_id, auth_value = get_user_id_from_request()
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
+
+    dedup = SyncItemDedup(sync_item_outcomes, user_id) if SYNC_ITEM_DEDUP_ENABLED else None
+    encoder = SyncStreamEncoder(user_id, dedup=dedup)
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    try:
+        head = read_sync_head(request.stream, encoder)
+        response = get_client("queue").post(
+            "/process-sync", data=iter_sync_body(request.stream, encoder, head), headers=headers
+        )
+        return sync_response(response, dedup)
+    except Exception as e:
+        if isinstance(encoder.error, SyncStreamError):
+            return Response(encoder.error.body, status=encoder.error.status, content_type="application/json")
+        if isinstance(encoder.error, BodyDecodeError):
+            return jsonify({"status": "error", "msg": str(encoder.error), "data": {}}), encoder.error.status
+        return upstream_error(e)
+    finally:
+        if "appointment" in encoder.domains:
+            appointments_cache.invalidate(user_id)
 
 # ---- ******************* ----
 # MICRO APPOINTMENTS API
@@ -300,15 +718,44 @@ def get_appointments():
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
 
-    url = f"{MICRO_APPOINTMENTS_URL.rstrip('/')}/appointments?user_id={user_id}"
     headers = {"Authorization": auth_value}
+    if APPOINTMENTS_CACHE_ENABLED:
+        entry = appointments_cache.get(user_id)
+        if entry is not None:
+            return cached_response(entry)
+        generation = appointments_cache.generation(user_id)
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            return jsonify(response.json()), response.status_code
-        return jsonify(response.json()), 200
+        if SINGLE_FLIGHT_ENABLED:
+            # Concurrent calls with the same token share one upstream response, so it is read fully.
+            response = get_single_flight("GET /appointments").do(
+                credential_key(user_id, auth_value),
+                lambda: get_client("appointments").get(
+                    "/appointments", params={"user_id": user_id}, headers=headers, hedge=APPOINTMENTS_HEDGING_ENABLED
+                )
+            )
+        else:
+            response = get_client("appointments").get(
+                "/appointments", params={"user_id": user_id}, headers=headers, stream=not APPOINTMENTS_CACHE_ENABLED,
+                hedge=APPOINTMENTS_HEDGING_ENABLED
+            )
+        if APPOINTMENTS_CACHE_ENABLED and response.status_code == 200 and is_json_response(response):
+            entry = appointments_cache.put(user_id, response.content, response.headers["Content-Type"], generation)
+            return cached_response(entry)
+        if SINGLE_FLIGHT_ENABLED and is_json_response(response):
+            return content_response(response)
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+        return upstream_error(e)
+
+def cached_response(entry):
+    """
+    Returns a cached appointments list, or 304 without a body when the client
+    already has it (If-None-Match matches the ETag).
+    """
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if entry.matches(request.headers.get("If-None-Match")):
+        return Response(status=304, headers=headers)
+    return Response(entry.body, status=200, content_type=entry.content_type, headers=headers)
 
 @app.delete(
     '/appointment',
@@ -329,13 +776,16 @@ def delete_appointment(query: EventBuscaIdSchema):
         return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
 
     appointment_id = query.id
-    url = f"{MICRO_APPOINTMENTS_URL.rstrip('/')}/appointment?id={appointment_id}&user_id={user_id}"
+    params = {"id": appointment_id, "user_id": user_id}
     headers = {"Authorization": auth_value}
     try:
-        response = requests.delete(url, headers=headers)
-        return jsonify(response.json()), response.status_code
+        response = get_client("appointments").delete(
+            "/appointment", params=params, headers=headers, stream=True
+        )
+        appointments_cache.invalidate(user_id)
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+        return upstream_error(e)
 
 @app.post('/appointment', tags=[appointments_tag],
           description="Forwards the create appointment request to the micro‑appointments‑api.")
@@ -351,17 +801,15 @@ def create_appointment(body: EventSchema):
     except Exception as e:
         return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
 
-    payload = body.dict(exclude_unset=True)
-    payload["user_id"] = user_id
+    data = encode_model(body, update={"user_id": user_id})
 
-    payload = json.loads(json.dumps(payload, default=json_converter))
-    
     headers = {"Content-Type": "application/json", "Authorization": auth_value}
     try:
-        response = requests.post(f"{MICRO_APPOINTMENTS_URL.rstrip('/')}/appointment", json=payload, headers=headers)
-        return jsonify(response.json()), response.status_code
+        response = get_client("appointments").post("/appointment", data=data, headers=headers, stream=True)
+        appointments_cache.invalidate(user_id)
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+        return upstream_error(e)
 
 @app.put('/appointment', tags=[appointments_tag],
          description="Forwards the update appointment request to the micro‑appointments‑api.")
@@ -378,17 +826,48 @@ def update_appointment(query: EventBuscaSchema, body: EventSchema):
         return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
 
     query.user_id = user_id
-    payload = body.dict(exclude_unset=True)
+    data = encode_model(body)
 
-    payload = json.loads(json.dumps(payload, default=json_converter))
-    
     headers = {"Content-Type": "application/json", "Authorization": auth_value}
-    url = f"{MICRO_APPOINTMENTS_URL.rstrip('/')}/appointment?id={query.id}&user_id={user_id}"
+    params = {"id": query.id, "user_id": user_id}
     try:
-        response = requests.put(url, json=payload, headers=headers)
-        return jsonify(response.json()), response.status_code
+        response = get_client("appointments").put(
+            "/appointment", params=params, data=data, headers=headers, stream=True
+        )
+        appointments_cache.invalidate(user_id)
+        return proxy_response(response)
     except Exception as e:
-        return jsonify({"status": "error", "msg": str(e), "data": {}}), 500
+        return upstream_error(e)
+
+@app.post('/appointments/batch', tags=[appointments_tag],
+          description="Forwards several create/update/delete appointment operations in one request.")
+def batch_appointments(body: AppointmentBatchSchema):
+    """
+    Applies a batch of appointment operations.
+
+    The token is verified once for the whole batch and each operation is forwarded to
+    the micro‑appointments‑api like the single /appointment routes do (same validation
+    and user_id injection), several at a time over the pooled connections. Operations
+    on the same event ID run in order. Returns 200 when all succeed, or 207 with the
+    status of each operation.
+    """
+    if len(body.operations) > APPOINTMENTS_BATCH_MAX_OPERATIONS:
+        return jsonify({
+            "status": "error",
+            "msg": f"Too many operations (maximum is {APPOINTMENTS_BATCH_MAX_OPERATIONS})",
+            "data": {}
+        }), 413
+    try:
+        user_id, auth_value = get_user_id_from_request()
+    except Exception as e:
+        return jsonify({"status": "error", "msg": str(e), "data": {}}), 401
+
+    groups = plan_operations(body.operations, user_id)
+    response_data, status = send_operations(get_client("appointments"), groups, auth_value)
+    appointments_cache.invalidate(user_id)
+    return Response(encode_json(response_data), status=status, content_type="application/json")
 
 if __name__ == '__main__':
+    if sync_jobs is not None:
+        sync_jobs.start()
     app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,651 @@
+# Async (ASGI) entrypoint of the gateway.
+# Run with: uvicorn asgi:application --host 0.0.0.0 --port 5000
+#
+# The proxy routes below are served natively on the event loop, awaiting the
+# upstream calls on pooled async clients, so a single process can hold many
+# in-flight requests. Every other path (OpenAPI docs, /auth/set-bearer-token,
+# CORS preflights, ...) is delegated to the Flask app, so the documentation and
+# the response contracts stay the same as in the WSGI mode.
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from pydantic import ValidationError
+
+import app as gateway
+from models import GenericSchema
+from schemas.queue import ProcessSyncSchema
+from schemas.event import EventBuscaIdSchema, EventSchema, EventBuscaSchema, AppointmentBatchSchema
+from config import (
+    RESPONSE_PASSTHROUGH,
+    SYNC_BATCH_ENABLED,
+    SYNC_STREAMING_ENABLED,
+    SYNC_MAX_BODY_BYTES,
+    SYNC_MAX_ITEMS,
+    APPOINTMENTS_CACHE_ENABLED,
+    SINGLE_FLIGHT_ENABLED,
+    COMPRESSION_ENABLED,
+    RATE_LIMIT_ENABLED,
+    IDEMPOTENCY_ENABLED,
+    SYNC_ITEM_DEDUP_ENABLED,
+    APPOINTMENTS_BATCH_MAX_OPERATIONS,
+    APPOINTMENTS_HEDGING_ENABLED
+)
+from services.async_http_client import get_async_client, close_async_clients
+from services.circuit_breaker import CircuitOpenError
+from services.resilience import DeadlineExceeded, start_deadline
+from services.passthrough import may_contain_key
+from services.response_cache import appointments_cache
+from services.single_flight import credential_key, get_single_flight
+from services.rate_limit import RateLimitExceeded, rate_limiter, client_ip, client_key
+from services.idempotency import (
+    IDEMPOTENT_ROUTES,
+    IdempotencyConflict,
+    SyncItemDedup,
+    idempotency_keys,
+    request_fingerprint,
+    sync_item_outcomes
+)
+from services.metrics import start_request, finish_request
+from services.tracing import span, start_trace, finish_trace
+from logger import access_log
+from services.compression import BodyDecoder, BodyDecodeError, should_compress, compress, weak_etag
+from services.serialization import encode_json, encode_model
+from services.sync_batching import plan_chunks, send_chunks_async
+from services.appointments_batch import plan_operations, send_operations_async
+from services.sync_stream import SyncStreamEncoder, SyncStreamError, aiter_sync_body, aread_sync_head
+from services.sync_jobs import QueueFull, sync_jobs, wants_async
+from services.token_cache import token_cache
+
+flask_application = WsgiToAsgi(gateway.app)
+logger = logging.getLogger(__name__)
+
+
+async def run_in_thread(func, *args):
+    """
+    Runs func(*args) in the default executor, in a copy of the current context (the
+    request's metrics, trace and deadline), like asyncio.to_thread, which needs
+    Python 3.9 (the Docker image ships 3.8).
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, func, *args))
+
+
+class Request:
+    """
+    Minimal view of an ASGI HTTP request used by the async routes.
+    """
+
+    def __init__(self, scope, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"").decode("latin-1")
+        self.query = dict(parse_qsl(self.query_string))
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.client = (scope.get("client") or (None, None))[0]
+        self.body = body
+
+    def json(self):
+        """
+        Returns the decoded JSON body, or None when it is empty or not valid JSON: like
+        flask-openapi3, the schema then rejects it with the same 422 as any other body.
+        """
+        if not self.body:
+            return None
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class Response:
+    def __init__(self, body: bytes, status: int = 200, content_type: str = "application/json", headers=None):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+def json_response(data, status: int = 200) -> Response:
+    """
+    Serializes like Flask's jsonify (sorted keys, compact, trailing newline).
+    """
+    body = json.dumps(data, sort_keys=True, separators=(",", ":")) + "\n"
+    return Response(body.encode("utf-8"), status)
+
+
+def error_response(msg: str, status: int) -> Response:
+    return json_response({"status": "error", "msg": msg, "data": {}}, status)
+
+
+def upstream_error(e) -> Response:
+    # Same contract as app.upstream_error: 503 + Retry-After while the circuit is open,
+    # 504 when the request deadline ran out.
+    if isinstance(e, CircuitOpenError):
+        response = error_response(str(e), 503)
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    if isinstance(e, DeadlineExceeded):
+        return error_response(str(e), 504)
+    return error_response(str(e), 500)
+
+
+def rate_limited(e: RateLimitExceeded) -> Response:
+    response = error_response(str(e), 429)
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def validation_error_response(e: ValidationError) -> Response:
+    # Same body and status flask-openapi3 returns when request validation fails.
+    return Response(e.json().encode("utf-8"), 422)
+
+
+async def authenticate(request: Request):
+    """
+    Async version of get_user_id_from_request. Cached tokens are checked inline;
+    a cache miss (signature check, possibly a JWKS fetch) runs in a worker thread.
+    """
+    auth_header = request.headers.get("authorization")
+    parts = (auth_header or "").split()
+    if len(parts) == 2 and parts[1] in token_cache:
+        return gateway.get_user_id_from_auth_header(auth_header)
+    return await run_in_thread(gateway.get_user_id_from_auth_header, auth_header)
+
+
+async def admit(request: Request, route: str):
+    """
+    Same admission as app.rate_limit_request: returns the rate limit Lease (None when
+    the route is not limited) or raises RateLimitExceeded.
+    """
+    if not RATE_LIMIT_ENABLED or rate_limiter.rule_for(route) is None:
+        return None
+    user_id = None
+    if not route.startswith("/auth/"):
+        try:
+            user_id, _ = await authenticate(request)
+        except Exception:
+            pass  # The route itself answers 401.
+    ip = client_ip(request.client, request.headers.get("x-forwarded-for"))
+    return rate_limiter.admit(route, client_key(user_id, ip))
+
+
+async def idempotent(request: Request, route: str, run, streamed: bool = False) -> Response:
+    """
+    Runs a route under the Idempotency-Key rules of app.idempotency_replay: a retry
+    with the same key gets the stored response, 409/422 on conflicts.
+    """
+    idempotency_key = request.headers.get("idempotency-key")
+    if not IDEMPOTENCY_ENABLED or not idempotency_key or (request.method, route) not in IDEMPOTENT_ROUTES:
+        return await run()
+    try:
+        user_id, _ = await authenticate(request)
+    except Exception:
+        return await run()  # The route itself answers 401.
+    body = None if streamed else request.body
+    fingerprint = request_fingerprint(request.method, route, request.query_string, body)
+    key = (user_id, request.method, route, idempotency_key)
+    try:
+        stored = idempotency_keys.begin(key, fingerprint)
+    except IdempotencyConflict as e:
+        response = error_response(str(e), e.status)
+        if e.status == 409:
+            response.headers["Retry-After"] = "1"
+        return response
+    if stored is not None:
+        return Response(stored.body, stored.status, stored.content_type, {"Idempotent-Replayed": "true"})
+    try:
+        response = await run()
+    except BaseException:
+        idempotency_keys.abandon(key)
+        raise
+    idempotency_keys.complete(key, fingerprint, response.status, response.body, response.content_type)
+    return response
+
+
+def is_json_response(response) -> bool:
+    return "json" in response.headers.get("content-type", "")
+
+
+def upstream_response(response) -> Response:
+    # Passthrough mode: the upstream bytes are returned without being decoded.
+    if RESPONSE_PASSTHROUGH and is_json_response(response):
+        return Response(response.content, response.status_code, response.headers["content-type"])
+    return json_response(response.json(), response.status_code)
+
+
+# ---- ******************* ----
+# MICRO AUTH API
+# ---- ******************* ----
+def auth_route(upstream_path: str, unwrap_data: bool = False):
+    async def handler(request: Request) -> Response:
+        try:
+            body = GenericSchema.parse_obj(request.json())
+        except ValidationError as e:
+            return validation_error_response(e)
+        payload = body.dict(exclude_unset=True)
+        headers = {"Content-Type": "application/json"}
+        try:
+            response = await get_async_client("auth").post(upstream_path, json=payload, headers=headers)
+            data, status = response.json(), response.status_code
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            return upstream_error(e)
+        except Exception as e:
+            data, status = {"status": "error", "msg": str(e), "data": {}}, 500
+        if unwrap_data and data.get("status") == "ok":
+            return json_response(data.get("data", {}), status)
+        return json_response(data, status)
+    return handler
+
+
+# ---- ******************* ----
+# MICRO QUEUE API
+# ---- ******************* ----
+async def process_sync(request: Request) -> Response:
+    try:
+        body = ProcessSyncSchema.parse_obj(request.json())
+    except ValidationError as e:
+        return validation_error_response(e)
+    if len(body.items) > SYNC_MAX_ITEMS:
+        return error_response(f"Too many items (maximum is {SYNC_MAX_ITEMS})", 413)
+    payload = body.dict(exclude_unset=True)
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    try:
+        with span("prepare_payload", items=len(payload.get("items", []))):
+            payload["items"] = gateway.inject_user_id(payload.get("items", []), user_id)
+    except ValueError as e:
+        return error_response(str(e), 400)
+
+    if sync_jobs is not None and wants_async(request.headers.get("prefer")):
+        return await accept_sync_job(user_id, auth_value, payload["items"])
+
+    dedup = None
+    if SYNC_ITEM_DEDUP_ENABLED:
+        dedup = SyncItemDedup(sync_item_outcomes, user_id)
+        payload["items"] = [item for item in payload["items"] if dedup.forward(item)]
+        if not payload["items"]:
+            return json_response(*dedup.known_response())
+
+    try:
+        with span("serialize"):
+            chunks = plan_chunks(payload["items"]) if SYNC_BATCH_ENABLED else []
+            data = chunks[0].body() if len(chunks) == 1 else encode_json(payload)
+    except Exception as e:
+        return error_response(f"Error serializing payload: {str(e)}", 500)
+
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    touches_appointments = any(item.get("domain") == "appointment" for item in payload["items"])
+    if len(chunks) > 1:
+        try:
+            response_data, status = await send_chunks_async(
+                get_async_client("queue"), chunks, headers, len(payload["items"])
+            )
+        except Exception as e:
+            return upstream_error(e)
+        finally:
+            if touches_appointments:
+                appointments_cache.invalidate(user_id)
+        if dedup is not None:
+            response_data, status = dedup.merge(response_data, status)
+        return json_response(*gateway.sync_result(response_data, status))
+
+    try:
+        response = await get_async_client("queue").post("/process-sync", content=data, headers=headers)
+        return sync_response(response, dedup)
+    except Exception as e:
+        return upstream_error(e)
+    finally:
+        if touches_appointments:
+            appointments_cache.invalidate(user_id)
+
+
+async def accept_sync_job(user_id: str, auth_value: str, items: list) -> Response:
+    # Same contract as app.accept_sync_job; the (fsynced) append runs in a worker thread.
+    sync_jobs.start()
+    try:
+        job = await run_in_thread(sync_jobs.enqueue, user_id, auth_value, items)
+    except QueueFull as e:
+        response = error_response(str(e), 503)
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    location = f"/queue/jobs/{job.id}"
+    response = json_response({
+        "status": "accepted",
+        "msg": "Sync batch accepted, poll the job for the results.",
+        "data": {"job_id": job.id, "status_url": location}
+    }, 202)
+    response.headers.update({"Location": location, "Preference-Applied": "respond-async"})
+    return response
+
+
+def sync_response(response, dedup=None) -> Response:
+    if dedup is None and RESPONSE_PASSTHROUGH and is_json_response(response) and not may_contain_key(response.content, "error"):
+        return upstream_response(response)
+    data, status = response.json(), response.status_code
+    if dedup is not None:
+        data, status = dedup.merge(data, status)
+    return json_response(*gateway.sync_result(data, status))
+
+
+async def process_sync_stream(request: Request, receive) -> Response:
+    """
+    Streaming variant of process_sync: items are validated and forwarded as the body arrives.
+    """
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    dedup = SyncItemDedup(sync_item_outcomes, user_id) if SYNC_ITEM_DEDUP_ENABLED else None
+    encoder = SyncStreamEncoder(user_id, dedup=dedup)
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    try:
+        head, more_body = await aread_sync_head(receive, encoder)
+        response = await get_async_client("queue").post(
+            "/process-sync", content=aiter_sync_body(receive, encoder, head, more_body), headers=headers
+        )
+        return sync_response(response, dedup)
+    except Exception as e:
+        if isinstance(encoder.error, SyncStreamError):
+            return Response(encoder.error.body, encoder.error.status)
+        if isinstance(encoder.error, BodyDecodeError):
+            return error_response(str(encoder.error), encoder.error.status)
+        return upstream_error(e)
+    finally:
+        if "appointment" in encoder.domains:
+            appointments_cache.invalidate(user_id)
+
+
+# ---- ******************* ----
+# MICRO APPOINTMENTS API
+# ---- ******************* ----
+async def get_appointments(request: Request) -> Response:
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    headers = {"Authorization": auth_value}
+    if APPOINTMENTS_CACHE_ENABLED:
+        entry = appointments_cache.get(user_id)
+        if entry is not None:
+            return cached_response(request, entry)
+        generation = appointments_cache.generation(user_id)
+
+    def fetch():
+        return get_async_client("appointments").get(
+            "/appointments", params={"user_id": user_id}, headers=headers, hedge=APPOINTMENTS_HEDGING_ENABLED
+        )
+
+    try:
+        if SINGLE_FLIGHT_ENABLED:
+            response = await get_single_flight("GET /appointments").do_async(credential_key(user_id, auth_value), fetch)
+        else:
+            response = await fetch()
+        if APPOINTMENTS_CACHE_ENABLED and response.status_code == 200 and is_json_response(response):
+            entry = appointments_cache.put(user_id, response.content, response.headers["content-type"], generation)
+            return cached_response(request, entry)
+        return upstream_response(response)
+    except Exception as e:
+        return upstream_error(e)
+
+
+def cached_response(request: Request, entry) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if entry.matches(request.headers.get("if-none-match")):
+        return Response(b"", 304, entry.content_type, headers)
+    return Response(entry.body, 200, entry.content_type, headers)
+
+
+async def delete_appointment(request: Request) -> Response:
+    try:
+        query = EventBuscaIdSchema(**request.query)
+    except ValidationError as e:
+        return validation_error_response(e)
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    params = {"id": query.id, "user_id": user_id}
+    headers = {"Authorization": auth_value}
+    try:
+        response = await get_async_client("appointments").delete("/appointment", params=params, headers=headers)
+        appointments_cache.invalidate(user_id)
+        return upstream_response(response)
+    except Exception as e:
+        return upstream_error(e)
+
+
+async def create_appointment(request: Request) -> Response:
+    try:
+        body = EventSchema.parse_obj(request.json())
+    except ValidationError as e:
+        return validation_error_response(e)
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    data = encode_model(body, update={"user_id": user_id})
+
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    try:
+        response = await get_async_client("appointments").post("/appointment", content=data, headers=headers)
+        appointments_cache.invalidate(user_id)
+        return upstream_response(response)
+    except Exception as e:
+        return upstream_error(e)
+
+
+async def update_appointment(request: Request) -> Response:
+    try:
+        query = EventBuscaSchema(**request.query)
+        body = EventSchema.parse_obj(request.json())
+    except ValidationError as e:
+        return validation_error_response(e)
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    data = encode_model(body)
+
+    headers = {"Content-Type": "application/json", "Authorization": auth_value}
+    params = {"id": query.id, "user_id": user_id}
+    try:
+        response = await get_async_client("appointments").put(
+            "/appointment", params=params, content=data, headers=headers
+        )
+        appointments_cache.invalidate(user_id)
+        return upstream_response(response)
+    except Exception as e:
+        return upstream_error(e)
+
+
+async def batch_appointments(request: Request) -> Response:
+    try:
+        body = AppointmentBatchSchema.parse_obj(request.json())
+    except ValidationError as e:
+        return validation_error_response(e)
+    if len(body.operations) > APPOINTMENTS_BATCH_MAX_OPERATIONS:
+        return error_response(f"Too many operations (maximum is {APPOINTMENTS_BATCH_MAX_OPERATIONS})", 413)
+    try:
+        user_id, auth_value = await authenticate(request)
+    except Exception as e:
+        return error_response(str(e), 401)
+
+    groups = plan_operations(body.operations, user_id)
+    response_data, status = await send_operations_async(get_async_client("appointments"), groups, auth_value)
+    appointments_cache.invalidate(user_id)
+    return json_response(response_data, status)
+
+
+ROUTES = {
+    ("POST", "/auth/login"): auth_route("/login"),
+    ("POST", "/auth/reset-password"): auth_route("/reset-password"),
+    ("POST", "/auth/sign-up"): auth_route("/sign-up"),
+    ("POST", "/auth/confirm-sign-up"): auth_route("/confirm-sign-up"),
+    ("POST", "/auth/refresh-token"): auth_route("/refresh-token", unwrap_data=True),
+    ("POST", "/queue/process-sync"): process_sync,
+    ("GET", "/appointments"): get_appointments,
+    ("DELETE", "/appointment"): delete_appointment,
+    ("POST", "/appointment"): create_appointment,
+    ("PUT", "/appointment"): update_appointment,
+    ("POST", "/appointments/batch"): batch_appointments,
+}
+
+
+async def read_body(receive) -> bytes:
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+def cors_headers(request: Request) -> list:
+    # Mirrors the headers flask-cors adds with its default (allow all origins) setup.
+    origin = request.headers.get("origin")
+    if origin:
+        return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return [(b"access-control-allow-origin", b"*")]
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if sync_jobs is not None:
+                sync_jobs.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    handler = None
+    if scope["type"] == "http":
+        handler = ROUTES.get((scope["method"], scope["path"].rstrip("/") or "/"))
+    if handler is None:
+        return await flask_application(scope, receive, send)
+
+    start_request()
+    start_deadline()
+    traceparent = dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1")
+    path = scope["path"].rstrip("/") or "/"
+    start_trace(traceparent, f"{scope['method']} {path}", route=path)
+    request = Request(scope, b"")
+    try:
+        lease = await admit(request, path)
+    except RateLimitExceeded as e:
+        return await send_response(request, rate_limited(e), send)
+    try:
+        await handle(handler, request, scope, receive, send)
+    finally:
+        if lease is not None:
+            lease.release()
+
+
+async def handle(handler, request: Request, scope, receive, send):
+    """
+    Reads the request body (decoding process-sync uploads), runs the route and sends its response.
+    """
+    route = request.path.rstrip("/") or "/"
+    if handler is process_sync:
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > SYNC_MAX_BODY_BYTES:
+            return await send_response(request, error_response("Request body too large", 413), send)
+        encoding = request.headers.get("content-encoding", "identity").strip().lower()
+        try:
+            decoder = BodyDecoder(encoding, SYNC_MAX_BODY_BYTES) if encoding != "identity" else None
+        except BodyDecodeError as e:
+            return await send_response(request, error_response(str(e), e.status), send)
+        if SYNC_STREAMING_ENABLED and not (sync_jobs is not None and wants_async(request.headers.get("prefer"))):
+            if decoder is not None:
+                receive = decoding_receive(receive, decoder)
+            response = await run_route(request, route, lambda: process_sync_stream(request, receive), streamed=True)
+            return await send_response(request, response, send)
+        if decoder is not None:
+            try:
+                request.body = decoder.feed(await read_body(receive)) + decoder.finish()
+            except BodyDecodeError as e:
+                return await send_response(request, error_response(str(e), e.status), send)
+        else:
+            request.body = await read_body(receive)
+    else:
+        request.body = await read_body(receive)
+
+    response = await run_route(request, route, lambda: handler(request))
+    await send_response(request, response, send)
+
+
+async def run_route(request: Request, route: str, run, streamed: bool = False) -> Response:
+    """
+    Runs the route (under the Idempotency-Key rules) and turns what it raised into a
+    response, so every request is still finished and logged by send_response.
+    """
+    try:
+        return await idempotent(request, route, run, streamed)
+    except Exception as e:
+        logger.exception("Unhandled error in %s %s", request.method, route)
+        return upstream_error(e)
+
+
+def decoding_receive(receive, decoder: BodyDecoder):
+    """
+    Wraps an ASGI receive channel so the request body chunks come out decoded.
+    """
+    async def wrapped():
+        message = await receive()
+        if message["type"] == "http.request":
+            body = decoder.feed(message.get("body", b""))
+            if not message.get("more_body", False):
+                body += decoder.finish()
+            message = dict(message, body=body)
+        return message
+    return wrapped
+
+
+async def send_response(request: Request, response: Response, send):
+    route = request.path.rstrip("/") or "/"
+    timer = finish_request(route, request.method, response.status)
+    root = finish_trace(status=response.status)
+    if timer is not None:
+        access_log(
+            route, request.method, response.status, timer.duration, timer.user_id,
+            timer.upstreams, timer.phases.get("upstream"), root.trace_id if root else None
+        )
+    if COMPRESSION_ENABLED and request.method != "HEAD":
+        response.headers["Vary"] = "Accept-Encoding"
+        encoding = should_compress(
+            request.headers.get("accept-encoding"), response.content_type,
+            response.headers.get("Content-Encoding"), len(response.body), response.status
+        )
+        if encoding is not None:
+            response.body = compress(response.body, encoding)
+            response.headers["Content-Encoding"] = encoding
+            if "ETag" in response.headers:
+                response.headers["ETag"] = weak_etag(response.headers["ETag"])
+    headers = [
+        (b"content-type", response.content_type.encode("latin-1")),
+        (b"content-length", str(len(response.body)).encode("latin-1")),
+    ] + cors_headers(request)
+    headers += [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": response.body})
@@ -0,0 +1,107 @@
+# Token verification micro-benchmark: verifications per second on one core.
+#
+# Compares the python-jose path (decode_token_jose, which rebuilds the public key
+# from the JWK on every call) with JWTVerifier on each installed crypto backend.
+# The token cache is bypassed, so every call checks the signature. Before timing,
+# every verifier must agree with python-jose on a set of valid and invalid tokens
+# signed with a locally generated key.
+#
+#   python -m benchmarks.bench_jwt --seconds 3
+import argparse
+import base64
+import json
+import sys
+import time
+
+from benchmarks.fixtures import LocalIssuer
+from benchmarks.run import configure_environment
+
+
+def rate(func, token: str, seconds: float) -> dict:
+    for _ in range(50):
+        func(token)
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func(token)
+        calls += 100
+    elapsed = time.perf_counter() - start
+    return {"verifications_per_sec": round(calls / elapsed, 1), "us_per_verification": round(elapsed / calls * 1e6, 2)}
+
+
+def _segment(obj) -> str:
+    return base64.urlsafe_b64encode(json.dumps(obj).encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def edge_case_tokens(issuer: LocalIssuer, other: LocalIssuer) -> dict:
+    valid = issuer.sign(sub="bench-user")
+    header, payload, signature = valid.split(".")
+    return {
+        "valid": valid,
+        "with_audience": issuer.sign(aud=issuer.client_id),
+        "audience_list": issuer.sign(aud=["other", issuer.client_id]),
+        "expired": issuer.sign(expires_in=-10),
+        "not_yet_valid": issuer.sign(nbf=int(time.time()) + 600),
+        "wrong_issuer": issuer.sign(iss="https://example.com/other"),
+        "wrong_audience": issuer.sign(aud="someone-else"),
+        "non_integer_exp": issuer.sign(exp="soon"),
+        "unknown_kid": other.sign(),
+        "foreign_signature": ".".join(other.sign().split(".")[:2] + [signature]),
+        "tampered_payload": ".".join([header, _segment({"sub": "admin", "iss": issuer.issuer}), signature]),
+        "alg_none": ".".join([_segment({"alg": "none", "kid": issuer.kid}), payload, ""]),
+        "alg_hs256": ".".join([_segment({"alg": "HS256", "kid": issuer.kid}), payload, signature]),
+        "truncated": valid[:-10],
+        "garbage": "not-a-token",
+        "empty": "",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JWT verification throughput (one core).")
+    parser.add_argument("--seconds", type=float, default=2.0, help="time per measurement")
+    args = parser.parse_args(argv)
+
+    configure_environment("http://127.0.0.1:9")
+    from config import COGNITO_ISSUER, COGNITO_APP_CLIENT_ID, COGNITO_JWKS_URL
+    from services.jwks_cache import get_jwks_cache
+    from services.jwt_verifier import BACKENDS, JWTVerifier, load_backend
+
+    issuer = LocalIssuer(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID)
+    other = LocalIssuer(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID, kid="other-key")
+    # The first fetcher registered for the URL is the one the gateway's JWKS cache uses.
+    store = get_jwks_cache(COGNITO_JWKS_URL, lambda: issuer.jwks)
+    from services import token_service
+
+    candidates = {"jose": token_service.decode_token_jose}
+    for name in BACKENDS:
+        backend = load_backend(name)
+        if backend is not None:
+            verifier = JWTVerifier(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID, backend)
+            store.subscribe(verifier.load_keys)
+            candidates[name] = lambda token, verifier=verifier: verifier.verify(token, store.get_key)
+
+    mismatches = []
+    for case, token in edge_case_tokens(issuer, other).items():
+        expected = token_service.decode_token_jose(token)
+        for name, func in candidates.items():
+            if func(token) != expected:
+                mismatches.append({"case": case, "verifier": name, "jose_accepts": expected is not None})
+
+    token = issuer.sign(sub="bench-user")
+    default = token_service.get_verifier()
+    report = {
+        "default_backend": default.backend.name if default is not None else "jose",
+        "results": {name: rate(func, token, args.seconds) for name, func in candidates.items()},
+        "mismatches": mismatches,
+    }
+    baseline = report["results"]["jose"]["verifications_per_sec"]
+    for result in report["results"].values():
+        result["speedup_vs_jose"] = round(result["verifications_per_sec"] / baseline, 2)
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
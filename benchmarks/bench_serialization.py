@@ -0,0 +1,88 @@
+# Payload serialization benchmark.
+# Compares the previous preparation path (json.loads(json.dumps(...)) followed by
+# requests serializing `json=payload` again) with the single-pass encode_json.
+# Run with: python -m benchmarks.bench_serialization [--items 1000] [--repeat 50]
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from schemas.event import EventSchema, EventType
+from schemas.queue import ProcessSyncSchema
+from services import serialization
+from services.serialization import json_converter, encode_json
+
+
+def build_sync_batch(count: int) -> ProcessSyncSchema:
+    items = [
+        {
+            "id": str(i),
+            "domain": "appointment",
+            "action": "update",
+            "data": {
+                "name": f"Consulta {i}",
+                "description": "A consulta será por ordem de chegada",
+                "date": datetime(2025, 1, 1, 10, 30),
+                "type": EventType.EXAM,
+                "location_id": i,
+            },
+        }
+        for i in range(count)
+    ]
+    return ProcessSyncSchema(items=items)
+
+
+def legacy_body(payload: dict) -> bytes:
+    payload = json.loads(json.dumps(payload, default=json_converter))
+    # What requests does with json=payload.
+    return json.dumps(payload, allow_nan=False).encode("utf-8")
+
+
+def single_pass_body(payload: dict) -> bytes:
+    return encode_json(payload)
+
+
+def measure(func, payload, repeat: int) -> dict:
+    func(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(payload)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    func(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"latency_ms": round(elapsed * 1000, 4), "peak_alloc_bytes": peak}
+
+
+def run(items: int, repeat: int) -> dict:
+    sync_payload = build_sync_batch(items).dict(exclude_unset=True)
+    event_payload = EventSchema(date=datetime(2025, 1, 1, 10, 30)).dict()
+    backend = "orjson" if serialization.orjson is not None else "json"
+    results = {"backend": backend, "items": items, "repeat": repeat, "cases": {}}
+    for name, payload in (("process_sync", sync_payload), ("appointment", event_payload)):
+        legacy = measure(legacy_body, payload, repeat)
+        single = measure(single_pass_body, payload, repeat)
+        results["cases"][name] = {
+            "legacy": legacy,
+            "single_pass": single,
+            "speedup": round(legacy["latency_ms"] / single["latency_ms"], 2) if single["latency_ms"] else None,
+            "alloc_ratio": round(legacy["peak_alloc_bytes"] / single["peak_alloc_bytes"], 2) if single["peak_alloc_bytes"] else None,
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1000, help="items in the process-sync batch")
+    parser.add_argument("--repeat", type=int, default=50, help="iterations per measurement")
+    args = parser.parse_args(argv)
+    json.dump(run(args.items, args.repeat), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
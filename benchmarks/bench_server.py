@@ -0,0 +1,128 @@
+# Throughput of the gateway behind a real server process, under concurrent load.
+#
+# Starts the stub upstreams, launches the gateway with the Flask dev server
+# (what `python3 app.py` runs), with gunicorn (gunicorn.conf.py) and with uvicorn
+# (asgi.py), and drives GET /appointments from several client threads.
+#
+#   python -m benchmarks.bench_server --duration 10 --concurrency 16
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from benchmarks.fixtures import LocalIssuer
+from benchmarks.run import configure_environment, percentile
+from benchmarks.stubs import start_stub_server
+
+SERVERS = {
+    "flask-dev": ["{python}", "-m", "flask", "--app", "app", "run", "--port", "{port}"],
+    "gunicorn": ["{python}", "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+    "uvicorn": ["{python}", "-m", "uvicorn", "asgi:application", "--port", "{port}", "--log-level", "warning"],
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(name: str, port: int, workers: int) -> subprocess.Popen:
+    command = [part.format(python=sys.executable, port=port) for part in SERVERS[name]]
+    env = dict(os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(workers),
+               GUNICORN_ACCESSLOG="")
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/gateway/circuit-breakers", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{name} did not start")
+
+
+def load(url: str, headers: dict, duration: float, concurrency: int) -> dict:
+    """
+    Sends requests from `concurrency` keep-alive clients for `duration` seconds.
+    """
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < stop_at:
+            t0 = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers, timeout=10).status_code == 200
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - t0)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gateway throughput per server (offline).")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per server")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() * 2 + 1, help="gunicorn workers")
+    parser.add_argument("--servers", nargs="*", default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args(argv)
+
+    jwks = {"keys": []}
+    stubs = start_stub_server(jwks)
+    configure_environment(f"http://127.0.0.1:{stubs.server_address[1]}")
+    from config import COGNITO_ISSUER, COGNITO_APP_CLIENT_ID
+
+    issuer = LocalIssuer(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID)
+    jwks.update(issuer.jwks)
+    headers = {"Authorization": f"Bearer {issuer.sign(sub='bench-user')}"}
+
+    report = {"cpu_count": os.cpu_count(), "concurrency": args.concurrency, "results": {}}
+    try:
+        for name in args.servers:
+            port = free_port()
+            process = start_server(name, port, args.workers)
+            try:
+                url = f"http://127.0.0.1:{port}/appointments"
+                load(url, headers, 1, args.concurrency)
+                report["results"][name] = load(url, headers, args.duration, args.concurrency)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        stubs.shutdown()
+
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
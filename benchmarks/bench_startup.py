@@ -0,0 +1,82 @@
+# Startup budget of the gateway: import time and memory of a fresh process.
+#
+# Imports the app in a child process with `python -X importtime` and reports the
+# total import time, the slowest modules and the resident memory (RSS) after the
+# import, which is what each gunicorn worker starts from. Fails (exit code 1) when
+# the import time is over the budget or a module that must stay lazy was loaded.
+#
+#   python -m benchmarks.bench_startup --budget-ms 1500
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.run import configure_environment
+
+# Debug and Cognito-admin dependencies, only loaded when actually used.
+LAZY_MODULES = ("pudb", "urwid", "boto3", "botocore", "sqlalchemy", "flask_sqlalchemy")
+
+CHILD = """
+import json, resource, sys
+import {module}
+print(json.dumps({{
+    "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": sorted(sys.modules),
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Returns {module: cumulative microseconds} from the -X importtime output.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        times[name.strip()] = int(cumulative_us)
+    return times
+
+
+def measure_import(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(module=module)],
+        capture_output=True, text=True, check=True, env=dict(os.environ)
+    )
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    times = parse_importtime(result.stderr)
+    return {
+        "import_ms": round(times.get(module, 0) / 1000, 1),
+        "rss_mb": round(child["rss_kb"] / 1024, 1),
+        "slowest": sorted(times.items(), key=lambda item: item[1], reverse=True)[:10],
+        "lazy_loaded": sorted({name.split(".")[0] for name in child["modules"]} & set(LAZY_MODULES)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gateway startup time and memory budget.")
+    parser.add_argument("--module", default="app", help="module to import (app or asgi)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to measure")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="maximum median import time")
+    args = parser.parse_args(argv)
+
+    configure_environment("http://127.0.0.1:9")
+    runs = [measure_import(args.module) for _ in range(args.runs)]
+    report = {
+        "module": args.module,
+        "import_ms_median": statistics.median(run["import_ms"] for run in runs),
+        "rss_mb_median": statistics.median(run["rss_mb"] for run in runs),
+        "budget_ms": args.budget_ms,
+        "slowest_modules_ms": {name: round(us / 1000, 1) for name, us in runs[-1]["slowest"]},
+        "lazy_modules_loaded": runs[-1]["lazy_loaded"],
+    }
+    report["ok"] = report["import_ms_median"] <= args.budget_ms and not report["lazy_modules_loaded"]
+    sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
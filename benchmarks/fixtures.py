@@ -0,0 +1,42 @@
+# Local stand-ins for Cognito: an RSA key pair, its JWKS document and signed tokens.
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+KEY_ID = "bench-key"
+
+
+class LocalIssuer:
+    """
+    Generates an RSA key once and signs Cognito-like access tokens with it.
+    """
+
+    def __init__(self, issuer: str, client_id: str, kid: str = KEY_ID, key_size: int = 2048):
+        self.issuer = issuer
+        self.client_id = client_id
+        self.kid = kid
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        public_jwk = jwk.construct(self.private_pem, "RS256").public_key().to_dict()
+        public_jwk.update({"kid": kid, "use": "sig", "alg": "RS256"})
+        self.jwks = {"keys": [public_jwk]}
+
+    def sign(self, sub: str = None, expires_in: int = 3600, **claims) -> str:
+        now = int(time.time())
+        payload = {
+            "sub": sub or str(uuid.uuid4()),
+            "iss": self.issuer,
+            "client_id": self.client_id,
+            "token_use": "access",
+            "iat": now,
+            "exp": now + expires_in,
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self.private_pem, algorithm="RS256", headers={"kid": self.kid})
@@ -0,0 +1,209 @@
+# Gateway benchmark suite.
+#
+# Runs fully offline: the upstreams are local stubs and Cognito is replaced by a
+# locally generated RSA key, whose JWKS is served by the stubs. Every scenario goes
+# through the real Flask app (test client) and reports requests/sec, p50/p99 latency
+# and the peak memory allocated per request, as JSON.
+#
+#   python -m benchmarks.run --output bench.json
+#   python -m benchmarks.run --compare bench-before.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import LocalIssuer
+from benchmarks.stubs import start_stub_server
+
+SYNC_BATCH_SIZES = (1, 10, 100, 1000)
+
+
+def configure_environment(base_url: str):
+    """
+    Points the gateway at the stub upstreams. Must run before the app is imported.
+    """
+    os.environ.update({
+        "MICRO_AUTH_API_URL": base_url,
+        "MICRO_QUEUE_API_URL": base_url,
+        "MICRO_APPOINTMENTS_URL": base_url,
+        "COGNITO_JWKS_URL": f"{base_url}/.well-known/jwks.json",
+        "AWS_REGION": "local-1",
+        "COGNITO_USER_POOL_ID": "local_bench",
+        "COGNITO_APP_CLIENT_ID": "bench-client",
+        "DEFAULT_BEARER_TOKEN": "",
+        # The benchmarks replay the same user far above any production rate limit.
+        "RATE_LIMIT_ENABLED": "false",
+    })
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(func, iterations: int, warmup: int = 5, alloc_samples: int = 5) -> dict:
+    """
+    Calls func() repeatedly and returns its throughput, latency percentiles (ms)
+    and the average peak allocation of a single call (bytes).
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    # Tracing restarts for every sample, so the peak counts only func's allocations
+    # (tracemalloc.reset_peak needs Python 3.9; the image runs 3.8).
+    peaks = []
+    for _ in range(alloc_samples):
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peaks.append(peak)
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "rps": round(iterations / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "alloc_peak_bytes": int(statistics.fmean(peaks)),
+    }
+
+
+def expect_status(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f"Unexpected status {response.status_code}: {response.data[:200]!r}")
+    return response
+
+
+def sync_batch(size: int) -> dict:
+    return {"items": [
+        {"id": str(i), "domain": "appointment", "action": "update",
+         "data": {"name": f"Consulta {i}", "date": "2025-01-01T10:00:00", "type": 1}}
+        for i in range(size)
+    ]}
+
+
+def run_scenarios(iterations: int, only=None) -> dict:
+    import app as gateway
+    from config import COGNITO_ISSUER, COGNITO_APP_CLIENT_ID
+    from services.token_cache import token_cache
+
+    issuer = LocalIssuer(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID)
+    JWKS.update(issuer.jwks)
+    token = issuer.sign(sub="bench-user")
+    headers = {"Authorization": f"Bearer {token}"}
+    client = gateway.app.test_client()
+
+    def auth_warm():
+        with gateway.app.test_request_context(headers=headers):
+            gateway.get_user_id_from_request()
+
+    def auth_cold():
+        token_cache.clear()
+        auth_warm()
+
+    event = {"name": "Consulta", "date": "2025-01-01T10:00:00", "type": 1}
+    scenarios = {
+        "get_user_id_from_request.cached": auth_warm,
+        "get_user_id_from_request.uncached": auth_cold,
+        "appointments.get": lambda: expect_status(client.get("/appointments", headers=headers)),
+        "appointment.create": lambda: expect_status(client.post("/appointment", json=event, headers=headers)),
+        "appointment.update": lambda: expect_status(
+            client.put("/appointment?id=1&user_id=x", json=event, headers=headers)
+        ),
+        "appointment.delete": lambda: expect_status(client.delete("/appointment?id=1", headers=headers)),
+    }
+    for size in SYNC_BATCH_SIZES:
+        body = sync_batch(size)
+        scenarios[f"process_sync.{size}"] = (
+            lambda body=body: expect_status(client.post("/queue/process-sync", json=body, headers=headers))
+        )
+
+    results = {}
+    for name, func in scenarios.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        # Big batches are much slower per call; keep the total run time bounded.
+        runs = iterations if not name.startswith("process_sync.") else max(5, iterations // max(1, int(name.split(".")[1]) // 10))
+        results[name] = measure(func, runs)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """
+    Ratio current/baseline for each scenario (rps > 1 is better, latency < 1 is better).
+    """
+    diff = {}
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        diff[name] = {
+            key: round(result[key] / before[key], 3)
+            for key in ("rps", "p50_ms", "p99_ms", "alloc_peak_bytes")
+            if before.get(key)
+        }
+    return diff
+
+
+JWKS = {"keys": []}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gateway hot-path benchmarks (offline).")
+    parser.add_argument("--iterations", type=int, default=300, help="calls per scenario")
+    parser.add_argument("--only", nargs="*", help="run only scenarios starting with these prefixes")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    server = start_stub_server(JWKS)
+    configure_environment(f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+            "results": run_scenarios(args.iterations, args.only),
+        }
+    finally:
+        server.shutdown()
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["compare"] = {"baseline": args.compare, "ratios": compare(report, json.load(f))}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
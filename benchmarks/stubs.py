@@ -0,0 +1,83 @@
+# In-process stub upstreams (micro-auth, micro-queue, micro-appointments and the
+# Cognito JWKS endpoint), so the benchmarks run without any network access.
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this every response waits on a delayed ACK.
+    disable_nagle_algorithm = True
+    jwks = {"keys": []}
+    appointments_per_user = 50
+
+    def log_message(self, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, method):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self.read_body()
+        if url.path == "/.well-known/jwks.json":
+            return self.send_json(self.jwks)
+        if url.path == "/process-sync":
+            items = json.loads(body)["items"]
+            return self.send_json({"status": "ok", "data": [{"id": item["id"], "status": "ok"} for item in items]})
+        if url.path == "/appointments":
+            user_id = query.get("user_id")
+            return self.send_json({"status": "ok", "data": [
+                {"id": str(i), "name": f"Consulta {i}", "user_id": user_id, "date": "2025-01-01T10:00:00"}
+                for i in range(self.appointments_per_user)
+            ]})
+        if url.path == "/appointment":
+            data = json.loads(body) if body else {}
+            return self.send_json({"status": "ok", "msg": f"{method} ok", "data": data or query})
+        return self.send_json({"status": "ok", "data": {"path": url.path}})
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def do_PUT(self):
+        self.route("PUT")
+
+    def do_DELETE(self):
+        self.route("DELETE")
+
+
+def start_stub_server(jwks: dict, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """
+    Starts the stub upstreams in a background thread and returns the server
+    (its base URL is http://host:server.server_address[1]).
+    """
+    handler = type("BenchStubHandler", (StubHandler,), {"jwks": jwks})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-stubs", daemon=True).start()
+    return server
@@ -22,3 +22,157 @@ COGNITO_ISSUER = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_
 
 # Outras configurações
 DEFAULT_BEARER_TOKEN = os.environ.get("DEFAULT_BEARER_TOKEN")
+
+# Cache das chaves públicas do Cognito (JWKS), em segundos
+COGNITO_JWKS_URL = os.environ.get("COGNITO_JWKS_URL", f"{COGNITO_ISSUER}/.well-known/jwks.json")
+JWKS_CACHE_TTL = float(os.environ.get("JWKS_CACHE_TTL", "3600"))
+JWKS_REFRESH_INTERVAL = float(os.environ.get("JWKS_REFRESH_INTERVAL", "900"))
+JWKS_MISS_REFETCH_INTERVAL = float(os.environ.get("JWKS_MISS_REFETCH_INTERVAL", "30"))
+JWKS_NEGATIVE_TTL = float(os.environ.get("JWKS_NEGATIVE_TTL", "300"))
+
+# Cache de tokens já verificados (claims), limitado pelo "exp" de cada token
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", "600"))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.environ.get("TOKEN_CACHE_NEGATIVE_TTL", "5"))
+
+# Pool de conexões HTTP (keep-alive) para os microsserviços
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "20"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_IDLE_TIMEOUT = float(os.environ.get("HTTP_POOL_IDLE_TIMEOUT", "60"))
+
+# Resiliência das chamadas aos microsserviços: timeout de leitura adaptativo por rota (p99
+# observado x multiplicador, entre o mínimo e HTTP_READ_TIMEOUT), novas tentativas com backoff
+# exponencial e jitter só para chamadas idempotentes (GET/DELETE), requisição "hedged" no
+# GET /appointments (segunda cópia após o p95) e prazo total por requisição (0 desativa)
+HTTP_ADAPTIVE_TIMEOUT_ENABLED = os.environ.get("HTTP_ADAPTIVE_TIMEOUT_ENABLED", "true").lower() in ("1", "true", "yes")
+HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.environ.get("HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+HTTP_ADAPTIVE_TIMEOUT_MIN = float(os.environ.get("HTTP_ADAPTIVE_TIMEOUT_MIN", "2"))
+HTTP_LATENCY_WINDOW = int(os.environ.get("HTTP_LATENCY_WINDOW", "500"))
+HTTP_LATENCY_MIN_SAMPLES = int(os.environ.get("HTTP_LATENCY_MIN_SAMPLES", "50"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF_BASE = float(os.environ.get("HTTP_RETRY_BACKOFF_BASE", "0.1"))
+HTTP_RETRY_BACKOFF_MAX = float(os.environ.get("HTTP_RETRY_BACKOFF_MAX", "2"))
+HTTP_HEDGE_QUANTILE = float(os.environ.get("HTTP_HEDGE_QUANTILE", "0.95"))
+# Threads por processo para as cópias "hedged"; com todas ocupadas a chamada segue sem hedge
+HTTP_HEDGE_POOL_SIZE = int(os.environ.get("HTTP_HEDGE_POOL_SIZE", "64"))
+APPOINTMENTS_HEDGING_ENABLED = os.environ.get("APPOINTMENTS_HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "30"))
+
+# Repasse direto (sem decodificar) das respostas dos microsserviços
+RESPONSE_PASSTHROUGH = os.environ.get("RESPONSE_PASSTHROUGH", "true").lower() in ("1", "true", "yes")
+PASSTHROUGH_CHUNK_SIZE = int(os.environ.get("PASSTHROUGH_CHUNK_SIZE", "65536"))
+
+# Envio do process-sync em lotes paralelos
+SYNC_BATCH_ENABLED = os.environ.get("SYNC_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+SYNC_BATCH_MAX_ITEMS = int(os.environ.get("SYNC_BATCH_MAX_ITEMS", "200"))
+SYNC_BATCH_MAX_BYTES = int(os.environ.get("SYNC_BATCH_MAX_BYTES", "1048576"))
+SYNC_BATCH_PARALLELISM = int(os.environ.get("SYNC_BATCH_PARALLELISM", "4"))
+
+# Limites e leitura incremental (streaming) do corpo do process-sync. No streaming a requisição ao
+# micro-queue-api só é aberta depois do primeiro item válido; um item inválido mais adiante a interrompe
+SYNC_STREAMING_ENABLED = os.environ.get("SYNC_STREAMING_ENABLED", "false").lower() in ("1", "true", "yes")
+SYNC_MAX_BODY_BYTES = int(os.environ.get("SYNC_MAX_BODY_BYTES", "10485760"))
+SYNC_MAX_ITEMS = int(os.environ.get("SYNC_MAX_ITEMS", "10000"))
+SYNC_STREAM_CHUNK_SIZE = int(os.environ.get("SYNC_STREAM_CHUNK_SIZE", "65536"))
+
+# Circuit breaker por microsserviço
+CIRCUIT_BREAKER_ENABLED = os.environ.get("CIRCUIT_BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+CIRCUIT_BREAKER_WINDOW = float(os.environ.get("CIRCUIT_BREAKER_WINDOW", "30"))
+CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get("CIRCUIT_BREAKER_MIN_CALLS", "20"))
+CIRCUIT_BREAKER_ERROR_RATE = float(os.environ.get("CIRCUIT_BREAKER_ERROR_RATE", "0.5"))
+CIRCUIT_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_SLOW_CALL_SECONDS", "5"))
+CIRCUIT_BREAKER_SLOW_CALL_RATE = float(os.environ.get("CIRCUIT_BREAKER_SLOW_CALL_RATE", "0.8"))
+CIRCUIT_BREAKER_OPEN_SECONDS = float(os.environ.get("CIRCUIT_BREAKER_OPEN_SECONDS", "30"))
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = int(os.environ.get("CIRCUIT_BREAKER_HALF_OPEN_PROBES", "3"))
+
+# Cache por usuário do GET /appointments (invalidado nas escritas do mesmo processo). Com vários workers
+# do gunicorn cada um tem o seu cache: após uma escrita, os outros podem servir a lista antiga até o TTL
+APPOINTMENTS_CACHE_ENABLED = os.environ.get("APPOINTMENTS_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+APPOINTMENTS_CACHE_TTL = float(os.environ.get("APPOINTMENTS_CACHE_TTL", "30"))
+APPOINTMENTS_CACHE_MAX_ENTRIES = int(os.environ.get("APPOINTMENTS_CACHE_MAX_ENTRIES", "5000"))
+APPOINTMENTS_CACHE_MAX_BYTES = int(os.environ.get("APPOINTMENTS_CACHE_MAX_BYTES", "67108864"))
+
+# Deduplicação (single-flight) de leituras idênticas e simultâneas aos microsserviços. Desligada por
+# padrão: a resposta compartilhada é lida inteira (sem streaming) e só é dividida entre chamadas com o mesmo token
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Tracing (W3C traceparent): fração de requisições amostradas e destino dos spans
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none")  # none, memory ou file
+TRACE_FILE = os.environ.get("TRACE_FILE", "log/traces.jsonl")
+TRACE_MEMORY_MAX_SPANS = int(os.environ.get("TRACE_MEMORY_MAX_SPANS", "10000"))
+
+# Logs: fila em memória com escrita em thread separada, rotação e access log em JSON
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+ACCESS_LOG_ENABLED = os.environ.get("ACCESS_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", "1.0"))
+# Por rota, ex.: "/metrics=DEBUG,/appointments=INFO" e "/metrics=0,/appointments=0.1"
+ACCESS_LOG_ROUTE_LEVELS = os.environ.get("ACCESS_LOG_ROUTE_LEVELS", "/metrics=DEBUG")
+ACCESS_LOG_ROUTE_SAMPLING = os.environ.get("ACCESS_LOG_ROUTE_SAMPLING", "")
+
+# Compressão das respostas (gzip/brotli conforme o Accept-Encoding) e corpos gzip no process-sync
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+# Limite de requisições por usuário (sub do token) ou por IP nas rotas /auth/*: token bucket
+# por rota ("rota=req_por_segundo/burst") e máximo de requisições simultâneas por cliente. Desligado por
+# padrão: atrás de um proxy, sem RATE_LIMIT_TRUST_FORWARDED_FOR, todos os clientes dividem o mesmo IP
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_RULES = os.environ.get(
+    "RATE_LIMIT_RULES", "/auth/*=1/10,/queue/process-sync=2/10,/appointments=10/30,/appointments/batch=1/5,/appointment=5/20"
+)
+RATE_LIMIT_MAX_CONCURRENT = int(os.environ.get("RATE_LIMIT_MAX_CONCURRENT", "10"))
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")  # memory ou redis (compartilhado entre workers)
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+# Só use atrás de um proxy confiável: o IP do cliente passa a vir do X-Forwarded-For
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.environ.get("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+# Idempotência: respostas guardadas por Idempotency-Key e resultados por item do process-sync
+# (user_id, id, action), para que reenvios de clientes offline não voltem aos microsserviços
+IDEMPOTENCY_ENABLED = os.environ.get("IDEMPOTENCY_ENABLED", "true").lower() in ("1", "true", "yes")
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.environ.get("IDEMPOTENCY_MAX_BODY_BYTES", "1048576"))
+SYNC_ITEM_DEDUP_ENABLED = os.environ.get("SYNC_ITEM_DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Verificação local do JWT: chaves públicas pré-carregadas e backend de criptografia
+# (auto escolhe o mais rápido instalado: cryptography, depois rsa; jose usa o caminho antigo)
+JWT_CRYPTO_BACKEND = os.environ.get("JWT_CRYPTO_BACKEND", "auto")
+
+# Cache compartilhado entre os processos (workers do gunicorn) de tokens verificados e do JWKS:
+# mmap (arquivo em /dev/shm, tamanho fixo), memory (só no processo) ou none
+SHARED_CACHE_BACKEND = os.environ.get("SHARED_CACHE_BACKEND", "mmap")
+SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR", "")
+SHARED_CACHE_NAMESPACE = os.environ.get("SHARED_CACHE_NAMESPACE", f"{COGNITO_ISSUER}|{COGNITO_APP_CLIENT_ID}")
+SHARED_TOKEN_CACHE_SLOTS = int(os.environ.get("SHARED_TOKEN_CACHE_SLOTS", "16384"))
+SHARED_TOKEN_CACHE_SLOT_BYTES = int(os.environ.get("SHARED_TOKEN_CACHE_SLOT_BYTES", "1024"))
+
+# Lote de operações de appointments (POST /appointments/batch): máximo de operações por
+# requisição e quantas são enviadas ao micro-appointments-api ao mesmo tempo
+APPOINTMENTS_BATCH_MAX_OPERATIONS = int(os.environ.get("APPOINTMENTS_BATCH_MAX_OPERATIONS", "100"))
+APPOINTMENTS_BATCH_PARALLELISM = int(os.environ.get("APPOINTMENTS_BATCH_PARALLELISM", "4"))  # por requisição
+APPOINTMENTS_BATCH_POOL_SIZE = int(os.environ.get("APPOINTMENTS_BATCH_POOL_SIZE", "32"))  # threads por processo
+
+# Modo assíncrono do process-sync: o lote é gravado num log local (append-only) de jobs, a resposta
+# é 202 com o id do job, workers em segundo plano enviam ao micro-queue-api e o resultado fica em
+# GET /queue/jobs/<id>. off, prefer (só com o header "Prefer: respond-async") ou always
+SYNC_JOBS_MODE = os.environ.get("SYNC_JOBS_MODE", "off").lower()
+SYNC_JOBS_DIR = os.environ.get("SYNC_JOBS_DIR", "data")
+SYNC_JOBS_WORKERS = int(os.environ.get("SYNC_JOBS_WORKERS", "2"))
+SYNC_JOBS_MAX_PENDING = int(os.environ.get("SYNC_JOBS_MAX_PENDING", "10000"))
+SYNC_JOBS_MAX_ATTEMPTS = int(os.environ.get("SYNC_JOBS_MAX_ATTEMPTS", "5"))
+SYNC_JOBS_LEASE = float(os.environ.get("SYNC_JOBS_LEASE", "300"))
+SYNC_JOBS_RETENTION = float(os.environ.get("SYNC_JOBS_RETENTION", "86400"))
+SYNC_JOBS_FSYNC = os.environ.get("SYNC_JOBS_FSYNC", "true").lower() in ("1", "true", "yes")
+SYNC_JOBS_COMPACT_BYTES = int(os.environ.get("SYNC_JOBS_COMPACT_BYTES", "67108864"))
+SYNC_JOBS_POLL_INTERVAL = float(os.environ.get("SYNC_JOBS_POLL_INTERVAL", "1"))
+# Token com que os workers enviam os jobs ao micro-queue-api. Sem ele, o token do cliente fica só na
+# memória do processo que aceitou o job (nunca no log) e o job falha com 401 se expirar antes do envio
+SYNC_JOBS_SERVICE_TOKEN = os.environ.get("SYNC_JOBS_SERVICE_TOKEN", "")
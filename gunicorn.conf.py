@@ -0,0 +1,47 @@
+# Configuração do gunicorn para produção
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Para o modo assíncrono (asgi.py) use GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+# e a aplicação asgi:application.
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Workers: processos x threads. O gateway passa a maior parte do tempo esperando os
+# microsserviços (I/O), então cada processo atende várias requisições em threads.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+
+# Carrega o app uma vez no master (imports compartilhados via copy-on-write)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Keep-alive com o proxy / load balancer e timeouts
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Recicla os workers periodicamente (com jitter, para não reiniciarem todos juntos)
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "500"))
+
+# O access log em JSON é gravado pelo próprio app (log/access.log), fora da thread da requisição
+accesslog = os.environ.get("GUNICORN_ACCESSLOG", "") or None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    # Estado por processo (pools de conexão, caches, threads de log) não pode ser herdado do master.
+    from logger import start_listeners
+    from services.process_state import reinit_after_fork
+    start_listeners()
+    reinit_after_fork()
+
+
+def worker_exit(server, worker):
+    # Esvazia a fila de logs antes de o worker sair.
+    from logger import stop_listeners
+    stop_listeners()
@@ -1,6 +1,25 @@
-from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import hashlib
+import json
 import logging
 import os
+import queue
+import random
+import sys
+import threading
+
+from config import (
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_QUEUE_SIZE,
+    ACCESS_LOG_ENABLED,
+    ACCESS_LOG_SAMPLE_RATE,
+    ACCESS_LOG_ROUTE_LEVELS,
+    ACCESS_LOG_ROUTE_SAMPLING,
+    TRACE_FILE
+)
+from services.metrics import registry
 
 
 log_path = "log/"
@@ -10,62 +29,194 @@ if not os.path.exists(log_path):
    os.makedirs(log_path)
 
 
-dictConfig({
-    "version": 1,
-    "disable_existing_loggers": True,
-    "formatters": {
-        "default": {
-            "format": "[%(asctime)s] %(levelname)-4s %(funcName)s() L%(lineno)-4d %(message)s",
-        },
-        "detailed": {
-            "format": "[%(asctime)s] %(levelname)-4s %(funcName)s() L%(lineno)-4d %(message)s - call_trace=%(pathname)s L%(lineno)-4d",
-        }
-    },
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "default",
-            "stream": "ext://sys.stdout",
-        },
-        # "email": {
-        #     "class": "logging.handlers.SMTPHandler",
-        #     "formatter": "default",
-        #     "level": "ERROR",
-        #     "mailhost": ("smtp.example.com", 587),
-        #     "fromaddr": "devops@example.com",
-        #     "toaddrs": ["receiver@example.com", "receiver2@example.com"],
-        #     "subject": "Error Logs",
-        #     "credentials": ("username", "password"),
-        # },
-        "error_file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "formatter": "detailed",
-            "filename": "log/gunicorn.error.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
-            "delay": "True",
-        },
-        "detailed_file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "formatter": "detailed",
-            "filename": "log/gunicorn.detailed.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
-            "delay": "True",
-        }
-    },
-    "loggers": {
-        "gunicorn.error": {
-            "handlers": ["console", "error_file"],  #, email],
-            "level": "INFO",
-            "propagate": False,
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and the "fields" extra.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
         }
-    },
-    "root": {
-        "handlers": ["console", "detailed_file"],
-        "level": "INFO",
-    }
-})
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never waits: when the queue is full the record is dropped
+    (and counted) instead of blocking the request thread.
+    """
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Same process: the record is handed over as-is, only the traceback is rendered
+        # now (exc_info cannot outlive the except block). Formatting happens in the listener.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+# Handlers reais: só a thread do QueueListener escreve no console e em disco.
+_formatters = {
+    "default": logging.Formatter("[%(asctime)s] %(levelname)-4s %(funcName)s() L%(lineno)-4d %(message)s"),
+    "detailed": logging.Formatter(
+        "[%(asctime)s] %(levelname)-4s %(funcName)s() L%(lineno)-4d %(message)s - call_trace=%(pathname)s L%(lineno)-4d"
+    ),
+    "json": JsonFormatter(),
+    "message": logging.Formatter("%(message)s"),
+}
+
+
+def _rotating_file(filename, formatter):
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    handler = RotatingFileHandler(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
+    handler.setFormatter(_formatters[formatter])
+    return handler
+
+
+_console = logging.StreamHandler(sys.stdout)
+_console.setFormatter(_formatters["default"])
+_targets = {
+    "console": _console,
+    # "email": SMTPHandler(("smtp.example.com", 587), "devops@example.com",
+    #                      ["receiver@example.com", "receiver2@example.com"], "Error Logs",
+    #                      credentials=("username", "password")),
+    "error_file": _rotating_file("log/gunicorn.error.log", "detailed"),
+    "detailed_file": _rotating_file("log/gunicorn.detailed.log", "detailed"),
+    "access_file": _rotating_file("log/access.log", "json"),
+    "trace_file": _rotating_file(TRACE_FILE, "message"),
+}
+
+# Cada logger escreve numa fila própria; a thread do listener repassa para os handlers reais.
+_pipelines = {
+    "gunicorn.error": ("console", "error_file"),  #, email],
+    "gateway.access": ("access_file",),
+    "gateway.traces": ("trace_file",),
+    "": ("console", "detailed_file"),
+}
+_queue_handlers = {}
+_listeners = []
+_listeners_pid = None
+_listeners_lock = threading.Lock()
 
 
+def start_listeners():
+    """
+    Starts the background writer threads (one per pipeline). Threads do not survive
+    a fork, so a forked worker calls this again and gets fresh queues.
+    """
+    global _listeners, _listeners_pid
+    with _listeners_lock:
+        if _listeners_pid == os.getpid():
+            return
+        _listeners = []
+        for logger_name, handler_names in _pipelines.items():
+            log_queue = queue.Queue(LOG_QUEUE_SIZE)
+            queue_handler = _queue_handlers.get(logger_name)
+            if queue_handler is None:
+                queue_handler = _queue_handlers[logger_name] = NonBlockingQueueHandler(log_queue)
+                target_logger = logging.getLogger(logger_name)
+                target_logger.handlers = [queue_handler]
+                target_logger.setLevel(LOG_LEVEL)
+                target_logger.propagate = False
+            queue_handler.queue = log_queue
+            listener = QueueListener(log_queue, *(_targets[name] for name in handler_names), respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+        _listeners_pid = os.getpid()
+
+
+def stop_listeners():
+    """
+    Flushes the queued records and stops the writer threads.
+    """
+    global _listeners_pid
+    with _listeners_lock:
+        if _listeners_pid == os.getpid():
+            for listener in _listeners:
+                listener.stop()
+        _listeners_pid = None
+
+
+start_listeners()
+
+# Uma linha INFO por chamada HTTP do httpx (modo ASGI) é ruído.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+# Os spans exportados (TRACE_EXPORTER=file) não dependem do LOG_LEVEL.
+trace_logger = logging.getLogger("gateway.traces")
+trace_logger.setLevel(logging.INFO)
+
 logger = logging.getLogger(__name__)
+
+registry.register_collector(lambda: [(
+    "gateway_log_records_dropped_total", "counter", "Log records dropped because the log queue was full.",
+    [((), NonBlockingQueueHandler.dropped)]
+)])
+
+
+# ---- Access log ----
+
+def _parse_route_map(value: str, convert) -> dict:
+    routes = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, setting = item.rsplit("=", 1)
+            routes[route.strip()] = convert(setting.strip())
+    return routes
+
+
+access_logger = logging.getLogger("gateway.access")
+ROUTE_LEVELS = _parse_route_map(ACCESS_LOG_ROUTE_LEVELS, lambda level: logging.getLevelName(level.upper()))
+ROUTE_SAMPLING = _parse_route_map(ACCESS_LOG_ROUTE_SAMPLING, float)
+
+
+def user_hash(user_id) -> str:
+    """
+    Short, stable identifier of a user for the logs (the user_id itself is not logged).
+    """
+    if not user_id:
+        return None
+    return hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:16]
+
+
+def access_log(route: str, method: str, status: int, duration: float, user_id=None,
+               upstreams=(), upstream_seconds=None, trace_id=None):
+    """
+    Queues one JSON access log entry, subject to the route's level and sampling rate.
+    Server errors are always logged.
+    """
+    if not ACCESS_LOG_ENABLED:
+        return
+    level = logging.ERROR if status >= 500 else ROUTE_LEVELS.get(route, logging.INFO)
+    if not access_logger.isEnabledFor(level):
+        return
+    rate = ROUTE_SAMPLING.get(route, ACCESS_LOG_SAMPLE_RATE)
+    if status < 500 and rate < 1.0 and random.random() >= rate:
+        return
+    fields = {
+        "route": route,
+        "method": method,
+        "status": status,
+        "latency_ms": round(duration * 1000, 3),
+        "user": user_hash(user_id),
+        "upstreams": sorted(upstreams),
+    }
+    if upstream_seconds is not None:
+        fields["upstream_ms"] = round(upstream_seconds * 1000, 3)
+    if trace_id:
+        fields["trace_id"] = trace_id
+    access_logger.log(level, "request", extra={"fields": fields})
@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List, Any
+from typing import Optional, List, Any, Literal
 from pydantic import BaseModel, Field
 
 
@@ -71,3 +71,19 @@ class EventDelSchema(BaseModel):
     """
     mesage: str = Field(..., description="Return message")
     name: str = Field(..., description="Name of the removed event")
+
+class AppointmentOperationSchema(BaseModel):
+    """
+    Defines one operation of a batch: "create" takes "data", "update" takes "id"
+    and "data", and "delete" takes only "id".
+    """
+    action: Literal["create", "update", "delete"] = Field(..., description="Operation to perform")
+    id: Optional[str] = Field(None, description="Event ID (required for update and delete)")
+    data: Optional[EventSchema] = Field(None, description="Event to create or update")
+
+class AppointmentBatchSchema(BaseModel):
+    """
+    Defines a batch of appointment operations. Operations on the same event ID are
+    applied in the given order.
+    """
+    operations: List[AppointmentOperationSchema] = Field(..., description="List of operations")
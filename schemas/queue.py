@@ -9,3 +9,6 @@ class SyncItem(BaseModel):
 
 class ProcessSyncSchema(BaseModel):
     items: List[SyncItem] = Field(..., description="Lista de itens a serem sincronizados")
+
+class SyncJobPathSchema(BaseModel):
+    job_id: str = Field(..., description="ID do job retornado pelo process-sync assíncrono")
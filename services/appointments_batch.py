@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import APPOINTMENTS_BATCH_PARALLELISM, APPOINTMENTS_BATCH_POOL_SIZE
+from services.circuit_breaker import CircuitOpenError
+from services.resilience import DeadlineExceeded
+from services.serialization import encode_model
+
+
+class BatchOperation:
+    """
+    An operation of an /appointments/batch request, translated to its upstream call
+    (the same one the single-operation /appointment routes make).
+    """
+
+    def __init__(self, index, operation, user_id):
+        self.index = index
+        self.action = operation.action
+        # A create may carry its ID in the event itself.
+        self.id = operation.id or (operation.data.id if operation.data is not None else None)
+        self.method = None
+        self.params = None
+        self.body = None
+        self.error = None
+        if self.action in ("update", "delete") and not self.id:
+            self.error = f'"id" is required for {self.action}'
+        elif self.action in ("create", "update") and operation.data is None:
+            self.error = f'"data" is required for {self.action}'
+        elif self.action == "create":
+            self.method = "POST"
+            update = {"user_id": user_id}
+            if self.id:
+                update["id"] = self.id
+            self.body = encode_model(operation.data, update=update)
+        elif self.action == "update":
+            self.method = "PUT"
+            self.params = {"id": self.id, "user_id": user_id}
+            self.body = encode_model(operation.data)
+        else:
+            self.method = "DELETE"
+            self.params = {"id": self.id, "user_id": user_id}
+
+    def headers(self, auth_value):
+        if self.body is None:
+            return {"Authorization": auth_value}
+        return {"Content-Type": "application/json", "Authorization": auth_value}
+
+    def result(self, status, data=None, error=None) -> dict:
+        result = {"index": self.index, "action": self.action, "id": self.id, "status": status}
+        if error is not None:
+            result["error"] = error
+        else:
+            result["data"] = data
+        return result
+
+
+def plan_operations(operations, user_id):
+    """
+    Returns the BatchOperations grouped by event ID: the operations of a group run one
+    after the other, in request order, and different groups run concurrently. Creates
+    without an ID are independent of everything else.
+    """
+    groups = {}
+    for index, operation in enumerate(operations):
+        planned = BatchOperation(index, operation, user_id)
+        key = planned.id if planned.id else ("new", index)
+        groups.setdefault(key, []).append(planned)
+    return list(groups.values())
+
+
+def _response_result(operation, response):
+    try:
+        data = response.json()
+    except ValueError:
+        data = response.text
+    return operation.result(response.status_code, data)
+
+
+def _error_result(operation, e):
+    if isinstance(e, CircuitOpenError):
+        status = 503
+    elif isinstance(e, DeadlineExceeded):
+        status = 504
+    else:
+        status = 502
+    return operation.result(status, error=str(e))
+
+
+def batch_response(groups, results):
+    """
+    Builds the response body and status: 200 when every operation succeeded, 207 with
+    the per-operation statuses otherwise. Results keep the request order.
+    """
+    ordered = [None] * sum(len(group) for group in groups)
+    for result in results:
+        ordered[result["index"]] = result
+    if all(result["status"] < 300 for result in ordered):
+        return {"status": "ok", "msg": "All operations succeeded.", "data": ordered}, 200
+    return {"status": "error", "msg": "Some operations failed.", "data": ordered}, 207
+
+
+def _send_group(client, group, auth_value):
+    results = []
+    for operation in group:
+        if operation.error is not None:
+            results.append(operation.result(400, error=operation.error))
+            continue
+        try:
+            response = client.request(
+                operation.method, "/appointment", params=operation.params, data=operation.body,
+                headers=operation.headers(auth_value)
+            )
+            results.append(_response_result(operation, response))
+        except Exception as e:
+            results.append(_error_result(operation, e))
+    return results
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    # Worker threads do not survive a fork, so the pool is created per process.
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=APPOINTMENTS_BATCH_POOL_SIZE, thread_name_prefix="appointments-batch"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def send_operations(client, groups, auth_value):
+    """
+    Sends the grouped operations (at most APPOINTMENTS_BATCH_PARALLELISM groups at a
+    time for this request) over the pooled client and returns the (response_data,
+    status_code).
+
+    The request takes at most APPOINTMENTS_BATCH_PARALLELISM - 1 workers of the shared
+    pool, plus the caller thread; each of them sends groups until none is left, so one
+    large batch cannot hold every worker of the process.
+    """
+    if len(groups) == 1:
+        return batch_response(groups, _send_group(client, groups[0], auth_value))
+    pending = iter(groups)
+    lock = threading.Lock()
+    results = []
+
+    def drain():
+        while True:
+            with lock:
+                group = next(pending, None)
+            if group is None:
+                return
+            sent = _send_group(client, group, auth_value)
+            with lock:
+                results.extend(sent)
+
+    # Each runner works in a copy of the caller's context, so its upstream calls join the request trace.
+    runners = min(APPOINTMENTS_BATCH_PARALLELISM, len(groups)) - 1
+    futures = [get_executor().submit(contextvars.copy_context().run, drain) for _ in range(runners)]
+    drain()
+    for future in futures:
+        future.result()
+    return batch_response(groups, results)
+
+
+async def send_operations_async(client, groups, auth_value):
+    """
+    Async version of send_operations, for the ASGI mode.
+    """
+    semaphore = asyncio.Semaphore(APPOINTMENTS_BATCH_PARALLELISM)
+
+    async def send(group):
+        results = []
+        async with semaphore:
+            for operation in group:
+                if operation.error is not None:
+                    results.append(operation.result(400, error=operation.error))
+                    continue
+                try:
+                    response = await client.request(
+                        operation.method, "/appointment", params=operation.params, content=operation.body,
+                        headers=operation.headers(auth_value)
+                    )
+                    results.append(_response_result(operation, response))
+                except Exception as e:
+                    results.append(_error_result(operation, e))
+        return results
+
+    outcomes = await asyncio.gather(*(send(group) for group in groups))
+    return batch_response(groups, [result for results in outcomes for result in results])
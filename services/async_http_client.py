@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import httpx
+
+from config import (
+    MICRO_AUTH_API_URL,
+    MICRO_QUEUE_API_URL,
+    MICRO_APPOINTMENTS_URL,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_IDLE_TIMEOUT
+)
+from services.circuit_breaker import CLOSED, get_breaker
+from services.metrics import registry, phase, record_upstream_call
+from services.resilience import RETRY_STATUSES, deadline_exceeded, expired, get_policy
+from services.tracing import span, inject_headers
+
+
+class AsyncUpstreamClient:
+    """
+    Non-blocking counterpart of UpstreamClient, used by the ASGI gateway mode.
+
+    Each upstream keeps one httpx.AsyncClient (and connection pool) per event loop,
+    with the same pool size and idle eviction as the sync client, and the same
+    circuit breaker and resilience policy (timeouts, retries, hedging, deadline).
+    """
+
+    def __init__(self, name, base_url, pool_size=HTTP_POOL_SIZE, idle_timeout=HTTP_POOL_IDLE_TIMEOUT, policy=None):
+        self.name = name
+        self.policy = policy or get_policy(name)
+        self.base_url = (base_url or "").rstrip("/")
+        self.limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=idle_timeout
+        )
+        self.timeout = httpx.Timeout(self.policy.read_timeout, connect=self.policy.connect_timeout)
+        self._client = None
+        self._loop = None
+        self.breaker = get_breaker(name)
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+            self._loop = loop
+        return self._client
+
+    async def request(self, method: str, path: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """
+        Async version of UpstreamClient.request (retries of idempotent calls, optional
+        hedging, deadline budget).
+        """
+        attempt = 0
+        while True:
+            try:
+                if hedge and self.breaker.state == CLOSED:
+                    response = await self._hedged(method, path, kwargs)
+                else:
+                    response = await self._send(method, path, dict(kwargs))
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.TimeoutException) and expired():
+                    raise deadline_exceeded(self.name) from e
+                delay = self._retry_delay(method, attempt, "error")
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self._retry_delay(method, attempt, str(response.status_code))
+                if delay is None:
+                    return response
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, method: str, attempt: int, reason: str):
+        if not self.policy.can_retry(method, attempt):
+            return None
+        delay = self.policy.backoff(attempt)
+        if delay is not None:
+            registry.inc("gateway_upstream_retries_total", (("upstream", self.name), ("reason", reason)))
+        return delay
+
+    async def _hedged(self, method: str, path: str, kwargs) -> httpx.Response:
+        delay = self.policy.hedge_delay(method, path)
+        if delay is None:
+            return await self._send(method, path, dict(kwargs))
+        first = asyncio.ensure_future(self._send(method, path, dict(kwargs)))
+        done, _ = await asyncio.wait((first,), timeout=delay)
+        if done:
+            return first.result()
+        second = asyncio.ensure_future(self._send(method, path, dict(kwargs)))
+        done, pending = await asyncio.wait((first, second), return_when=asyncio.FIRST_COMPLETED)
+        winner = next((task for task in done if task.exception() is None), None)
+        if winner is None:
+            # The first to finish failed: the other one (if still running) gets its chance.
+            done, pending = await asyncio.wait(pending) if pending else (done, pending)
+            winner = next((task for task in done if task.exception() is None), first)
+        for task in pending:
+            task.cancel()
+        registry.inc("gateway_upstream_hedged_total", (("upstream", self.name), ("winner", "first" if winner is first else "hedge")))
+        return winner.result()
+
+    async def _send(self, method: str, path: str, kwargs) -> httpx.Response:
+        if "timeout" not in kwargs:
+            connect, read = self.policy.timeouts(method, path)
+            kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+        self.breaker.before_call()
+        in_flight = (("upstream", self.name),)
+        registry.inc("gateway_upstream_in_flight", in_flight)
+        start = time.monotonic()
+        try:
+            with phase("upstream"), span(f"{method} {self.name}", upstream=self.name, path=path) as current:
+                kwargs["headers"] = inject_headers(kwargs.get("headers"))
+                response = await self.client().request(method, self.url(path), **kwargs)
+                if current is not None:
+                    current.attributes["status"] = response.status_code
+        except Exception:
+            elapsed = time.monotonic() - start
+            self.breaker.record(False, elapsed)
+            record_upstream_call(self.name, method, "error", elapsed)
+            raise
+        finally:
+            registry.inc("gateway_upstream_in_flight", in_flight, -1)
+        elapsed = time.monotonic() - start
+        self.breaker.record(response.status_code < 500, elapsed)
+        record_upstream_call(self.name, method, response.status_code, elapsed)
+        if response.status_code < 500:
+            self.policy.record(method, path, elapsed)
+        return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def put(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("PUT", path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+
+_clients = {
+    "auth": AsyncUpstreamClient("auth", MICRO_AUTH_API_URL),
+    "queue": AsyncUpstreamClient("queue", MICRO_QUEUE_API_URL),
+    "appointments": AsyncUpstreamClient("appointments", MICRO_APPOINTMENTS_URL),
+}
+
+
+def get_async_client(name: str) -> AsyncUpstreamClient:
+    """
+    Returns the async pooled client of an upstream ("auth", "queue" or "appointments").
+    """
+    return _clients[name]
+
+
+async def close_async_clients():
+    for client in _clients.values():
+        await client.aclose()
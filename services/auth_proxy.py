@@ -1,11 +1,9 @@
-import requests
-from config import MICRO_AUTH_API_URL
+from services.http_client import get_client
 
 def refresh_user_token(username: str, refresh_token: str) -> dict:
-    url = f"{MICRO_AUTH_API_URL}/refresh"
     payload = {"username": username, "refreshToken": refresh_token}
     try:
-        response = requests.post(url, json=payload)
+        response = get_client("auth").post("/refresh", json=payload)
         return response.json()
     except Exception as e:
         return {"error": str(e)}
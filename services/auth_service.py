@@ -1,37 +1,48 @@
-import requests
-from config import MICRO_AUTH_API_URL
+from services.circuit_breaker import CircuitOpenError
+from services.http_client import get_client
+from services.resilience import DeadlineExceeded
 
 def login_auth(payload, headers):
     try:
-        response = requests.post(f"{MICRO_AUTH_API_URL}/login", json=payload, headers=headers)
+        response = get_client("auth").post("/login", json=payload, headers=headers)
         return response.json(), response.status_code
+    except (CircuitOpenError, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e), "data": {}}, 500
 
 def reset_password_auth(payload, headers):
     try:
-        response = requests.post(f"{MICRO_AUTH_API_URL}/reset-password", json=payload, headers=headers)
+        response = get_client("auth").post("/reset-password", json=payload, headers=headers)
         return response.json(), response.status_code
+    except (CircuitOpenError, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e), "data": {}}, 500
 
 def sign_up_auth(payload, headers):
     try:
-        response = requests.post(f"{MICRO_AUTH_API_URL}/sign-up", json=payload, headers=headers)
+        response = get_client("auth").post("/sign-up", json=payload, headers=headers)
         return response.json(), response.status_code
+    except (CircuitOpenError, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e), "data": {}}, 500
 
 def confirm_sign_up_auth(payload, headers):
     try:
-        response = requests.post(f"{MICRO_AUTH_API_URL}/confirm-sign-up", json=payload, headers=headers)
+        response = get_client("auth").post("/confirm-sign-up", json=payload, headers=headers)
         return response.json(), response.status_code
+    except (CircuitOpenError, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e), "data": {}}, 500
 
 def refresh_token_auth(payload, headers):
     try:
-        response = requests.post(f"{MICRO_AUTH_API_URL}/refresh-token", json=payload, headers=headers)
+        response = get_client("auth").post("/refresh-token", json=payload, headers=headers)
         return response.json(), response.status_code
+    except (CircuitOpenError, DeadlineExceeded):
+        raise
     except Exception as e:
         return {"status": "error", "msg": str(e), "data": {}}, 500
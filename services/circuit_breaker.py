@@ -0,0 +1,181 @@
+import math
+import threading
+import time
+from collections import deque
+
+from config import (
+    CIRCUIT_BREAKER_ENABLED,
+    CIRCUIT_BREAKER_WINDOW,
+    CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_ERROR_RATE,
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+    CIRCUIT_BREAKER_SLOW_CALL_RATE,
+    CIRCUIT_BREAKER_OPEN_SECONDS,
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES
+)
+from services.metrics import registry
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit is open.
+    """
+
+    def __init__(self, upstream: str, retry_after: int):
+        super().__init__(f"Upstream '{upstream}' is unavailable, retry in {retry_after} seconds")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one upstream.
+
+    Outcomes are kept over a rolling time window; the circuit opens when, with at least
+    `min_calls` calls in the window, the error rate or the slow-call rate reaches its
+    threshold. While open, calls fail fast; after `open_seconds` up to `half_open_probes`
+    calls are let through, and the circuit closes again only if all of them succeed.
+    """
+
+    def __init__(self, name, window=CIRCUIT_BREAKER_WINDOW, min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+                 error_rate=CIRCUIT_BREAKER_ERROR_RATE, slow_call_seconds=CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate=CIRCUIT_BREAKER_SLOW_CALL_RATE, open_seconds=CIRCUIT_BREAKER_OPEN_SECONDS,
+                 half_open_probes=CIRCUIT_BREAKER_HALF_OPEN_PROBES, enabled=CIRCUIT_BREAKER_ENABLED):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.enabled = enabled
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._calls = deque()
+        self._failures = 0
+        self._slow = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError if the call must not reach the upstream.
+        """
+        if not self.enabled or self.state == CLOSED:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - now
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, max(1, math.ceil(remaining)))
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    raise CircuitOpenError(self.name, max(1, math.ceil(self.open_seconds / 10)))
+                self._probes_in_flight += 1
+
+    def record(self, success: bool, latency: float):
+        """
+        Records the outcome of a call that went through before_call.
+        """
+        if not self.enabled:
+            return
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if not success or slow:
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._reset(CLOSED)
+                return
+            if self.state == OPEN:
+                return
+
+            self._calls.append((now, not success, slow))
+            self._failures += not success
+            self._slow += slow
+            self._trim(now)
+            total = len(self._calls)
+            if total >= self.min_calls and (
+                self._failures / total >= self.error_rate or self._slow / total >= self.slow_call_rate
+            ):
+                self._open(now)
+
+    def _trim(self, now):
+        limit = now - self.window
+        calls = self._calls
+        while calls and calls[0][0] < limit:
+            _, failed, slow = calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _open(self, now):
+        self._reset(OPEN)
+        self._opened_at = now
+
+    def _reset(self, state):
+        self.state = state
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._calls)
+            retry_after = 0
+            if self.state == OPEN:
+                retry_after = max(0, math.ceil(self._opened_at + self.open_seconds - time.monotonic()))
+            return {
+                "state": self.state,
+                "calls": total,
+                "error_rate": round(self._failures / total, 3) if total else 0.0,
+                "slow_call_rate": round(self._slow / total, 3) if total else 0.0,
+                "retry_after": retry_after
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Returns the circuit breaker of an upstream, shared by the sync and async clients.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def breakers_snapshot() -> dict:
+    return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
+
+
+def _collect_breakers():
+    states = [
+        ((("upstream", name), ("state", state)), int(snapshot["state"] == state))
+        for name, snapshot in breakers_snapshot().items()
+        for state in (CLOSED, OPEN, HALF_OPEN)
+    ]
+    return [("gateway_circuit_breaker_state", "gauge", "1 for the current state of each upstream circuit.", states)]
+
+
+registry.register_collector(_collect_breakers)
@@ -2,10 +2,11 @@ import os
 import hmac
 import hashlib
 import base64
-import boto3
-from botocore.exceptions import ClientError
+import threading
 from jose import jwt, JWTError
-import requests
+from services.http_client import get_client
+from services.jwks_cache import get_jwks_cache
+from services.single_flight import get_single_flight
 
 # ENV variables
 COGNITO_USER_POOL_ID = os.environ.get("COGNITO_USER_POOL_ID")
@@ -14,8 +15,31 @@ COGNITO_APP_CLIENT_SECRET = os.environ.get("COGNITO_APP_CLIENT_SECRET")  # NOVA
 AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 COGNITO_ISSUER = f"https://cognito-idp.{AWS_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}"
 
-# Cognito Client
-client = boto3.client('cognito-idp', region_name=AWS_REGION)
+# Cognito Client (criado no primeiro uso: boto3/botocore são pesados de importar)
+_client = None
+_client_lock = threading.Lock()
+
+def get_cognito_client():
+    """
+    Returns the boto3 Cognito client, importing boto3 and creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                _client = boto3.client('cognito-idp', region_name=AWS_REGION)
+    return _client
+
+def call_cognito(operation: str, **params) -> dict:
+    """
+    Calls a Cognito operation; AWS errors are returned as {"error": message}.
+    """
+    from botocore.exceptions import ClientError
+    try:
+        return getattr(get_cognito_client(), operation)(**params)
+    except ClientError as e:
+        return {"error": e.response["Error"]["Message"]}
 
 def get_secret_hash(username: str) -> str:
     message = username + COGNITO_APP_CLIENT_ID
@@ -27,69 +51,68 @@ def get_secret_hash(username: str) -> str:
     return base64.b64encode(dig).decode()
 
 def authenticate_user(username: str, password: str) -> dict:
-    try:
-        auth_parameters = {
-            'USERNAME': username,
-            'PASSWORD': password,
-            'SECRET_HASH': get_secret_hash(username)
-        }
-        response = client.initiate_auth(
-            ClientId=COGNITO_APP_CLIENT_ID,
-            AuthFlow='USER_PASSWORD_AUTH',
-            AuthParameters=auth_parameters
-        )
-        return response.get("AuthenticationResult", response)
-    except ClientError as e:
-        return {"error": e.response["Error"]["Message"]}
+    auth_parameters = {
+        'USERNAME': username,
+        'PASSWORD': password,
+        'SECRET_HASH': get_secret_hash(username)
+    }
+    response = call_cognito(
+        "initiate_auth",
+        ClientId=COGNITO_APP_CLIENT_ID,
+        AuthFlow='USER_PASSWORD_AUTH',
+        AuthParameters=auth_parameters
+    )
+    if "error" in response:
+        return response
+    return response.get("AuthenticationResult", response)
 
 def reset_user_password(username: str) -> dict:
-    try:
-        response = client.admin_reset_user_password(
-            UserPoolId=COGNITO_USER_POOL_ID,
-            Username=username
-        )
-        return {"message": "Password reset requested successfully."}
-    except ClientError as e:
-        return {"error": e.response["Error"]["Message"]}
+    response = call_cognito(
+        "admin_reset_user_password",
+        UserPoolId=COGNITO_USER_POOL_ID,
+        Username=username
+    )
+    if "error" in response:
+        return response
+    return {"message": "Password reset requested successfully."}
 
 def sign_up_user(username: str, password: str, email: str, name: str) -> dict:
-    try:
-        response = client.sign_up(
-            ClientId=COGNITO_APP_CLIENT_ID,
-            Username=username,
-            Password=password,
-            UserAttributes=[
-                {'Name': 'email', 'Value': email},
-                {'Name': 'name', 'Value': name}
-            ],
-            SecretHash=get_secret_hash(username)
-        )
-        return response
-    except ClientError as e:
-        return {"error": e.response["Error"]["Message"]}
+    return call_cognito(
+        "sign_up",
+        ClientId=COGNITO_APP_CLIENT_ID,
+        Username=username,
+        Password=password,
+        UserAttributes=[
+            {'Name': 'email', 'Value': email},
+            {'Name': 'name', 'Value': name}
+        ],
+        SecretHash=get_secret_hash(username)
+    )
 
 def confirm_sign_up(username: str, confirmation_code: str, session: str = None) -> dict:
-    try:
-        params = {
-            'ClientId': COGNITO_APP_CLIENT_ID,
-            'Username': username,
-            'ConfirmationCode': confirmation_code,
-            'SecretHash': get_secret_hash(username)
-        }
-        if session:
-            params['Session'] = session
+    params = {
+        'ClientId': COGNITO_APP_CLIENT_ID,
+        'Username': username,
+        'ConfirmationCode': confirmation_code,
+        'SecretHash': get_secret_hash(username)
+    }
+    if session:
+        params['Session'] = session
 
-        response = client.confirm_sign_up(**params)
-        return {"message": "User confirmed successfully."}
-    except ClientError as e:
-        return {"error": e.response["Error"]["Message"]}
+    response = call_cognito("confirm_sign_up", **params)
+    if "error" in response:
+        return response
+    return {"message": "User confirmed successfully."}
 
 def get_cognito_jwk():
     """
     Retrieves the Cognito public keys for validating JWT tokens.
     """
     jwks_url = f"{COGNITO_ISSUER}/.well-known/jwks.json"
-    response = requests.get(jwks_url)
+    return get_single_flight("jwks").do(jwks_url, lambda: _fetch_jwks(jwks_url))
+
+def _fetch_jwks(jwks_url):
+    response = get_client("cognito").get(jwks_url)
     response.raise_for_status()
     return response.json()
 
@@ -98,14 +121,9 @@ def verify_token(token: str) -> dict:
     Verifies and decodes the JWT token using the Cognito public keys.
     """
     try:
-        jwks = get_cognito_jwk()
         headers = jwt.get_unverified_header(token)
         kid = headers.get("kid")
-        key = None
-        for jwk in jwks["keys"]:
-            if jwk["kid"] == kid:
-                key = jwk
-                break
+        key = get_jwks_cache(f"{COGNITO_ISSUER}/.well-known/jwks.json", get_cognito_jwk).get_key(kid)
         if key is None:
             return None
         payload = jwt.decode(
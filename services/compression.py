@@ -0,0 +1,269 @@
+import io
+import json
+import zlib
+
+from config import COMPRESSION_MIN_BYTES, GZIP_LEVEL, BROTLI_QUALITY
+
+# Optional brotli support, used when installed.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Brotli request bodies need a decoder that can cap its output (brotli >= 1.2):
+# one compressed byte can otherwise expand to megabytes before the size is checked.
+BROTLI_BOUNDED = brotli is not None and hasattr(brotli.Decompressor, "can_accept_more_data")
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+class BodyDecodeError(ValueError):
+    """
+    A compressed request body that cannot be accepted; `status` is the HTTP status to return.
+    """
+
+    def __init__(self, msg: str, status: int = 400):
+        super().__init__(msg)
+        self.status = status
+
+
+# ---- Content negotiation ----
+
+def parse_accept_encoding(header) -> dict:
+    """
+    Returns {coding: q} from an Accept-Encoding header.
+    """
+    codings = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def accepts(header, coding: str) -> bool:
+    """
+    Tells whether the client accepts a response body in the given content coding.
+    """
+    if not coding or coding == "identity":
+        return True
+    codings = parse_accept_encoding(header)
+    return codings.get(coding, codings.get("*", 0.0)) > 0
+
+
+def choose_encoding(header):
+    """
+    Picks the response coding: brotli when available and accepted, then gzip, else None.
+    """
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = (("br", "gzip") if brotli is not None else ("gzip",))
+    best = max(candidates, key=lambda coding: codings.get(coding, wildcard))
+    return best if codings.get(best, wildcard) > 0 else None
+
+
+def is_compressible(content_type) -> bool:
+    return any(kind in (content_type or "") for kind in COMPRESSIBLE_TYPES)
+
+
+def should_compress(accept_encoding, content_type, content_encoding, size, status: int):
+    """
+    Returns the coding to compress a response with, or None to send it as-is:
+    small, already encoded, non-text and bodiless responses are never compressed.
+    A size of None means unknown (streamed).
+    """
+    if status < 200 or status in (204, 206, 304) or content_encoding:
+        return None
+    if not is_compressible(content_type):
+        return None
+    if size is not None and size < COMPRESSION_MIN_BYTES:
+        return None
+    return choose_encoding(accept_encoding)
+
+
+def weak_etag(etag):
+    # A compressed body is a different representation: the ETag can only stay as a weak validator.
+    if etag and not etag.startswith("W/"):
+        return f"W/{etag}"
+    return etag
+
+
+# ---- Compression ----
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def iter_compress(chunks, encoding: str):
+    """
+    Compresses a streamed body chunk by chunk. Closing the generator closes the source.
+    """
+    compressor = _compressor(encoding)
+    try:
+        for chunk in chunks:
+            if encoding == "br":
+                out = compressor.process(chunk)
+            else:
+                out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.finish() if encoding == "br" else compressor.flush()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+# ---- Compressed request bodies ----
+
+class BodyDecoder:
+    """
+    Incremental decoder of a compressed request body. At most `max_bytes` of decoded
+    data are produced, so a small compressed body cannot expand without bound.
+    """
+
+    def __init__(self, encoding: str, max_bytes: int):
+        encoding = (encoding or "").strip().lower()
+        if encoding in ("gzip", "x-gzip"):
+            self._decompressor = zlib.decompressobj(31)
+        elif encoding == "deflate":
+            self._decompressor = zlib.decompressobj()
+        elif encoding == "br" and BROTLI_BOUNDED:
+            self._decompressor = brotli.Decompressor()
+        else:
+            raise BodyDecodeError(f"Unsupported Content-Encoding: {encoding}", 415)
+        self.encoding = encoding
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def feed(self, data: bytes) -> bytes:
+        try:
+            if self.encoding == "br":
+                out = self._decompressor.process(data, output_buffer_limit=self.max_bytes - self.size + 1)
+            else:
+                out = self._decompressor.decompress(data, self.max_bytes - self.size + 1)
+                if self._decompressor.unconsumed_tail:
+                    raise BodyDecodeError("Request body too large", 413)
+        except BodyDecodeError:
+            raise
+        except Exception:
+            raise BodyDecodeError(f"Invalid {self.encoding} request body")
+        self.size += len(out)
+        if self.size > self.max_bytes:
+            raise BodyDecodeError("Request body too large", 413)
+        return out
+
+    def finish(self) -> bytes:
+        if self.encoding != "br":
+            if not self._decompressor.eof:
+                raise BodyDecodeError(f"Truncated {self.encoding} request body")
+        elif not self._decompressor.is_finished():
+            raise BodyDecodeError(f"Truncated {self.encoding} request body")
+        return b""
+
+
+def decode_body(body: bytes, encoding: str, max_bytes: int) -> bytes:
+    decoder = BodyDecoder(encoding, max_bytes)
+    return decoder.feed(body) + decoder.finish()
+
+
+class DecodingStream(io.RawIOBase):
+    """
+    Read-only stream that decodes a compressed WSGI input on the fly.
+    """
+
+    def __init__(self, raw, decoder: BodyDecoder, content_length=None, chunk_size: int = 65536):
+        self._raw = raw
+        self._decoder = decoder
+        self._remaining = content_length
+        self._chunk_size = chunk_size
+        self._buffer = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            limit = self._chunk_size if self._remaining is None else min(self._chunk_size, self._remaining)
+            data = self._raw.read(limit) if limit else b""
+            if self._remaining is not None:
+                self._remaining -= len(data)
+            if not data:
+                self._buffer += self._decoder.finish()
+                self._done = True
+                break
+            self._buffer += self._decoder.feed(data)
+        if size is None or size < 0:
+            out, self._buffer = self._buffer, b""
+        else:
+            out, self._buffer = self._buffer[:size], self._buffer[size:]
+        return out
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _json_error(start_response, status: int, msg: str):
+    body = json.dumps({"status": "error", "msg": msg, "data": {}}).encode("utf-8")
+    reason = {400: "BAD REQUEST", 413: "REQUEST ENTITY TOO LARGE", 415: "UNSUPPORTED MEDIA TYPE"}[status]
+    start_response(f"{status} {reason}", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+class DecompressRequestMiddleware:
+    """
+    WSGI middleware accepting compressed request bodies (Content-Encoding) on the given
+    paths. With `streaming` the body is decoded while the app reads it; otherwise it is
+    decoded up front, and a body that is invalid or too large is rejected before the app runs.
+    """
+
+    def __init__(self, app, paths, max_bytes: int, streaming: bool = False):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.streaming = streaming
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if not encoding or encoding == "identity" or environ.get("PATH_INFO") not in self.paths:
+            return self.app(environ, start_response)
+
+        content_length = environ.get("CONTENT_LENGTH")
+        content_length = int(content_length) if content_length and content_length.isdigit() else None
+        try:
+            decoder = BodyDecoder(encoding, self.max_bytes)
+            stream = DecodingStream(environ["wsgi.input"], decoder, content_length)
+            if self.streaming:
+                environ.pop("CONTENT_LENGTH", None)
+                environ["wsgi.input_terminated"] = True
+            else:
+                body = stream.read()
+                stream = io.BytesIO(body)
+                environ["CONTENT_LENGTH"] = str(len(body))
+        except BodyDecodeError as e:
+            return _json_error(start_response, e.status, str(e))
+
+        environ["wsgi.input"] = stream
+        del environ["HTTP_CONTENT_ENCODING"]
+        return self.app(environ, start_response)
@@ -0,0 +1,290 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    MICRO_AUTH_API_URL,
+    MICRO_QUEUE_API_URL,
+    MICRO_APPOINTMENTS_URL,
+    COGNITO_ISSUER,
+    HTTP_POOL_SIZE,
+    HTTP_POOL_IDLE_TIMEOUT,
+    HTTP_HEDGE_POOL_SIZE
+)
+from services.circuit_breaker import CLOSED, get_breaker
+from services.metrics import registry, phase, record_upstream_call
+from services.resilience import RETRY_STATUSES, deadline_exceeded, expired, get_policy
+from services.tracing import span, inject_headers
+
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client for one upstream service, backed by its own connection pool.
+
+    Paths are resolved against the upstream base URL and the pool is dropped when it
+    has been idle for longer than `idle_timeout` seconds (or after a fork). Timeouts,
+    retries and hedging follow the upstream's UpstreamPolicy (services.resilience),
+    within the request deadline. Every attempt goes through the upstream circuit
+    breaker: connection errors and 5xx responses count as failures, and
+    CircuitOpenError is raised while the circuit is open.
+    """
+
+    def __init__(self, name, base_url, pool_size=HTTP_POOL_SIZE, idle_timeout=HTTP_POOL_IDLE_TIMEOUT, policy=None):
+        self.name = name
+        self.base_url = (base_url or "").rstrip("/")
+        self.pool_size = pool_size
+        self.policy = policy or get_policy(name)
+        self.idle_timeout = idle_timeout
+        self._session = None
+        self._pid = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self.breaker = get_breaker(name)
+        # Cognito (JWKS) calls happen while verifying the token and are timed as part of it.
+        self.phase = "token" if name == "cognito" else "upstream"
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def session(self) -> requests.Session:
+        """
+        Returns the pooled session, rebuilding it after a fork or a long idle period.
+        """
+        now = time.monotonic()
+        session = self._session
+        if session is None or self._pid != os.getpid() or now - self._last_used > self.idle_timeout:
+            with self._lock:
+                if self._session is session:
+                    if session is not None and self._pid == os.getpid():
+                        session.close()
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+                session = self._session
+        self._last_used = now
+        return session
+
+    def _build_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def request(self, method: str, path: str, hedge: bool = False, **kwargs) -> requests.Response:
+        """
+        Sends the request, retrying idempotent calls that fail with a connection error,
+        a timeout or a 502/503/504 (with jittered backoff, while the deadline allows).
+        With hedge=True a second copy is sent when the first one is slower than the
+        route's p95, and the first response wins.
+        """
+        attempt = 0
+        while True:
+            try:
+                if hedge and self.breaker.state == CLOSED:
+                    response = self._hedged(method, path, kwargs)
+                else:
+                    response = self._send(method, path, dict(kwargs))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if isinstance(e, requests.Timeout) and expired():
+                    raise deadline_exceeded(self.name) from e
+                delay = self._retry_delay(method, attempt, "error")
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self._retry_delay(method, attempt, str(response.status_code))
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, method: str, attempt: int, reason: str):
+        if not self.policy.can_retry(method, attempt):
+            return None
+        delay = self.policy.backoff(attempt)
+        if delay is not None:
+            registry.inc("gateway_upstream_retries_total", (("upstream", self.name), ("reason", reason)))
+        return delay
+
+    def _hedged(self, method: str, path: str, kwargs) -> requests.Response:
+        delay = self.policy.hedge_delay(method, path)
+        first = submit_hedged(self._send, method, path, dict(kwargs)) if delay is not None else None
+        if first is None:
+            # Latency still unknown, or every hedge worker busy: send it without a hedge.
+            return self._send(method, path, dict(kwargs))
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        second = submit_hedged(self._send, method, path, dict(kwargs))
+        if second is None:
+            return first.result()
+        done, pending = wait((first, second), return_when=FIRST_COMPLETED)
+        winner = next((future for future in done if future.exception() is None), None)
+        if winner is None:
+            # The first to finish failed: the other one (if still running) gets its chance.
+            done, pending = wait(pending) if pending else (done, pending)
+            winner = next((future for future in done if future.exception() is None), first)
+        loser = second if winner is first else first
+        loser.add_done_callback(_discard_response)
+        registry.inc("gateway_upstream_hedged_total", (("upstream", self.name), ("winner", "first" if winner is first else "hedge")))
+        return winner.result()
+
+    def _send(self, method: str, path: str, kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.policy.timeouts(method, path))
+        self.breaker.before_call()
+        in_flight = (("upstream", self.name),)
+        registry.inc("gateway_upstream_in_flight", in_flight)
+        start = time.monotonic()
+        try:
+            with phase(self.phase), span(f"{method} {self.name}", upstream=self.name, path=path) as current:
+                kwargs["headers"] = inject_headers(kwargs.get("headers"))
+                response = self.session().request(method, self.url(path), **kwargs)
+                if current is not None:
+                    current.attributes["status"] = response.status_code
+        except Exception:
+            elapsed = time.monotonic() - start
+            self.breaker.record(False, elapsed)
+            record_upstream_call(self.name, method, "error", elapsed)
+            raise
+        finally:
+            registry.inc("gateway_upstream_in_flight", in_flight, -1)
+        elapsed = time.monotonic() - start
+        self.breaker.record(response.status_code < 500, elapsed)
+        record_upstream_call(self.name, method, response.status_code, elapsed)
+        if response.status_code < 500:
+            self.policy.record(method, path, elapsed)
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the pool size and the number of idle keep-alive connections.
+        """
+        idle = 0
+        session = self._session
+        if session is not None and self._pid == os.getpid():
+            pools = session.get_adapter("http://").poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None and pool.pool is not None:
+                    idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {"max_size": self.pool_size, "idle": idle}
+
+    def reset_after_fork(self):
+        """
+        Drops the session inherited from the parent process without closing it:
+        its sockets are still owned by the parent.
+        """
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+
+def _discard_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+_hedge_executor = None
+_hedge_slots = None
+_hedge_executor_pid = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor():
+    """
+    Returns the (executor, free worker semaphore) of the hedged calls of this process.
+    """
+    # Worker threads do not survive a fork, so the pool is created per process.
+    global _hedge_executor, _hedge_slots, _hedge_executor_pid
+    if _hedge_executor is None or _hedge_executor_pid != os.getpid():
+        with _hedge_executor_lock:
+            if _hedge_executor is None or _hedge_executor_pid != os.getpid():
+                _hedge_executor = ThreadPoolExecutor(max_workers=HTTP_HEDGE_POOL_SIZE, thread_name_prefix="upstream-hedge")
+                _hedge_slots = threading.BoundedSemaphore(HTTP_HEDGE_POOL_SIZE)
+                _hedge_executor_pid = os.getpid()
+    return _hedge_executor, _hedge_slots
+
+
+def submit_hedged(func, *args):
+    """
+    Runs func(*args) on a free hedge worker, in a copy of the caller's context (so it
+    joins the request trace and deadline), and returns its future. Returns None when
+    every worker is busy: a call never waits in the pool, where the wait would count
+    against the hedge delay.
+    """
+    executor, slots = get_hedge_executor()
+    if not slots.acquire(blocking=False):
+        return None
+
+    def run():
+        try:
+            return func(*args)
+        finally:
+            slots.release()
+
+    try:
+        return executor.submit(contextvars.copy_context().run, run)
+    except RuntimeError:
+        slots.release()
+        raise
+
+
+# One client (and connection pool) per upstream service.
+_clients = {
+    "auth": UpstreamClient("auth", MICRO_AUTH_API_URL),
+    "queue": UpstreamClient("queue", MICRO_QUEUE_API_URL),
+    "appointments": UpstreamClient("appointments", MICRO_APPOINTMENTS_URL),
+    "cognito": UpstreamClient("cognito", COGNITO_ISSUER),
+}
+
+
+def get_client(name: str) -> UpstreamClient:
+    """
+    Returns the pooled client of an upstream ("auth", "queue", "appointments" or "cognito").
+    """
+    return _clients[name]
+
+
+def get_clients() -> dict:
+    return dict(_clients)
+
+
+def _collect_pools():
+    stats = {name: client.pool_stats() for name, client in _clients.items()}
+    return [
+        ("gateway_upstream_pool_max_size", "gauge", "Maximum keep-alive connections per upstream pool.",
+         [((("upstream", name),), stat["max_size"]) for name, stat in stats.items()]),
+        ("gateway_upstream_pool_idle", "gauge", "Idle keep-alive connections in each upstream pool.",
+         [((("upstream", name),), stat["idle"]) for name, stat in stats.items()]),
+    ]
+
+
+registry.register_collector(_collect_pools)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_MAX_BODY_BYTES
+from services.metrics import registry, cache_collector
+
+# Write routes that honor the Idempotency-Key header.
+IDEMPOTENT_ROUTES = {
+    ("POST", "/queue/process-sync"),
+    ("POST", "/appointment"),
+    ("PUT", "/appointment"),
+    ("DELETE", "/appointment"),
+    ("POST", "/appointments/batch"),
+}
+# Routes whose failed items are retried by sending the batch again: only their
+# successful responses are stored, so a retry gets past the key to SyncItemDedup
+# and only re-sends the items that failed.
+ITEM_RETRY_ROUTES = {
+    ("POST", "/queue/process-sync"),
+}
+
+
+class RecentOutcomes:
+    """
+    Bounded map of recent outcomes: entries expire after `ttl` seconds and the least
+    recently used ones are evicted past `max_entries`.
+    """
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._put(key, value)
+
+    def put_if_absent(self, key, value):
+        """
+        Stores `value` unless a live entry exists; returns the live entry or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[1] > now:
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+            self._put(key, value)
+            return None
+
+    def _put(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+# ---- Idempotency-Key header ----
+
+class _Pending:
+    __slots__ = ("fingerprint",)
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+
+
+class StoredResponse:
+    __slots__ = ("fingerprint", "status", "body", "content_type")
+
+    def __init__(self, fingerprint, status: int, body: bytes, content_type: str):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+
+class IdempotencyConflict(Exception):
+    """
+    The Idempotency-Key cannot be used for this request: `status` is 409 while the
+    original request is still in flight, 422 when the key was used for another request.
+    """
+
+    def __init__(self, msg: str, status: int):
+        super().__init__(msg)
+        self.status = status
+
+
+def request_fingerprint(method: str, path: str, query: str, body: bytes = None) -> str:
+    digest = hashlib.sha256(f"{method} {path}?{query}\n".encode("utf-8"))
+    if body:
+        digest.update(body)
+    return digest.hexdigest()
+
+
+class IdempotencyKeys:
+    """
+    Responses of the write routes by (user_id, method, route, Idempotency-Key). A retry
+    with the same key gets the stored response without reaching the upstream. Only
+    responses below 500 are stored, so a failed request can be retried with its key
+    (only 2xx on ITEM_RETRY_ROUTES).
+    """
+
+    def __init__(self, outcomes: RecentOutcomes):
+        self.outcomes = outcomes
+
+    def begin(self, key, fingerprint):
+        """
+        Returns the StoredResponse to replay, or None after marking the key as in flight
+        (the caller must then complete() or abandon() it). Raises IdempotencyConflict.
+        """
+        entry = self.outcomes.put_if_absent(key, _Pending(fingerprint))
+        if entry is None:
+            return None
+        if entry.fingerprint != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+        if isinstance(entry, _Pending):
+            raise IdempotencyConflict("A request with this Idempotency-Key is still being processed", 409)
+        registry.inc("gateway_idempotent_replays_total")
+        return entry
+
+    def complete(self, key, fingerprint, status: int, body: bytes, content_type: str):
+        # The key is (user_id, method, route, Idempotency-Key).
+        limit = 300 if (key[1], key[2]) in ITEM_RETRY_ROUTES else 500
+        if status >= limit or len(body) > IDEMPOTENCY_MAX_BODY_BYTES:
+            self.outcomes.pop(key)
+            return
+        self.outcomes.put(key, StoredResponse(fingerprint, status, body, content_type))
+
+    def abandon(self, key):
+        self.outcomes.pop(key)
+
+
+# ---- Sync items ----
+
+def _item_fingerprint(item) -> str:
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SyncItemDedup:
+    """
+    Per-item deduplication of one process-sync batch. Items already processed for the
+    user with the same (id, action) and the same content are answered from the stored
+    result instead of being forwarded; merge() puts the stored and the upstream results
+    back in the original order and remembers the new successes. Failed items are not
+    stored, so a retry after a partial failure only forwards the failed ones.
+    """
+
+    def __init__(self, outcomes: RecentOutcomes, user_id):
+        self.outcomes = outcomes
+        self.user_id = user_id
+        self.count = 0
+        self._known = {}
+        self._forwarded = []
+
+    def forward(self, item) -> bool:
+        """
+        Registers the next item of the batch; False when its result is already known.
+        """
+        index = self.count
+        self.count += 1
+        key = (self.user_id, item.get("id"), item.get("action"))
+        fingerprint = _item_fingerprint(item)
+        stored = self.outcomes.get(key)
+        if stored is not None and stored[0] == fingerprint:
+            self._known[index] = stored[1]
+            return False
+        self._forwarded.append((index, key, fingerprint))
+        return True
+
+    @property
+    def skipped(self) -> int:
+        return len(self._known)
+
+    def known_response(self):
+        """
+        The response of a batch whose items were all already processed.
+        """
+        return {"status": "ok", "data": [self._known[index] for index in range(self.count)]}, 200
+
+    def merge(self, response_data, status: int):
+        """
+        Returns (response_data, status) for the whole batch from the upstream response
+        to the forwarded items. A response that does not list one result per forwarded
+        item is returned as it is.
+        """
+        results = response_data.get("data") if isinstance(response_data, dict) else None
+        if not isinstance(results, list) or len(results) != len(self._forwarded):
+            return response_data, status
+        merged = [None] * self.count
+        for index, result in self._known.items():
+            merged[index] = result
+        for (index, key, fingerprint), result in zip(self._forwarded, results):
+            merged[index] = result
+            # Kept even when the batch failed with a 5xx: in a chunked batch, the items of
+            # the chunks that did get an answer were processed.
+            if isinstance(result, dict) and "error" not in result:
+                self.outcomes.put(key, (fingerprint, result))
+        if self._known:
+            registry.inc("gateway_sync_items_deduplicated_total", amount=len(self._known))
+        response_data = dict(response_data)
+        response_data["data"] = merged
+        return response_data, status
+
+
+# One store per process for each layer.
+idempotency_keys = IdempotencyKeys(RecentOutcomes())
+sync_item_outcomes = RecentOutcomes()
+
+registry.register_collector(cache_collector("idempotency_keys", idempotency_keys.outcomes))
+registry.register_collector(cache_collector("sync_items", sync_item_outcomes))
+registry.describe("gateway_idempotent_replays_total", "counter", "Requests answered with the response stored for their Idempotency-Key.")
+registry.describe("gateway_sync_items_deduplicated_total", "counter", "Sync items answered from a previous result instead of being forwarded.")
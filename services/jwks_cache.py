@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from config import (
+    JWKS_CACHE_TTL,
+    JWKS_REFRESH_INTERVAL,
+    JWKS_MISS_REFETCH_INTERVAL,
+    JWKS_NEGATIVE_TTL
+)
+from services.shared_cache import open_store, shared_key
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the unknown-kid negative cache, so random kids cannot grow it forever.
+MAX_NEGATIVE_KIDS = 1024
+# Cross-process store of the fetched documents (a few KB each, one per JWKS URL).
+SHARED_JWKS_SLOTS = 8
+SHARED_JWKS_SLOT_BYTES = 32768
+
+
+class JWKSCache:
+    """
+    Process-wide store of JWKS keys indexed by "kid".
+
+    Keys are fetched once and served from memory until the TTL expires. A background
+    thread refreshes them periodically, an unknown kid triggers at most one forced
+    refetch per JWKS_MISS_REFETCH_INTERVAL (key rotation) and unknown kids are
+    negative-cached so bogus tokens cannot cause a refetch storm. When a refresh
+    fails, the previous keys are kept and the next attempt waits the same interval.
+
+    With a `shared` store the fetched document is published under `shared_key` for
+    the other worker processes, which load it from there instead of calling the
+    endpoint themselves (until the next refresh is due).
+    """
+
+    def __init__(self, fetcher, ttl=JWKS_CACHE_TTL, refresh_interval=JWKS_REFRESH_INTERVAL,
+                 miss_refetch_interval=JWKS_MISS_REFETCH_INTERVAL, negative_ttl=JWKS_NEGATIVE_TTL,
+                 shared=None, shared_key=None):
+        self._fetcher = fetcher
+        self.shared = shared
+        self.shared_key = shared_key
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.miss_refetch_interval = miss_refetch_interval
+        self.negative_ttl = negative_ttl
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_forced_fetch = float("-inf")
+        self._unknown_kids = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._pid = None
+        self._listeners = []
+
+    def get_key(self, kid):
+        """
+        Returns the JWK for the given kid, or None if the kid is unknown.
+        """
+        self._ensure_refresher()
+        now = time.monotonic()
+        if now >= self._expires_at:
+            self._refresh_if_expired()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        if self._unknown_kids.get(kid, 0.0) > now:
+            return None
+
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
+            if now - self._last_forced_fetch >= self.miss_refetch_interval:
+                self._last_forced_fetch = now
+                # The shared copy may be the one without the new key: go to the endpoint.
+                self._load_locked(force=True)
+                key = self._keys.get(kid)
+            if key is None:
+                if len(self._unknown_kids) >= MAX_NEGATIVE_KIDS:
+                    self._unknown_kids.clear()
+                self._unknown_kids[kid] = now + self.negative_ttl
+        return key
+
+    def get_jwks(self):
+        """
+        Returns the cached keys in the JWKS document format ({"keys": [...]}).
+        """
+        self._ensure_refresher()
+        if time.monotonic() >= self._expires_at:
+            self._refresh_if_expired()
+        return {"keys": list(self._keys.values())}
+
+    def subscribe(self, listener):
+        """
+        Calls listener(keys) with the {kid: jwk} map now (when already loaded) and after
+        every load, so consumers can pre-process the keys once instead of per lookup.
+        """
+        with self._lock:
+            self._listeners.append(listener)
+            if self._keys:
+                listener(self._keys)
+
+    def refresh(self):
+        """
+        Reloads the keys from the JWKS endpoint.
+        """
+        with self._lock:
+            self._load_locked()
+
+    def clear(self):
+        """
+        Drops every cached key, forcing the next lookup to fetch them again.
+        """
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0.0
+            self._last_forced_fetch = float("-inf")
+            self._unknown_kids = {}
+
+    def _refresh_if_expired(self):
+        with self._lock:
+            if time.monotonic() >= self._expires_at:
+                self._load_locked()
+
+    def _load_locked(self, force=False):
+        if not force and self._load_shared_locked():
+            return
+        try:
+            jwks = self._fetcher()
+        except Exception as e:
+            # Keep serving the previous keys; Cognito being down must not reject valid tokens.
+            logger.warning("JWKS refresh failed: %s", e)
+            if not self._keys:
+                raise
+            # Stale keys are served until the next attempt, so requests do not queue
+            # behind a refetch on this lock for as long as the endpoint is down.
+            self._expires_at = max(self._expires_at, time.monotonic() + self.miss_refetch_interval)
+            return
+        self._set_keys_locked(jwks, self.ttl)
+        if self.shared is not None:
+            # Shared only until the next refresh is due, so one worker refetches it then.
+            shared_ttl = min(self.ttl, self.refresh_interval) if self.refresh_interval > 0 else self.ttl
+            self.shared.put(self.shared_key, json.dumps(jwks).encode("utf-8"), time.time() + shared_ttl)
+
+    def _load_shared_locked(self) -> bool:
+        if self.shared is None:
+            return False
+        found = self.shared.get(self.shared_key)
+        if found is None:
+            return False
+        document, expires_at = found
+        try:
+            jwks = json.loads(document)
+        except ValueError:
+            return False
+        self._set_keys_locked(jwks, min(self.ttl, expires_at - time.time()))
+        return True
+
+    def _set_keys_locked(self, jwks: dict, ttl: float):
+        self._keys = {jwk["kid"]: jwk for jwk in jwks.get("keys", []) if "kid" in jwk}
+        self._expires_at = time.monotonic() + ttl
+        for listener in self._listeners:
+            listener(self._keys)
+        # Kids that are now known must not stay negative-cached.
+        self._unknown_kids = {
+            kid: exp for kid, exp in self._unknown_kids.items() if kid not in self._keys
+        }
+
+    def _ensure_refresher(self):
+        # The refresher thread does not survive a fork, so it is (re)started per process.
+        if self._pid == os.getpid() or self.refresh_interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="jwks-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Background JWKS refresh failed: %s", e)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_jwks_cache(jwks_url, fetcher):
+    """
+    Returns the process-wide JWKSCache for the given JWKS URL, creating it on first use.
+    """
+    cache = _caches.get(jwks_url)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(jwks_url)
+            if cache is None:
+                cache = JWKSCache(
+                    fetcher,
+                    shared=open_store("jwks", SHARED_JWKS_SLOTS, SHARED_JWKS_SLOT_BYTES),
+                    shared_key=shared_key(jwks_url)
+                )
+                _caches[jwks_url] = cache
+    return cache
@@ -0,0 +1,191 @@
+import base64
+import binascii
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Parsed token headers by their encoded form: every token of an issuer key shares one.
+MAX_CACHED_HEADERS = 64
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _b64url_int(value: str) -> int:
+    return int.from_bytes(b64url_decode(value), "big")
+
+
+# ---- Crypto backends ----
+
+class CryptographyBackend:
+    """
+    RS256 with the cryptography package (OpenSSL).
+    """
+
+    name = "cryptography"
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding, rsa
+        self._invalid = InvalidSignature
+        self._numbers = rsa.RSAPublicNumbers
+        self._padding = padding.PKCS1v15()
+        self._hash = hashes.SHA256()
+
+    def load_key(self, jwk: dict):
+        return self._numbers(_b64url_int(jwk["e"]), _b64url_int(jwk["n"])).public_key()
+
+    def verify(self, key, signature: bytes, signing_input: bytes) -> bool:
+        try:
+            key.verify(signature, signing_input, self._padding, self._hash)
+            return True
+        except self._invalid:
+            return False
+
+
+class RsaBackend:
+    """
+    RS256 with the pure-Python rsa package, for when cryptography is not installed.
+    """
+
+    name = "rsa"
+
+    def __init__(self):
+        import rsa
+        self._rsa = rsa
+
+    def load_key(self, jwk: dict):
+        return self._rsa.PublicKey(_b64url_int(jwk["n"]), _b64url_int(jwk["e"]))
+
+    def verify(self, key, signature: bytes, signing_input: bytes) -> bool:
+        try:
+            return self._rsa.verify(signing_input, signature, key) == "SHA-256"
+        except self._rsa.VerificationError:
+            return False
+
+
+BACKENDS = {"cryptography": CryptographyBackend, "rsa": RsaBackend}
+
+
+def load_backend(name: str = "auto"):
+    """
+    Returns the requested crypto backend, or with "auto" the fastest one installed.
+    Returns None when none is available.
+    """
+    for candidate in (BACKENDS if name == "auto" else (name,)):
+        try:
+            return BACKENDS[candidate]()
+        except ImportError:
+            continue
+    return None
+
+
+# ---- Verifier ----
+
+class JWTVerifier:
+    """
+    RS256 access token verifier with the issuer's public keys parsed once per JWKS
+    load (not once per token). Claims are checked like python-jose does: "exp", "nbf"
+    and "iat" must be integers, "iss" must match, "aud" must contain the audience when
+    present and "sub" must be a string.
+    """
+
+    def __init__(self, issuer: str, audience: str, backend):
+        self.issuer = issuer
+        self.audience = audience
+        self.backend = backend
+        self._keys = {}
+        self._headers = {}
+
+    def load_keys(self, jwks_keys: dict):
+        """
+        Parses the {kid: jwk} map into public keys; JWKSCache calls it on every load.
+        """
+        self._keys = {kid: (jwk, self._load_key(kid, jwk)) for kid, jwk in jwks_keys.items()}
+
+    def _load_key(self, kid, jwk: dict):
+        if jwk.get("kty") != "RSA" or jwk.get("alg", "RS256") != "RS256":
+            return None
+        try:
+            return self.backend.load_key(jwk)
+        except Exception as e:
+            logger.warning("Skipping unusable JWK %s: %s", kid, e)
+            return None
+
+    def public_key(self, kid, jwk: dict):
+        entry = self._keys.get(kid)
+        if entry is not None and entry[0] is jwk:
+            return entry[1]
+        # Keys loaded before this verifier subscribed, or swapped concurrently.
+        key = self._load_key(kid, jwk)
+        keys = dict(self._keys)
+        keys[kid] = (jwk, key)
+        self._keys = keys
+        return key
+
+    def _header(self, segment: str):
+        header = self._headers.get(segment)
+        if header is None:
+            parsed = json.loads(b64url_decode(segment))
+            if not isinstance(parsed, dict):
+                return None
+            header = (parsed.get("alg"), parsed.get("kid"))
+            if len(self._headers) >= MAX_CACHED_HEADERS:
+                self._headers = {}
+            self._headers[segment] = header
+        return header
+
+    def verify(self, token: str, get_jwk):
+        """
+        Returns the claims of a valid token, or None. get_jwk(kid) returns the JWK
+        dict of a key id (or None), going through the JWKS cache.
+        """
+        try:
+            signing_input, _, signature = token.rpartition(".")
+            header_segment, _, payload_segment = signing_input.partition(".")
+            if not payload_segment:
+                return None
+            header = self._header(header_segment)
+            if header is None or header[0] != "RS256":
+                return None
+            jwk = get_jwk(header[1])
+            if jwk is None:
+                return None
+            key = self.public_key(header[1], jwk)
+            if key is None or not self.backend.verify(key, b64url_decode(signature), signing_input.encode("ascii")):
+                return None
+            claims = json.loads(b64url_decode(payload_segment))
+        except (ValueError, TypeError, KeyError, binascii.Error, UnicodeError):
+            return None
+        if not isinstance(claims, dict) or not self._valid_claims(claims):
+            return None
+        return claims
+
+    def _valid_claims(self, claims: dict) -> bool:
+        now = int(time.time())
+        try:
+            if "exp" in claims and int(claims["exp"]) < now:
+                return False
+            if "nbf" in claims and int(claims["nbf"]) > now:
+                return False
+            if "iat" in claims:
+                int(claims["iat"])
+        except (TypeError, ValueError):
+            return False
+        if claims.get("iss") != self.issuer:
+            return False
+        if "aud" in claims:
+            audience = claims["aud"]
+            if isinstance(audience, str):
+                audience = [audience]
+            if not isinstance(audience, list) or any(not isinstance(a, str) for a in audience):
+                return False
+            if self.audience not in audience:
+                return False
+        if "sub" in claims and not isinstance(claims["sub"], str):
+            return False
+        return True
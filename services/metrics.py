@@ -0,0 +1,264 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets (seconds) shared by every histogram.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Shard:
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms for the Prometheus text format.
+
+    Every thread records into its own shard, so the hot path is a couple of dict
+    updates without any lock; shards are only merged when the metrics are rendered.
+    Labels are tuples of (name, value) pairs. Gauges that reflect the state of other
+    components (pools, caches) come from collectors, called at render time.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._collectors = []
+
+    def describe(self, name: str, kind: str, help_text: str):
+        """
+        Declares the type ("counter", "gauge" or "histogram") and help text of a metric.
+        """
+        self._meta[name] = (kind, help_text)
+
+    def register_collector(self, collector):
+        """
+        Adds a callable returning [(name, kind, help, [(labels, value), ...]), ...].
+        """
+        self._collectors.append(collector)
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, labels=(), amount=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels, value: float):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        state = histograms.get(key)
+        if state is None:
+            # One slot per bucket, one for +Inf, then the sum.
+            state = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.counters.clear()
+                shard.histograms.clear()
+
+    def _merged(self):
+        counters, histograms = {}, {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for key, value in list(shard.counters.items()):
+                counters[key] = counters.get(key, 0) + value
+            for key, state in list(shard.histograms.items()):
+                state = list(state)
+                merged = histograms.get(key)
+                histograms[key] = state if merged is None else [a + b for a, b in zip(merged, state)]
+        return counters, histograms
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        counters, histograms = self._merged()
+        families = {}
+        for (name, labels), value in counters.items():
+            families.setdefault(name, []).append(_sample(name, labels, value))
+        for (name, labels), state in histograms.items():
+            families.setdefault(name, []).extend(self._histogram_samples(name, labels, state))
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                self._meta.setdefault(name, (kind, help_text))
+                families.setdefault(name, []).extend(_sample(name, labels, value) for labels, value in samples)
+
+        lines = []
+        for name in sorted(families):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(sorted(families[name]) if kind != "histogram" else families[name])
+        return "\n".join(lines) + "\n"
+
+    def _histogram_samples(self, name, labels, state):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield _sample(f"{name}_bucket", labels + (("le", le),), cumulative)
+        yield _sample(f"{name}_sum", labels, state[-1])
+        yield _sample(f"{name}_count", labels, cumulative)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, labels, value) -> str:
+    if labels:
+        label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+registry = MetricsRegistry()
+
+registry.describe("gateway_requests_total", "counter", "Requests handled, by route, method and status.")
+registry.describe(
+    "gateway_request_duration_seconds", "histogram",
+    "Request latency by phase: total, token (verification), upstream (waiting on the "
+    "microservices) and gateway (everything else)."
+)
+registry.describe("gateway_upstream_requests_total", "counter", "Upstream calls, by upstream and status.")
+registry.describe("gateway_upstream_request_duration_seconds", "histogram", "Upstream call latency.")
+registry.describe("gateway_upstream_in_flight", "gauge", "Upstream calls currently waiting for a response.")
+
+
+def cache_collector(cache_name: str, cache):
+    """
+    Returns a collector exposing the hits, misses, size and hit ratio of a cache
+    whose stats() has "hits", "misses" and "size" or "entries".
+    """
+    def collect():
+        stats = cache.stats()
+        labels = (("cache", cache_name),)
+        lookups = stats["hits"] + stats["misses"]
+        return [
+            ("gateway_cache_hits_total", "counter", "Cache lookups that found an entry.", [(labels, stats["hits"])]),
+            ("gateway_cache_misses_total", "counter", "Cache lookups without an entry.", [(labels, stats["misses"])]),
+            ("gateway_cache_entries", "gauge", "Entries currently cached.",
+             [(labels, stats.get("size", stats.get("entries", 0)))]),
+            ("gateway_cache_hit_ratio", "gauge", "Hits / lookups since the process started.",
+             [(labels, round(stats["hits"] / lookups, 4) if lookups else 0.0)]),
+        ]
+    return collect
+
+
+# ---- Per-request phases ----
+
+class RequestTimer:
+    """
+    Time spent by one request in each phase. Nested or concurrent spans of the same
+    phase (e.g. parallel upstream calls) are counted once, from the first start to
+    the last end.
+    """
+
+    __slots__ = ("start", "duration", "phases", "user_id", "upstreams", "_depth", "_entered")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = None
+        self.phases = {}
+        self.user_id = None
+        self.upstreams = set()
+        self._depth = {}
+        self._entered = {}
+
+    def enter(self, phase: str):
+        depth = self._depth.get(phase, 0)
+        if depth == 0:
+            self._entered[phase] = time.perf_counter()
+        self._depth[phase] = depth + 1
+
+    def exit(self, phase: str):
+        depth = self._depth[phase] - 1
+        self._depth[phase] = depth
+        if depth == 0:
+            self.phases[phase] = self.phases.get(phase, 0.0) + time.perf_counter() - self._entered[phase]
+
+
+_current_request = contextvars.ContextVar("gateway_request_timer", default=None)
+
+
+def start_request() -> RequestTimer:
+    timer = RequestTimer()
+    _current_request.set(timer)
+    return timer
+
+
+def set_request_user(user_id):
+    timer = _current_request.get()
+    if timer is not None:
+        timer.user_id = user_id
+
+
+def finish_request(route: str, method: str, status: int):
+    """
+    Records the request count and the latency of each phase of the current request,
+    and returns its RequestTimer (None outside a request).
+    """
+    timer = _current_request.get()
+    if timer is None:
+        return None
+    _current_request.set(None)
+    total = timer.duration = time.perf_counter() - timer.start
+    registry.inc("gateway_requests_total", (("route", route), ("method", method), ("status", str(status))))
+
+    name = "gateway_request_duration_seconds"
+    token = timer.phases.get("token", 0.0)
+    upstream = timer.phases.get("upstream", 0.0)
+    registry.observe(name, (("route", route), ("method", method), ("phase", "total")), total)
+    registry.observe(name, (("route", route), ("method", method), ("phase", "gateway")), max(0.0, total - token - upstream))
+    if "token" in timer.phases:
+        registry.observe(name, (("route", route), ("method", method), ("phase", "token")), token)
+    if "upstream" in timer.phases:
+        registry.observe(name, (("route", route), ("method", method), ("phase", "upstream")), upstream)
+    return timer
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Attributes the time spent in the block to a phase of the current request.
+    """
+    timer = _current_request.get()
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit(name)
+
+
+def record_upstream_call(upstream: str, method: str, status, duration: float):
+    timer = _current_request.get()
+    if timer is not None:
+        timer.upstreams.add(upstream)
+    labels = (("upstream", upstream), ("method", method))
+    registry.inc("gateway_upstream_requests_total", labels + (("status", str(status)),))
+    registry.observe("gateway_upstream_request_duration_seconds", labels, duration)
@@ -0,0 +1,68 @@
+import json
+
+from flask import Response, jsonify, request
+
+from config import RESPONSE_PASSTHROUGH, PASSTHROUGH_CHUNK_SIZE
+from services.compression import accepts
+
+# Upstream headers forwarded as-is together with the body bytes.
+FORWARDED_HEADERS = ("Content-Type", "Content-Encoding", "Content-Length")
+
+
+def is_json_response(upstream) -> bool:
+    return "json" in upstream.headers.get("Content-Type", "")
+
+
+def _stream_body(upstream, chunk_size):
+    try:
+        # decode_content=False: the bytes go out exactly as the upstream sent them.
+        for chunk in upstream.raw.stream(chunk_size, decode_content=False):
+            yield chunk
+    finally:
+        upstream.close()
+
+
+def passthrough_response(upstream, chunk_size=PASSTHROUGH_CHUNK_SIZE) -> Response:
+    """
+    Streams the upstream body, status and content headers straight to the client,
+    without decoding the JSON. The upstream request must be made with stream=True.
+    """
+    headers = {name: upstream.headers[name] for name in FORWARDED_HEADERS if name in upstream.headers}
+    return Response(
+        _stream_body(upstream, chunk_size),
+        status=upstream.status_code,
+        headers=headers,
+        direct_passthrough=True
+    )
+
+
+def proxy_response(upstream):
+    """
+    Returns the upstream response to the client: passed through untouched when the
+    passthrough mode is on and the body is JSON, otherwise decoded and re-serialized.
+    """
+    if RESPONSE_PASSTHROUGH and is_json_response(upstream):
+        # An encoded upstream body can only go out as-is if the client accepts that coding.
+        if accepts(request.headers.get("Accept-Encoding"), upstream.headers.get("Content-Encoding")):
+            return passthrough_response(upstream)
+        return content_response(upstream)
+    return jsonify(upstream.json()), upstream.status_code
+
+
+def content_response(upstream) -> Response:
+    """
+    Returns the already-read (and transfer-decoded) upstream body without parsing it.
+    """
+    return Response(
+        upstream.content,
+        status=upstream.status_code,
+        content_type=upstream.headers.get("Content-Type")
+    )
+
+
+def may_contain_key(body: bytes, key: str) -> bool:
+    """
+    Cheap pre-check before parsing a JSON body: False means the key is not present
+    (the upstreams never write plain ASCII keys with escape sequences).
+    """
+    return json.dumps(key).encode("utf-8") in body
@@ -0,0 +1,37 @@
+import logging
+
+from services.http_client import get_clients
+from services.rate_limit import rate_limiter
+from services.sync_jobs import sync_jobs
+from services.response_cache import appointments_cache
+from services.token_cache import token_cache
+from services.token_service import get_jwks_store
+
+logger = logging.getLogger(__name__)
+
+
+def reinit_after_fork(warm_jwks: bool = True):
+    """
+    Resets the per-process state a worker inherits from a preloading master:
+    upstream connection pools are dropped (the sockets belong to the parent) and the
+    token and response caches and the in-process rate limit state start empty (verified
+    tokens and the JWKS stay available through the cross-process shared cache). Thread
+    pools and the JWKS refresher are already recreated per process on first use.
+
+    With warm_jwks the Cognito keys are fetched right away, so the first request of
+    the worker does not pay for it.
+    """
+    for client in get_clients().values():
+        client.reset_after_fork()
+    token_cache.clear()
+    appointments_cache.clear()
+    rate_limiter.backend.clear()
+    if sync_jobs is not None:
+        # Jobs left queued (or running in a worker that died) are drained from the start.
+        sync_jobs.start()
+
+    if warm_jwks:
+        try:
+            get_jwks_store().get_jwks()
+        except Exception as e:
+            logger.warning("Could not prefetch the Cognito JWKS: %s", e)
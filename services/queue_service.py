@@ -1,6 +1,5 @@
-import json
-import requests
-from config import MICRO_QUEUE_API_URL
+from services.http_client import get_client
+from services.serialization import encode_json
 from services.token_service import verify_token
 
 def get_user_id_from_token(auth_header: str) -> str:
@@ -43,7 +42,7 @@ def send_sync_request(payload: dict, headers: dict) -> dict:
     Sends the request to the micro‑queue‑api.
     """
     try:
-        response = requests.post(f"{MICRO_QUEUE_API_URL}/process-sync", json=payload, headers=headers)
+        response = get_client("queue").post("/process-sync", data=encode_json(payload), headers=headers)
         response_data = response.json()
         return response_data
     except Exception as e:
@@ -56,10 +55,5 @@ def process_sync_payload(payload: dict, auth_header: str) -> dict:
     user_id = get_user_id_from_token(auth_header)
     payload = prepare_payload_with_user_id(payload, user_id)
 
-    try:
-        payload = json.loads(json.dumps(payload, default=str))
-    except Exception as e:
-        raise Exception(f"Error serializing payload: {str(e)}")
-
     response_data = send_sync_request(payload, headers={"Content-Type": "application/json", "Authorization": auth_header})
     return response_data
@@ -0,0 +1,294 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    RATE_LIMIT_RULES,
+    RATE_LIMIT_MAX_CONCURRENT,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_TRUST_FORWARDED_FOR
+)
+from services.metrics import registry
+
+# Optional shared backend, used when RATE_LIMIT_BACKEND=redis and the package is installed.
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a request is over its route rate or its client's concurrency cap.
+    `retry_after` is the number of seconds to wait before trying again.
+    """
+
+    def __init__(self, msg: str, retry_after: int):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+class Rule:
+    """
+    Token bucket of a route: `rate` requests per second on average, bursts of up to `burst`.
+    """
+
+    __slots__ = ("pattern", "rate", "burst")
+
+    def __init__(self, pattern: str, rate: float, burst: float):
+        self.pattern = pattern
+        self.rate = rate
+        self.burst = burst
+
+    def retry_after(self, tokens: float) -> int:
+        # Whole seconds until one token is back, as Retry-After requires.
+        return max(1, int((1.0 - tokens) / self.rate + 0.999)) if self.rate > 0 else 60
+
+
+def parse_rules(value: str) -> dict:
+    """
+    Parses "route=rate/burst,..." (rate in requests per second). A route ending in
+    "/*" covers every route under that prefix.
+    """
+    rules = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        pattern, setting = item.rsplit("=", 1)
+        rate, _, burst = setting.partition("/")
+        rate = float(rate)
+        rules[pattern.strip()] = Rule(pattern.strip(), rate, float(burst) if burst else max(1.0, rate))
+    return rules
+
+
+# ---- Backends ----
+
+class MemoryBackend:
+    """
+    Per-process state: each gunicorn worker enforces the limits on its own, so the
+    effective limit is multiplied by the number of workers. At most `max_keys` buckets
+    are kept (least recently used first out; an evicted bucket starts full again).
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rule: Rule) -> tuple:
+        """
+        Takes one token from the bucket of `key`. Returns (taken, tokens left).
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [rule.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(rule.burst, bucket[0] + (now - bucket[1]) * rule.rate)
+                bucket[1] = now
+            if bucket[0] < 1.0:
+                return False, bucket[0]
+            bucket[0] -= 1.0
+            return True, bucket[0]
+
+    def acquire(self, key, limit: int) -> bool:
+        with self._lock:
+            count = self._in_flight.get(key, 0)
+            if count >= limit:
+                return False
+            self._in_flight[key] = count + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            count = self._in_flight.get(key, 0) - 1
+            if count > 0:
+                self._in_flight[key] = count
+            else:
+                self._in_flight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._in_flight.clear()
+
+    def stats(self) -> dict:
+        return {"buckets": len(self._buckets), "in_flight_keys": len(self._in_flight)}
+
+
+# Refill and take in one round trip, with the Redis clock shared by every worker.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local taken = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / math.max(rate, 0.001)) + 1)
+return {taken, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """
+    State shared by every worker (and gateway instance) through Redis. When Redis is
+    unreachable requests are admitted (and counted), so the gateway keeps serving.
+    """
+
+    def __init__(self, url=RATE_LIMIT_REDIS_URL, prefix="gateway:ratelimit:", in_flight_ttl=300):
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+        self.in_flight_ttl = in_flight_ttl
+        self.errors = 0
+
+    def take(self, key, rule: Rule) -> tuple:
+        try:
+            taken, tokens = self._take(keys=[f"{self.prefix}bucket:{key}"], args=[rule.rate, rule.burst])
+            return bool(taken), float(tokens)
+        except redis.RedisError as e:
+            self._failed(e)
+            return True, rule.burst
+
+    def acquire(self, key, limit: int) -> bool:
+        name = f"{self.prefix}inflight:{key}"
+        try:
+            pipe = self._redis.pipeline()
+            pipe.incr(name)
+            # Bounds the damage of a worker that dies before releasing.
+            pipe.expire(name, self.in_flight_ttl)
+            count = pipe.execute()[0]
+            if count > limit:
+                self._redis.decr(name)
+                return False
+            return True
+        except redis.RedisError as e:
+            self._failed(e)
+            return True
+
+    def release(self, key):
+        try:
+            self._redis.decr(f"{self.prefix}inflight:{key}")
+        except redis.RedisError as e:
+            self._failed(e)
+
+    def _failed(self, e):
+        self.errors += 1
+        logger.warning("Rate limit backend unavailable, request admitted: %s", e)
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"errors": self.errors}
+
+
+def build_backend(name: str):
+    if name == "redis":
+        if redis is not None:
+            return RedisBackend()
+        logger.warning("RATE_LIMIT_BACKEND=redis but the redis package is not installed; using memory")
+    return MemoryBackend()
+
+
+# ---- Limiter ----
+
+class Lease:
+    """
+    Admission of one request; release() frees its concurrency slot (idempotent).
+    """
+
+    __slots__ = ("_limiter", "_key")
+
+    def __init__(self, limiter, key):
+        self._limiter = limiter
+        self._key = key
+
+    def release(self):
+        if self._key is not None:
+            self._limiter.backend.release(self._key)
+            self._key = None
+
+
+class RateLimiter:
+    """
+    Token bucket per (route, client) plus a cap on the requests a client has in flight
+    across every limited route. Routes without a rule are not limited. Admitting a
+    request is a dict lookup and a bucket update (one script call with Redis).
+    """
+
+    def __init__(self, rules, max_concurrent: int, backend):
+        self.rules = rules
+        self.max_concurrent = max_concurrent
+        self.backend = backend
+        self._prefixes = [(pattern[:-1], rule) for pattern, rule in rules.items() if pattern.endswith("/*")]
+        self._resolved = {}
+
+    def rule_for(self, route: str):
+        rule = self._resolved.get(route, False)
+        if rule is False:
+            rule = self.rules.get(route)
+            if rule is None:
+                rule = next((rule for prefix, rule in self._prefixes if route.startswith(prefix)), None)
+            self._resolved[route] = rule
+        return rule
+
+    def admit(self, route: str, client: str):
+        """
+        Returns a Lease for the request, or None when the route is not limited.
+        Raises RateLimitExceeded when the client is over the route rate or has too
+        many requests in flight.
+        """
+        rule = self.rule_for(route)
+        if rule is None:
+            return None
+        taken, tokens = self.backend.take(f"{rule.pattern}|{client}", rule)
+        if not taken:
+            registry.inc("gateway_rate_limited_total", (("route", route), ("reason", "rate")))
+            raise RateLimitExceeded("Too many requests", rule.retry_after(tokens))
+        if self.max_concurrent <= 0:
+            return Lease(self, None)
+        if not self.backend.acquire(client, self.max_concurrent):
+            registry.inc("gateway_rate_limited_total", (("route", route), ("reason", "concurrency")))
+            raise RateLimitExceeded("Too many concurrent requests", 1)
+        return Lease(self, client)
+
+
+def client_ip(remote_addr, forwarded_for=None) -> str:
+    """
+    Client address; the first X-Forwarded-For entry is only used when the gateway is
+    configured to sit behind a trusted proxy (otherwise any client could pick its key).
+    """
+    if RATE_LIMIT_TRUST_FORWARDED_FOR and forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return remote_addr or "unknown"
+
+
+def client_key(user_id, remote_addr) -> str:
+    """
+    Rate limit key of a request: the token's sub when authenticated, else the client IP.
+    """
+    return f"user:{user_id}" if user_id else f"ip:{remote_addr}"
+
+
+rate_limiter = RateLimiter(parse_rules(RATE_LIMIT_RULES), RATE_LIMIT_MAX_CONCURRENT, build_backend(RATE_LIMIT_BACKEND))
+
+registry.describe("gateway_rate_limited_total", "counter", "Requests rejected with 429, by route and reason.")
@@ -0,0 +1,226 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+
+from config import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_ADAPTIVE_TIMEOUT_ENABLED,
+    HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER,
+    HTTP_ADAPTIVE_TIMEOUT_MIN,
+    HTTP_LATENCY_WINDOW,
+    HTTP_LATENCY_MIN_SAMPLES,
+    HTTP_RETRIES,
+    HTTP_RETRY_BACKOFF_BASE,
+    HTTP_RETRY_BACKOFF_MAX,
+    HTTP_HEDGE_QUANTILE,
+    REQUEST_DEADLINE_SECONDS
+)
+from services.metrics import registry
+
+# Only these methods are retried or hedged: sending them twice has the effect of sending them once.
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+# Budget below which the deadline counts as used up (no call can usefully start in it).
+DEADLINE_MARGIN = 0.01
+# Upstream answers that mean "not processed, try again" (gateway/proxy errors, overload).
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of calling (or waiting any longer for) an upstream when the
+    request's deadline budget is used up.
+    """
+
+    def __init__(self, upstream: str):
+        super().__init__(f"Request deadline exceeded while calling '{upstream}'")
+        self.upstream = upstream
+
+
+def deadline_exceeded(upstream: str) -> DeadlineExceeded:
+    registry.inc("gateway_deadline_exceeded_total", (("upstream", upstream),))
+    return DeadlineExceeded(upstream)
+
+
+# ---- Per-request deadline ----
+
+_deadline = contextvars.ContextVar("gateway_request_deadline", default=None)
+
+
+def start_deadline(seconds: float = REQUEST_DEADLINE_SECONDS):
+    """
+    Starts the deadline budget of the current request: every upstream call it makes,
+    retries included, must finish within `seconds` of now (0 disables it).
+    """
+    _deadline.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def remaining():
+    """
+    Returns the seconds left in the current request's budget, or None without one.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= DEADLINE_MARGIN
+
+
+# ---- Latency tracking ----
+
+class LatencyTracker:
+    """
+    The latencies of the last `window` successful calls of one route, with quantiles
+    recomputed every `window // 10` samples instead of on every lookup.
+    """
+
+    def __init__(self, window=HTTP_LATENCY_WINDOW, min_samples=HTTP_LATENCY_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._refresh_every = max(1, window // 10)
+        self._pending = 0
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._pending += 1
+            if self._pending >= self._refresh_every or self._sorted is None:
+                self._pending = 0
+                self._sorted = sorted(self._samples) if len(self._samples) >= self.min_samples else None
+
+    def quantile(self, q: float):
+        """
+        Returns the q-quantile of the window, or None until there are enough samples.
+        """
+        ordered = self._sorted
+        if ordered is None:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# ---- Policy ----
+
+class UpstreamPolicy:
+    """
+    Timeouts, retries and hedging of one upstream.
+
+    The read timeout of an idempotent route adapts to its observed p99 (times
+    `multiplier`, kept between `min_read_timeout` and `read_timeout`), so a stalled
+    upstream is given up on long before the static limit once the usual latency of
+    the route is known. Idempotent calls that fail with a connection error, a timeout
+    or a 502/503/504 are retried up to `retries` times with exponential backoff and
+    full jitter. Every attempt (and backoff) has to fit in what is left of the
+    request deadline.
+    """
+
+    def __init__(self, name, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=HTTP_RETRIES, backoff_base=HTTP_RETRY_BACKOFF_BASE, backoff_max=HTTP_RETRY_BACKOFF_MAX,
+                 adaptive=HTTP_ADAPTIVE_TIMEOUT_ENABLED, multiplier=HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER,
+                 min_read_timeout=HTTP_ADAPTIVE_TIMEOUT_MIN, hedge_quantile=HTTP_HEDGE_QUANTILE):
+        self.name = name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.adaptive = adaptive
+        self.multiplier = multiplier
+        self.min_read_timeout = min_read_timeout
+        self.hedge_quantile = hedge_quantile
+        self._trackers = {}
+        self._lock = threading.Lock()
+
+    def tracker(self, method: str, path: str) -> LatencyTracker:
+        key = (method, path)
+        tracker = self._trackers.get(key)
+        if tracker is None:
+            with self._lock:
+                tracker = self._trackers.setdefault(key, LatencyTracker())
+        return tracker
+
+    def adaptive_read_timeout(self, method: str, path: str) -> float:
+        # Writes keep the static timeout: their latency depends on the payload, and giving
+        # up on them early would not make them any safer to send again.
+        if self.adaptive and method in RETRY_METHODS:
+            p99 = self.tracker(method, path).quantile(0.99)
+            if p99 is not None:
+                return min(self.read_timeout, max(self.min_read_timeout, p99 * self.multiplier))
+        return self.read_timeout
+
+    def timeouts(self, method: str, path: str):
+        """
+        Returns the (connect, read) timeouts of the next attempt, shortened to the
+        remaining deadline budget. Raises DeadlineExceeded when nothing is left.
+        """
+        connect, read = self.connect_timeout, self.adaptive_read_timeout(method, path)
+        left = remaining()
+        if left is not None:
+            if left <= DEADLINE_MARGIN:
+                raise deadline_exceeded(self.name)
+            connect, read = min(connect, left), min(read, left)
+        return connect, read
+
+    def can_retry(self, method: str, attempt: int) -> bool:
+        return method in RETRY_METHODS and attempt < self.retries
+
+    def backoff(self, attempt: int):
+        """
+        Returns the pause before retry number `attempt` + 1, or None when it would not
+        leave any of the deadline budget for the retry itself.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    def hedge_delay(self, method: str, path: str):
+        """
+        Returns how long to wait for a response before sending a hedged copy of the
+        request (the route's p95), or None while the latency is still unknown.
+        """
+        if method not in RETRY_METHODS:
+            return None
+        return self.tracker(method, path).quantile(self.hedge_quantile)
+
+    def record(self, method: str, path: str, latency: float):
+        self.tracker(method, path).record(latency)
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(name: str) -> UpstreamPolicy:
+    """
+    Returns the resilience policy of an upstream, shared by the sync and async clients.
+    """
+    policy = _policies.get(name)
+    if policy is None:
+        with _policies_lock:
+            policy = _policies.setdefault(name, UpstreamPolicy(name))
+    return policy
+
+
+def _collect_timeouts():
+    samples = []
+    for name, policy in sorted(_policies.items()):
+        for (method, path), tracker in sorted(policy._trackers.items()):
+            if tracker.quantile(0.99) is not None:
+                labels = (("upstream", name), ("method", method), ("path", path))
+                samples.append((labels, round(policy.adaptive_read_timeout(method, path), 4)))
+    return [("gateway_upstream_read_timeout_seconds", "gauge", "Adaptive read timeout per upstream route.", samples)]
+
+
+registry.describe("gateway_upstream_retries_total", "counter", "Upstream calls retried, by upstream and reason.")
+registry.describe("gateway_upstream_hedged_total", "counter", "Hedged upstream requests sent, by upstream and winner.")
+registry.describe("gateway_deadline_exceeded_total", "counter", "Upstream calls given up on because the request deadline ran out.")
+registry.register_collector(_collect_timeouts)
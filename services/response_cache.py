@@ -0,0 +1,129 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    APPOINTMENTS_CACHE_TTL,
+    APPOINTMENTS_CACHE_MAX_ENTRIES,
+    APPOINTMENTS_CACHE_MAX_BYTES
+)
+from services.metrics import registry, cache_collector
+
+
+class CachedResponse:
+    __slots__ = ("body", "content_type", "etag", "expires_at")
+
+    def __init__(self, body: bytes, content_type: str, expires_at: float):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.expires_at = expires_at
+
+    def matches(self, if_none_match: str) -> bool:
+        """
+        Tells whether an If-None-Match header value matches this entry's ETag.
+        """
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+
+class ResponseCache:
+    """
+    Per-user cache of upstream response bodies, with TTL, LRU eviction and a bound on
+    the total size of the cached bodies.
+
+    Writes made by the same user call invalidate(); a per-user generation counter keeps
+    a read that was in flight during the invalidation from caching the stale body.
+    The cache is per process: a write handled by another gunicorn worker does not
+    invalidate it, so that worker's readers can see the old body until the TTL expires.
+    """
+
+    def __init__(self, ttl=APPOINTMENTS_CACHE_TTL, max_entries=APPOINTMENTS_CACHE_MAX_ENTRIES,
+                 max_bytes=APPOINTMENTS_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def generation(self, key):
+        """
+        Token to capture before fetching the body that will be passed to put().
+        """
+        return self._epoch, self._generations.get(key, 0)
+
+    def put(self, key, body: bytes, content_type: str, generation) -> CachedResponse:
+        """
+        Caches a body fetched while the key was at `generation`; returns the entry
+        (also when it is not stored because it went stale or is too big).
+        """
+        entry = CachedResponse(body, content_type, time.monotonic() + self.ttl)
+        if len(body) > self.max_bytes // 4:
+            return entry
+        with self._lock:
+            if (self._epoch, self._generations.get(key, 0)) != generation:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if key in self._entries:
+                self._remove(key)
+            self.invalidations += 1
+            if len(self._generations) > self.max_entries * 4:
+                # Generations only matter while a read is in flight; dropping them bumps the
+                # epoch, so every read in flight at that moment skips caching its body.
+                self._generations = {}
+                self._epoch += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._size
+        }
+
+
+# GET /appointments responses, keyed by user_id.
+appointments_cache = ResponseCache()
+registry.register_collector(cache_collector("appointments", appointments_cache))
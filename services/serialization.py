@@ -0,0 +1,43 @@
+import enum
+import json
+from datetime import datetime
+
+# Optional fast JSON backend, used when installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_converter(o):
+    if isinstance(o, enum.Enum):
+        return o.value
+    if isinstance(o, datetime):
+        return o.isoformat()
+    return str(o)
+
+
+def encode_json(obj) -> bytes:
+    """
+    Serializes a payload straight to the request body bytes, in a single pass,
+    with the json_converter semantics for enums, datetimes and other objects.
+    """
+    if orjson is not None:
+        try:
+            # Datetimes go through json_converter, so the output matches the stdlib path.
+            return orjson.dumps(obj, default=json_converter, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (TypeError, orjson.JSONEncodeError):
+            # e.g. integers wider than 64 bits; the stdlib encoder handles them.
+            pass
+    return json.dumps(obj, default=json_converter, separators=(",", ":")).encode("utf-8")
+
+
+def encode_model(model, update: dict = None) -> bytes:
+    """
+    Encodes a pydantic model (only the fields that were set) into request body bytes,
+    optionally overriding some fields first.
+    """
+    payload = model.dict(exclude_unset=True)
+    if update:
+        payload.update(update)
+    return encode_json(payload)
@@ -0,0 +1,256 @@
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+from config import SHARED_CACHE_BACKEND, SHARED_CACHE_DIR, SHARED_CACHE_NAMESPACE
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MGWC"
+VERSION = 1
+_HEADER = struct.Struct("<4sIII")  # magic, version, slots, slot size
+HEADER_SIZE = 64
+_SEQ = struct.Struct("<Q")
+_ENTRY = struct.Struct("<32sdII")  # key, expires_at, length, crc32
+SLOT_HEADER_SIZE = _SEQ.size + _ENTRY.size
+# Slots probed for a key (and candidates for replacement when storing).
+BUCKET = 4
+
+
+def shared_key(name: str) -> bytes:
+    return hashlib.sha256(name.encode("utf-8")).digest()
+
+
+def _check_private(fd: int, path: str):
+    """
+    Refuses a cache file this user does not own or that others can write to: its
+    entries are trusted as verified tokens, so anyone able to write them could
+    authenticate as any user.
+    """
+    st = os.fstat(fd)
+    if not stat.S_ISREG(st.st_mode) or st.st_uid != os.geteuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ValueError(f"{path} is not a private file of this user")
+
+
+class MmapStore:
+    """
+    Fixed-size hash table in a memory-mapped file, shared by every process that maps
+    it (gunicorn workers, with or without preload). Keys are 32-byte digests; values
+    are bytes of at most slot_size - SLOT_HEADER_SIZE, kept until `expires_at`
+    (wall clock). When the slots of a key are full, the entry closest to expiring
+    is replaced, so the footprint never grows.
+
+    Every slot starts with a sequence number that is odd while the slot is being
+    written. Readers take no lock: they retry nothing and treat a slot whose sequence
+    changed during the read (or whose checksum does not match) as a miss. Writers are
+    serialized with a thread lock plus a POSIX record lock on the file.
+    """
+
+    def __init__(self, path: str, slots: int, slot_size: int):
+        if slot_size <= SLOT_HEADER_SIZE:
+            raise ValueError("slot_size is too small")
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_value_bytes = slot_size - SLOT_HEADER_SIZE
+        self.size = HEADER_SIZE + slots * slot_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        try:
+            _check_private(self._fd, path)
+        except ValueError:
+            os.close(self._fd)
+            raise
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(self._fd, _HEADER.size, 0)
+            expected = _HEADER.pack(MAGIC, VERSION, slots, slot_size)
+            if header != expected or os.fstat(self._fd).st_size != self.size:
+                # New file, or one laid out by another configuration: start empty.
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self.size)
+                os.pwrite(self._fd, expected, 0)
+            self._map = mmap.mmap(self._fd, self.size)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _offsets(self, key: bytes):
+        start = int.from_bytes(key[:8], "little") % self.slots
+        for i in range(min(BUCKET, self.slots)):
+            yield HEADER_SIZE + ((start + i) % self.slots) * self.slot_size
+
+    def get(self, key: bytes):
+        """
+        Returns (value, expires_at), or None when the key is missing or expired.
+        """
+        now = time.time()
+        data = self._map
+        for offset in self._offsets(key):
+            seq = _SEQ.unpack_from(data, offset)[0]
+            slot_key, expires_at, length, crc = _ENTRY.unpack_from(data, offset + _SEQ.size)
+            if slot_key != key:
+                continue
+            if seq & 1 or expires_at <= now or length > self.max_value_bytes:
+                break
+            start = offset + SLOT_HEADER_SIZE
+            value = data[start:start + length]
+            if _SEQ.unpack_from(data, offset)[0] != seq or zlib.crc32(value, zlib.crc32(key)) != crc:
+                break
+            self.hits += 1
+            return value, expires_at
+        self.misses += 1
+        return None
+
+    def put(self, key: bytes, value: bytes, expires_at: float) -> bool:
+        """
+        Stores the value (atomically for readers); False when it does not fit a slot.
+        """
+        if len(value) > self.max_value_bytes:
+            return False
+        data = self._map
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                target = None
+                oldest = None
+                now = time.time()
+                for offset in self._offsets(key):
+                    slot_key, slot_expires = _ENTRY.unpack_from(data, offset + _SEQ.size)[:2]
+                    if slot_key == key or slot_expires <= now:
+                        target = offset
+                        break
+                    if oldest is None or slot_expires < oldest[1]:
+                        oldest = (offset, slot_expires)
+                if target is None:
+                    target = oldest[0]
+                seq = _SEQ.unpack_from(data, target)[0]
+                _SEQ.pack_into(data, target, seq + 1)
+                _ENTRY.pack_into(data, target + _SEQ.size, key, expires_at, len(value), zlib.crc32(value, zlib.crc32(key)))
+                start = target + SLOT_HEADER_SIZE
+                data[start:start + len(value)] = value
+                _SEQ.pack_into(data, target, seq + 2)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return True
+
+    def clear(self):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                for slot in range(self.slots):
+                    offset = HEADER_SIZE + slot * self.slot_size
+                    seq = _SEQ.unpack_from(self._map, offset)[0]
+                    _SEQ.pack_into(self._map, offset, seq + 1)
+                    _ENTRY.pack_into(self._map, offset + _SEQ.size, b"", 0.0, 0, 0)
+                    _SEQ.pack_into(self._map, offset, seq + 2)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        now = time.time()
+        entries = 0
+        for slot in range(self.slots):
+            if _ENTRY.unpack_from(self._map, HEADER_SIZE + slot * self.slot_size + _SEQ.size)[1] > now:
+                entries += 1
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "capacity": self.slots, "bytes": self.size}
+
+
+class MemoryStore:
+    """
+    In-process stand-in for MmapStore with the same interface (and the same fixed
+    number of slots), for development or platforms without shared memory.
+    """
+
+    def __init__(self, slots: int, slot_size: int):
+        self.slots = slots
+        self.max_value_bytes = slot_size - SLOT_HEADER_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key: bytes, value: bytes, expires_at: float) -> bool:
+        if len(value) > self.max_value_bytes:
+            return False
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.slots:
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][1])]
+            self._entries[key] = (bytes(value), expires_at)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "capacity": self.slots}
+
+
+def _directory() -> str:
+    if SHARED_CACHE_DIR:
+        return SHARED_CACHE_DIR
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+_stores = {}
+
+
+def open_store(name: str, slots: int, slot_size: int):
+    """
+    Returns the shared store `name` for the configured backend (mmap, memory or none),
+    opening it on first use.
+    A store that cannot be mapped is replaced by None (no sharing) with a warning.
+    """
+    if SHARED_CACHE_BACKEND == "none" or slots <= 0:
+        return None
+    if name in _stores:
+        return _stores[name]
+    if SHARED_CACHE_BACKEND == "memory":
+        store = MemoryStore(slots, slot_size)
+    else:
+        # The namespace keeps gateways with different Cognito settings on one host apart.
+        namespace = hashlib.sha256(SHARED_CACHE_NAMESPACE.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(_directory(), f"micro-gateway-{namespace}-{name}.cache")
+        try:
+            store = MmapStore(path, slots, slot_size)
+        except (OSError, ValueError) as e:
+            logger.warning("Shared cache %s unavailable, using a per-process cache: %s", name, e)
+            return None
+    _stores[name] = store
+    return store
+
+
+def _collect():
+    families = {
+        "gateway_shared_cache_hits_total": ("counter", "Lookups served by the cross-process cache (this process).", "hits"),
+        "gateway_shared_cache_misses_total": ("counter", "Lookups not found in the cross-process cache (this process).", "misses"),
+        "gateway_shared_cache_entries": ("gauge", "Live entries in the cross-process cache (all processes).", "entries"),
+        "gateway_shared_cache_capacity": ("gauge", "Slots of the cross-process cache.", "capacity"),
+    }
+    stats = {name: store.stats() for name, store in _stores.items()}
+    return [
+        (metric, kind, help_text, [((("cache", name),), values[field]) for name, values in stats.items()])
+        for metric, (kind, help_text, field) in families.items()
+    ]
+
+
+registry.register_collector(_collect)
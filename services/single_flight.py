@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import threading
+
+from services.metrics import registry
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls: while a call for a key is in flight, other
+    callers with the same key wait for it and get its result (or its exception)
+    instead of starting their own. Only use it for idempotent reads.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self._executed = 0
+        self._collapsed = 0
+
+    def do(self, key, fn):
+        """
+        Runs fn() unless a call for the same key is already in flight, in which case
+        it waits for that call and returns its result.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._executed += 1
+            else:
+                self._collapsed += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key, coro_fn):
+        """
+        Async version of do(): awaits coro_fn() once per key for all concurrent callers.
+        The shared call runs in its own task, so a cancelled caller does not cancel it
+        for the others.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._async_calls.get(loop_key)
+            if task is not None:
+                self._collapsed += 1
+            else:
+                task = asyncio.ensure_future(coro_fn())
+                self._async_calls[loop_key] = task
+                self._executed += 1
+                task.add_done_callback(lambda _: self._forget_async(loop_key, task))
+        return await asyncio.shield(task)
+
+    def _forget_async(self, loop_key, task):
+        with self._lock:
+            if self._async_calls.get(loop_key) is task:
+                del self._async_calls[loop_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "executed": self._executed,
+                "collapsed": self._collapsed,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """
+    Returns the process-wide SingleFlight group for a route or upstream call.
+    """
+    flight = _flights.get(name)
+    if flight is None:
+        with _flights_lock:
+            flight = _flights.setdefault(name, SingleFlight(name))
+    return flight
+
+
+def credential_key(user_id, authorization: str):
+    """
+    Key of a per-user read: only calls made with the same Authorization share a response.
+    """
+    return user_id, hashlib.sha256(authorization.encode("utf-8")).digest()
+
+
+def single_flight_snapshot() -> dict:
+    return {name: flight.stats() for name, flight in sorted(_flights.items())}
+
+
+def _collect_single_flight():
+    stats = single_flight_snapshot()
+    return [
+        ("gateway_single_flight_executed_total", "counter", "Calls that went to the upstream.",
+         [((("route", name),), stat["executed"]) for name, stat in stats.items()]),
+        ("gateway_single_flight_collapsed_total", "counter", "Identical concurrent calls served by another call.",
+         [((("route", name),), stat["collapsed"]) for name, stat in stats.items()]),
+    ]
+
+
+registry.register_collector(_collect_single_flight)
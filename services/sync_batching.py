@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import SYNC_BATCH_MAX_ITEMS, SYNC_BATCH_MAX_BYTES, SYNC_BATCH_PARALLELISM
+from services.circuit_breaker import CircuitOpenError
+from services.resilience import DeadlineExceeded
+from services.serialization import encode_json
+
+
+class SyncChunk:
+    """
+    A slice of a process-sync batch: the original item positions and their encoded bytes.
+    """
+
+    def __init__(self):
+        self.indexes = []
+        self.ids = []
+        self.encoded = []
+        self.size = 0
+
+    def add(self, index, item_id, encoded: bytes):
+        self.indexes.append(index)
+        self.ids.append(item_id)
+        self.encoded.append(encoded)
+        self.size += len(encoded) + 1
+
+    def body(self) -> bytes:
+        # Items are encoded once, when planning; the request body is only a join.
+        return b'{"items":[' + b",".join(self.encoded) + b"]}"
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+def plan_chunks(items, max_items=SYNC_BATCH_MAX_ITEMS, max_bytes=SYNC_BATCH_MAX_BYTES):
+    """
+    Splits the sync items into chunks bounded by item count and encoded size.
+
+    Items sharing the same "id" touch the same entity, so they always go to the same
+    chunk (a single entity larger than a chunk is kept whole). Grouping only decides
+    the chunk of an item: inside a chunk, items keep the request order.
+    """
+    groups = {}
+    for index, item in enumerate(items):
+        groups.setdefault(item.get("id"), []).append((index, encode_json(item)))
+
+    planned = []
+    current, count, size = [], 0, 0
+    for item_id, group in groups.items():
+        group_size = sum(len(encoded) + 1 for _, encoded in group)
+        if count and (count + len(group) > max_items or size + group_size > max_bytes):
+            planned.append(current)
+            current, count, size = [], 0, 0
+        current.extend((index, item_id, encoded) for index, encoded in group)
+        count += len(group)
+        size += group_size
+    if current:
+        planned.append(current)
+
+    chunks = []
+    for entries in planned:
+        chunk = SyncChunk()
+        for index, item_id, encoded in sorted(entries, key=lambda entry: entry[0]):
+            chunk.add(index, item_id, encoded)
+        chunks.append(chunk)
+    return chunks
+
+
+def _chunk_errors(chunk, msg):
+    return [{"id": item_id, "error": msg} for item_id in chunk.ids]
+
+
+def _failure_outcome(e):
+    if isinstance(e, CircuitOpenError):
+        status = 503
+    elif isinstance(e, DeadlineExceeded):
+        status = 504
+    else:
+        status = 502
+    return {"status": "error", "msg": str(e)}, status
+
+
+def merge_results(chunks, outcomes, total):
+    """
+    Merges per-chunk outcomes, (response_data, status_code) or the exception of a chunk
+    that never got a response, back into one process-sync response, with the per-item
+    results in the original item order. The status is the worst one of the chunks.
+
+    When no chunk got a response, the exception of the first one is raised, so the
+    outage is answered like the one of an unbatched call (503 with Retry-After while
+    the circuit is open, 504 past the deadline).
+    """
+    failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    if failures and len(failures) == len(outcomes):
+        raise failures[0]
+    merged = [None] * total
+    response_data = None
+    status_code = 200
+    for chunk, outcome in zip(chunks, outcomes):
+        data, status = _failure_outcome(outcome) if isinstance(outcome, Exception) else outcome
+        results = data.get("data") if isinstance(data, dict) else None
+        if not isinstance(results, list) or len(results) != len(chunk):
+            msg = data.get("msg") if isinstance(data, dict) and data.get("msg") else "Unexpected response from micro-queue-api"
+            results = _chunk_errors(chunk, msg)
+        elif response_data is None and status < 300:
+            response_data = data
+        for index, result in zip(chunk.indexes, results):
+            merged[index] = result
+        if status >= 300 and status > status_code:
+            status_code = status
+    response_data = dict(response_data or {"status": "ok"})
+    response_data["data"] = merged
+    return response_data, status_code
+
+
+def _send_chunk(client, chunk, headers):
+    try:
+        response = client.post("/process-sync", data=chunk.body(), headers=headers)
+        return response.json(), response.status_code
+    except Exception as e:
+        return e
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    # Worker threads do not survive a fork, so the pool is created per process.
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=SYNC_BATCH_PARALLELISM, thread_name_prefix="sync-batch")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def send_chunks(client, chunks, headers, total):
+    """
+    Sends the chunks concurrently (at most SYNC_BATCH_PARALLELISM at a time)
+    and returns the merged (response_data, status_code). Raises the upstream error
+    when every chunk failed without a response.
+    """
+    # Each chunk runs in a copy of the caller's context, so its upstream call joins the request trace.
+    futures = [
+        get_executor().submit(contextvars.copy_context().run, _send_chunk, client, chunk, headers)
+        for chunk in chunks
+    ]
+    return merge_results(chunks, [future.result() for future in futures], total)
+
+
+async def send_chunks_async(client, chunks, headers, total):
+    """
+    Async version of send_chunks, for the ASGI mode.
+    """
+    semaphore = asyncio.Semaphore(SYNC_BATCH_PARALLELISM)
+
+    async def send(chunk):
+        async with semaphore:
+            try:
+                response = await client.post("/process-sync", content=chunk.body(), headers=headers)
+                return response.json(), response.status_code
+            except Exception as e:
+                return e
+
+    outcomes = await asyncio.gather(*(send(chunk) for chunk in chunks))
+    return merge_results(chunks, outcomes, total)
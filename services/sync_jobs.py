@@ -0,0 +1,515 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import (
+    SYNC_JOBS_MODE,
+    SYNC_JOBS_DIR,
+    SYNC_JOBS_WORKERS,
+    SYNC_JOBS_MAX_PENDING,
+    SYNC_JOBS_MAX_ATTEMPTS,
+    SYNC_JOBS_LEASE,
+    SYNC_JOBS_RETENTION,
+    SYNC_JOBS_FSYNC,
+    SYNC_JOBS_COMPACT_BYTES,
+    SYNC_JOBS_POLL_INTERVAL,
+    SYNC_JOBS_SERVICE_TOKEN
+)
+from services.circuit_breaker import CircuitOpenError
+from services.jwt_verifier import b64url_decode
+from services.metrics import registry
+from services.serialization import encode_json
+
+logger = logging.getLogger(__name__)
+
+# Retry-After of a 503 while the queue is full.
+QUEUE_FULL_RETRY_AFTER = 10
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+def wants_async(prefer_header) -> bool:
+    """
+    Tells whether a process-sync request is to be accepted as a job: always in the
+    "always" mode, and with "Prefer: respond-async" (RFC 7240) in the "prefer" mode.
+    """
+    if SYNC_JOBS_MODE == "always":
+        return True
+    if SYNC_JOBS_MODE != "prefer" or not prefer_header:
+        return False
+    return any(part.strip().lower() == "respond-async" for part in prefer_header.split(","))
+
+
+def token_expiry(auth_value: str):
+    """
+    Returns the "exp" claim of an already verified "Bearer <JWT>" header, or None.
+    """
+    try:
+        claims = json.loads(b64url_decode(auth_value.split(" ", 1)[1].split(".")[1]))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class QueueFull(Exception):
+    """
+    Raised instead of accepting a job while too many are waiting to be sent.
+    """
+
+    def __init__(self, pending: int, retry_after: int):
+        super().__init__(f"Too many sync jobs waiting ({pending}), retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class SyncJob:
+    """
+    Index entry of a job: its state and where its payload (and result) are in the log.
+    """
+
+    __slots__ = ("id", "user_id", "size", "created_at", "auth_expires_at", "state", "attempts", "lease_until",
+                 "not_before", "finished_at", "status_code", "payload_at", "result_at")
+
+    def __init__(self, job_id, user_id, size, created_at, payload_at, auth_expires_at=None):
+        self.id = job_id
+        self.user_id = user_id
+        self.size = size
+        self.created_at = created_at
+        self.auth_expires_at = auth_expires_at
+        self.state = QUEUED
+        self.attempts = 0
+        self.lease_until = 0.0
+        self.not_before = 0.0
+        self.finished_at = None
+        self.status_code = None
+        self.payload_at = payload_at
+        self.result_at = None
+
+    def runnable(self, now: float) -> bool:
+        if self.state == QUEUED:
+            return self.not_before <= now
+        # A job whose worker died (lease expired) is picked up again.
+        return self.state == RUNNING and self.lease_until <= now
+
+    def header(self) -> dict:
+        return {
+            "id": self.id, "user_id": self.user_id, "size": self.size, "created_at": self.created_at,
+            "auth_expires_at": self.auth_expires_at, "state": self.state, "attempts": self.attempts, "lease_until": self.lease_until,
+            "not_before": self.not_before, "finished_at": self.finished_at, "status_code": self.status_code,
+        }
+
+
+class JobLog:
+    """
+    Durable append-only log of process-sync jobs, shared by every process that opens
+    the same file (gunicorn workers).
+
+    Each line is a JSON header, optionally followed by a tab and a JSON payload (the
+    items of a new job, or the result of a finished one):
+    JSON never contains a raw tab, and only the headers are parsed to index the jobs,
+    so payloads are read back from their offset when needed. Writers append whole
+    lines under a POSIX record lock on the file; every process keeps its own index up
+    to date by reading the lines appended since it last looked. When the file grows
+    past `compact_bytes` it is rewritten without the jobs finished more than
+    `retention` seconds ago, and the other processes notice the new file and reindex.
+    """
+
+    def __init__(self, path: str, retention=SYNC_JOBS_RETENTION, compact_bytes=SYNC_JOBS_COMPACT_BYTES,
+                 fsync=SYNC_JOBS_FSYNC):
+        self.path = path
+        self.retention = retention
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.jobs = {}
+        self._pending = OrderedDict()
+        self._fd = None
+        self._ino = None
+        self._offset = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._reopen()
+
+    def _reopen(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        self._ino = os.fstat(self._fd).st_ino
+        self.jobs = {}
+        self._pending = OrderedDict()
+        self._offset = 0
+
+    @contextmanager
+    def _exclusive(self):
+        # The file may have been replaced by a compaction while we waited for the lock.
+        while True:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                current = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == self._ino:
+                break
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            self._reopen()
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """
+        Applies the lines appended since the last call (the caller holds self._lock).
+        """
+        try:
+            if os.stat(self.path).st_ino != self._ino:
+                self._reopen()
+        except FileNotFoundError:
+            return
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return
+        data = os.pread(self._fd, size - self._offset, self._offset)
+        end = data.rfind(b"\n")
+        if end < 0:
+            return
+        position = 0
+        while position <= end:
+            newline = data.index(b"\n", position)
+            line = data[position:newline]
+            header, tab, _ = line.partition(b"\t")
+            try:
+                self._apply(json.loads(header), self._offset + position + len(header) + 1 if tab else None)
+            except (ValueError, KeyError, TypeError):
+                # A line torn by a crash in the middle of a write.
+                logger.warning("Skipping unreadable sync job log record at offset %d", self._offset + position)
+            position = newline + 1
+        self._offset += end + 1
+
+    def _apply(self, record: dict, payload_at):
+        op = record["op"]
+        if op == "enqueue":
+            job = SyncJob(record["id"], record["user_id"], record["size"], record["at"], payload_at,
+                          record.get("auth_expires_at"))
+            self.jobs[job.id] = job
+            self._pending[job.id] = job
+            return
+        if op == "snapshot":
+            job = SyncJob(record["id"], record["user_id"], record["size"], record["created_at"], None,
+                          record.get("auth_expires_at"))
+            for field in ("state", "attempts", "lease_until", "not_before", "finished_at", "status_code"):
+                setattr(job, field, record[field])
+            if job.state == DONE:
+                job.result_at = payload_at
+            else:
+                job.payload_at = payload_at
+                self._pending[job.id] = job
+            self.jobs[job.id] = job
+            return
+        job = self.jobs.get(record["id"])
+        if job is None:
+            return
+        if op == "start":
+            job.state = RUNNING
+            job.attempts = record["attempt"]
+            job.lease_until = record["lease_until"]
+        elif op == "retry":
+            job.state = QUEUED
+            job.not_before = record["not_before"]
+        elif op == "finish":
+            job.state = DONE
+            job.finished_at = record["at"]
+            job.status_code = record["status"]
+            job.result_at = payload_at
+            self._pending.pop(job.id, None)
+
+    def _append_locked(self, record: dict, payload=None):
+        """
+        Appends a record (the caller holds self._lock and the file lock, and has synced).
+        """
+        size = os.fstat(self._fd).st_size
+        if size > self._offset:
+            # Leftover of a write torn by a crash: terminate it so it is skipped.
+            os.write(self._fd, b"\n")
+            self._sync()
+        header = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        line = header + (b"\t" + payload if payload is not None else b"") + b"\n"
+        os.write(self._fd, line)
+        if self.fsync:
+            os.fsync(self._fd)
+        self._apply(record, self._offset + len(header) + 1 if payload is not None else None)
+        self._offset += len(line)
+
+    def _read_payload(self, offset):
+        if offset is None:
+            return None
+        chunks = []
+        while True:
+            chunk = os.pread(self._fd, 65536, offset)
+            end = chunk.find(b"\n")
+            if end >= 0 or not chunk:
+                chunks.append(chunk[:end] if end >= 0 else chunk)
+                break
+            chunks.append(chunk)
+            offset += len(chunk)
+        return json.loads(b"".join(chunks))
+
+    # ---- Operations ----
+
+    def enqueue(self, user_id: str, items: list, max_pending: int, auth_expires_at=None) -> SyncJob:
+        job_id = uuid.uuid4().hex
+        payload = encode_json({"items": items})
+        with self._lock, self._exclusive():
+            self._sync()
+            if len(self._pending) >= max_pending:
+                raise QueueFull(len(self._pending), QUEUE_FULL_RETRY_AFTER)
+            self._append_locked(
+                {"op": "enqueue", "id": job_id, "user_id": user_id, "size": len(items), "at": time.time(),
+                 "auth_expires_at": auth_expires_at}, payload
+            )
+            return self.jobs[job_id]
+
+    def claim(self, lease: float, can_run=None):
+        """
+        Marks the oldest runnable job accepted by `can_run(job, now)` as running (for
+        `lease` seconds) and returns it with its payload, or (None, None) when there is
+        nothing to do.
+        """
+        with self._lock, self._exclusive():
+            self._sync()
+            now = time.time()
+            for job in self._pending.values():
+                if job.runnable(now) and (can_run is None or can_run(job, now)):
+                    self._append_locked({
+                        "op": "start", "id": job.id, "attempt": job.attempts + 1,
+                        "lease_until": now + lease, "at": now
+                    })
+                    return job, self._read_payload(job.payload_at)
+        return None, None
+
+    def retry(self, job: SyncJob, delay: float):
+        with self._lock, self._exclusive():
+            self._sync()
+            self._append_locked({"op": "retry", "id": job.id, "not_before": time.time() + delay})
+
+    def finish(self, job: SyncJob, status: int, result: dict):
+        with self._lock, self._exclusive():
+            self._sync()
+            self._append_locked({"op": "finish", "id": job.id, "status": status, "at": time.time()}, encode_json(result))
+            if os.fstat(self._fd).st_size > self.compact_bytes:
+                self._compact_locked()
+
+    def lookup(self, job_id: str):
+        """
+        Returns (job, result) for a job id, result being None until the job is done.
+        """
+        with self._lock:
+            self._sync()
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None, None
+            return job, self._read_payload(job.result_at) if job.state == DONE else None
+
+    def counts(self) -> dict:
+        with self._lock:
+            self._sync()
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0}
+            for job in self.jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def _compact_locked(self):
+        now = time.time()
+        temporary = f"{self.path}.compact"
+        with open(temporary, "wb") as out:
+            for job in self.jobs.values():
+                if job.state == DONE and job.finished_at + self.retention < now:
+                    continue
+                offset = job.result_at if job.state == DONE else job.payload_at
+                payload = self._read_payload(offset)
+                header = dict(job.header(), op="snapshot")
+                out.write(json.dumps(header, separators=(",", ":")).encode("utf-8"))
+                if payload is not None:
+                    out.write(b"\t" + encode_json(payload))
+                out.write(b"\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(temporary, 0o600)
+        os.replace(temporary, self.path)
+        # Still holding the lock of the old file: processes waiting on it will see the new inode.
+        old_fd = self._fd
+        self._fd = None
+        self._reopen()
+        self._sync()
+        os.close(old_fd)
+
+
+class SyncJobQueue:
+    """
+    Accept-and-enqueue mode of process-sync: batches are written to the JobLog and
+    sent to the micro-queue-api by background worker threads (in every process), so
+    the client gets 202 right away and polls the job for the per-item results.
+
+    `runner(user_id, auth_value, items)` sends a batch and returns the (body, status)
+    the synchronous route would have answered. Failed attempts (exceptions and 5xx)
+    are retried with exponential backoff up to `max_attempts` times. A job whose
+    worker died mid-attempt is picked up again once its lease expires, so jobs are
+    sent at least once.
+
+    The client's Authorization header is never written to the log: it is kept in the
+    memory of the process that accepted the job, until the job is done or the token
+    expires, and only that process runs the job. With a `service_token`, jobs are
+    sent with it instead (the items already carry the user_id), so any process can
+    run them, including after a restart. A job nobody holds credentials for anymore
+    is finished with 401 once its token has expired.
+    """
+
+    def __init__(self, log: JobLog, workers=SYNC_JOBS_WORKERS, max_pending=SYNC_JOBS_MAX_PENDING,
+                 max_attempts=SYNC_JOBS_MAX_ATTEMPTS, lease=SYNC_JOBS_LEASE, poll_interval=SYNC_JOBS_POLL_INTERVAL,
+                 service_token=SYNC_JOBS_SERVICE_TOKEN):
+        self.log = log
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.runner = None
+        self.service_auth = f"Bearer {service_token}" if service_token else None
+        self._credentials = {}
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def enqueue(self, user_id: str, auth_value: str, items: list) -> SyncJob:
+        """
+        Durably records the batch and returns its job. Raises QueueFull.
+        """
+        try:
+            job = self.log.enqueue(user_id, items, self.max_pending, token_expiry(auth_value))
+        except QueueFull:
+            registry.inc("gateway_sync_jobs_total", (("outcome", "rejected"),))
+            raise
+        if self.service_auth is None:
+            self._credentials[job.id] = auth_value
+        registry.inc("gateway_sync_jobs_total", (("outcome", "accepted"),))
+        self._wakeup.set()
+        return job
+
+    def lookup(self, job_id: str, user_id: str):
+        """
+        Returns the public view of a job of this user, or None.
+        """
+        job, result = self.log.lookup(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        view = {
+            "id": job.id,
+            "state": job.state,
+            "items": job.size,
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+        }
+        if job.state == DONE:
+            view.update(finished_at=job.finished_at, status_code=job.status_code, result=result)
+        return view
+
+    def start(self, runner=None):
+        """
+        Starts the worker threads of this process (again after a fork), once the
+        runner is known.
+        """
+        if runner is not None:
+            self.runner = runner
+        if self._pid == os.getpid() or self.workers <= 0 or self.runner is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Credentials of the parent's jobs are not this process's to use.
+                self._credentials = {}
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"sync-jobs-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _can_run(self, job: SyncJob, now: float) -> bool:
+        if self.service_auth is not None or job.id in self._credentials:
+            return True
+        # Nobody can send it anymore: any process may finish it as expired.
+        return job.auth_expires_at is not None and job.auth_expires_at <= now
+
+    def _work(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            try:
+                job, payload = self.log.claim(self.lease, self._can_run)
+            except Exception as e:
+                logger.warning("Could not read the sync job log: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job, payload)
+            except Exception:
+                # The job's lease expires and it is picked up again; the worker keeps going.
+                logger.exception("Sync job %s could not be recorded", job.id)
+                self._wakeup.wait(self.poll_interval)
+
+    def _run(self, job: SyncJob, payload: dict):
+        auth_value = self.service_auth or self._credentials.get(job.id)
+        if self.service_auth is None and job.auth_expires_at is not None and job.auth_expires_at <= time.time():
+            auth_value = None
+        if auth_value is None:
+            status, data = 401, {
+                "status": "error", "msg": "The access token of the job expired before it was sent, send the batch again.",
+                "data": {}
+            }
+        else:
+            try:
+                data, status = self.runner(job.user_id, auth_value, payload["items"])
+            except Exception as e:
+                status = 503 if isinstance(e, CircuitOpenError) else 502
+                data = {"status": "error", "msg": str(e), "data": {}}
+            if status >= 500 and job.attempts < self.max_attempts:
+                registry.inc("gateway_sync_jobs_total", (("outcome", "retried"),))
+                self.log.retry(job, min(60.0, 2.0 ** job.attempts))
+                return
+        registry.inc("gateway_sync_jobs_total", (("outcome", "succeeded" if status < 300 else "failed"),))
+        self.log.finish(job, status, data)
+        self._credentials.pop(job.id, None)
+
+
+def _open_queue():
+    if SYNC_JOBS_MODE == "off":
+        return None
+    return SyncJobQueue(JobLog(os.path.join(SYNC_JOBS_DIR, "sync-jobs.log")))
+
+
+# Process-wide job queue (None unless SYNC_JOBS_MODE is "prefer" or "always").
+sync_jobs = _open_queue()
+
+
+def _collect():
+    if sync_jobs is None:
+        return []
+    counts = sync_jobs.log.counts()
+    return [("gateway_sync_jobs", "gauge", "Sync jobs in the job log, by state (all processes).",
+             [((("state", state),), count) for state, count in counts.items()])]
+
+
+registry.describe("gateway_sync_jobs_total", "counter", "Sync jobs accepted, rejected, retried and finished by this process.")
+registry.register_collector(_collect)
@@ -0,0 +1,326 @@
+import codecs
+import json
+
+from pydantic import ValidationError
+
+from config import SYNC_MAX_BODY_BYTES, SYNC_MAX_ITEMS, SYNC_STREAM_CHUNK_SIZE
+from schemas.queue import ProcessSyncSchema, SyncItem
+from services.serialization import encode_json
+
+_WHITESPACE = " \t\r\n"
+
+
+class SyncStreamError(Exception):
+    """
+    Raised while streaming a process-sync body; carries the HTTP status and JSON body to return.
+    """
+
+    def __init__(self, status: int, body: bytes):
+        super().__init__(body.decode("utf-8", "replace"))
+        self.status = status
+        self.body = body
+
+    @classmethod
+    def from_msg(cls, status: int, msg: str):
+        return cls(status, encode_json({"status": "error", "msg": msg, "data": {}}))
+
+
+class SyncItemParser:
+    """
+    Incremental parser for a {"items": [...]} document.
+
+    Bytes are pushed with feed() as they arrive and every complete element of the
+    "items" array is returned as soon as it has been read; only the element being
+    parsed is kept in memory. Other top-level keys are parsed and discarded.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._eof = False
+        self.found_items = False
+        self.done = False
+
+    def feed(self, data: bytes) -> list:
+        self._buf = self._buf[self._pos:] + self._utf8.decode(data)
+        self._pos = 0
+        return list(self._parse())
+
+    def close(self) -> list:
+        self._buf = self._buf[self._pos:] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        items = list(self._parse())
+        if not self.done or self._skip_whitespace():
+            raise ValueError("Invalid JSON body")
+        return items
+
+    def _skip_whitespace(self) -> bool:
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos < len(buf)
+
+    def _decode_value(self):
+        # Returns (complete, value); complete is False when more bytes are needed.
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise ValueError("Invalid JSON body")
+            return False, None
+        if end == len(self._buf) and not self._eof and not isinstance(value, (dict, list, str)):
+            # A number or literal at the end of the buffer may still continue.
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _expect(self, char):
+        if self._buf[self._pos] != char:
+            raise ValueError("Invalid JSON body")
+        self._pos += 1
+
+    def _parse(self):
+        while not self.done and self._skip_whitespace():
+            state = self._state
+            char = self._buf[self._pos]
+            if state == "start":
+                self._expect("{")
+                self._state = "key"
+            elif state == "key":
+                if char == "}":
+                    self._pos += 1
+                    self.done = True
+                    continue
+                complete, key = self._decode_value()
+                if not complete:
+                    return
+                if not isinstance(key, str):
+                    raise ValueError("Invalid JSON body")
+                self._key = key
+                self._state = "colon"
+            elif state == "colon":
+                self._expect(":")
+                self._state = "items" if self._key == "items" and not self.found_items else "value"
+            elif state == "value":
+                complete, _ = self._decode_value()
+                if not complete:
+                    return
+                self._state = "after_value"
+            elif state == "items":
+                if char != "[":
+                    raise ValueError("The 'items' field must be a list")
+                self._pos += 1
+                self.found_items = True
+                self._state = "first_item"
+            elif state in ("first_item", "item"):
+                if char == "]" and state == "first_item":
+                    self._pos += 1
+                    self._state = "after_value"
+                    continue
+                complete, item = self._decode_value()
+                if not complete:
+                    return
+                self._state = "after_item"
+                yield item
+            elif state == "after_item":
+                self._expect("," if char == "," else "]")
+                self._state = "item" if char == "," else "after_value"
+            elif state == "after_value":
+                self._expect("," if char == "," else "}")
+                if char == ",":
+                    self._state = "key"
+                else:
+                    self.done = True
+
+
+class SyncStreamEncoder:
+    """
+    Turns the incoming process-sync body, chunk by chunk, into the outgoing request body:
+    each item is validated as a SyncItem, gets the user_id and is encoded right away.
+    Enforces the maximum body size and item count. With a SyncItemDedup, items whose
+    result is already known are left out of the outgoing body.
+
+    Errors carry the status and body of the buffered route: 422 with the pydantic
+    errors for a body that is not a valid process-sync object, 413 past the limits.
+    """
+
+    def __init__(self, user_id: str, max_bytes: int = SYNC_MAX_BODY_BYTES, max_items: int = SYNC_MAX_ITEMS,
+                 dedup=None):
+        self.user_id = user_id
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.dedup = dedup
+        self.received = 0
+        self.count = 0
+        self.forwarded = 0
+        self.domains = set()
+        self.error = None
+        self.finished = False
+        self._parser = SyncItemParser()
+        # Raw bytes read before the first item, to report a bad body like the buffered route.
+        self._head = bytearray()
+
+    @property
+    def started(self) -> bool:
+        """
+        True once the first item has been validated (or the whole body read).
+        """
+        return self.count > 0 or self.finished
+
+    def start(self) -> bytes:
+        return b'{"items":['
+
+    def feed(self, data: bytes) -> bytes:
+        self.received += len(data)
+        if self.received > self.max_bytes:
+            raise SyncStreamError.from_msg(413, "Request body too large")
+        if self._head is not None:
+            self._head += data
+        try:
+            items = self._parser.feed(data)
+        except ValueError:
+            raise self._invalid_body()
+        if items:
+            self._head = None
+        return b"".join(self._encode_item(item) for item in items)
+
+    def finish(self) -> bytes:
+        try:
+            items = self._parser.close()
+        except ValueError:
+            raise self._invalid_body()
+        self.finished = True
+        out = b"".join(self._encode_item(item) for item in items)
+        if not self._parser.found_items:
+            try:
+                ProcessSyncSchema.parse_obj({})
+            except ValidationError as e:
+                raise SyncStreamError(422, e.json().encode("utf-8"))
+        return out + b"]}"
+
+    def _invalid_body(self) -> SyncStreamError:
+        # flask-openapi3 validates a body it cannot decode as null; when the whole body
+        # was read before the first item (a small one), the decoded value gives the exact error.
+        value = None
+        if self._head:
+            try:
+                value = json.loads(bytes(self._head))
+            except ValueError:
+                pass
+        try:
+            ProcessSyncSchema.parse_obj(value)
+        except ValidationError as e:
+            return SyncStreamError(422, e.json().encode("utf-8"))
+        return SyncStreamError.from_msg(422, "Invalid JSON body")
+
+    def _encode_item(self, obj) -> bytes:
+        index = self.count
+        self.count += 1
+        if self.count > self.max_items:
+            raise SyncStreamError.from_msg(413, f"Too many items (maximum is {self.max_items})")
+        try:
+            item = SyncItem.parse_obj(obj).dict()
+        except ValidationError as e:
+            # Same format flask-openapi3 returns, with the location inside the batch.
+            errors = json.loads(e.json())
+            for error in errors:
+                error["loc"] = ["items", index] + error["loc"]
+            raise SyncStreamError(422, json.dumps(errors, separators=(",", ":")).encode("utf-8"))
+        item["data"]["user_id"] = self.user_id
+        if self.dedup is not None and not self.dedup.forward(item):
+            return b""
+        self.domains.add(item["domain"])
+        self.forwarded += 1
+        return (b"," if self.forwarded > 1 else b"") + encode_json(item)
+
+
+def read_sync_head(stream, encoder: SyncStreamEncoder, chunk_size: int = SYNC_STREAM_CHUNK_SIZE) -> bytes:
+    """
+    Reads the client body from `stream` until its first item is validated (or the body
+    ends) and returns the rewritten body so far. Called before the upstream request is
+    opened, so a body that is not a process-sync object, or whose first item is
+    invalid, is rejected without an upstream call. A failure is kept in encoder.error.
+    """
+    try:
+        out = [encoder.start()]
+        while not encoder.started:
+            data = stream.read(chunk_size)
+            out.append(encoder.feed(data) if data else encoder.finish())
+        return b"".join(out)
+    except Exception as e:
+        encoder.error = e
+        raise
+
+
+def iter_sync_body(stream, encoder: SyncStreamEncoder, head: bytes, chunk_size: int = SYNC_STREAM_CHUNK_SIZE):
+    """
+    Generator used as the upstream request body: yields `head` (from read_sync_head),
+    then reads the rest of the client body from `stream` and yields it rewritten. A
+    failure is kept in encoder.error; it aborts the upstream request already sent.
+    """
+    try:
+        yield head
+        if encoder.finished:
+            return
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            out = encoder.feed(data)
+            if out:
+                yield out
+        yield encoder.finish()
+    except Exception as e:
+        encoder.error = e
+        raise
+
+
+async def _receive_body(receive):
+    message = await receive()
+    if message["type"] == "http.disconnect":
+        raise SyncStreamError.from_msg(400, "Client disconnected")
+    return message.get("body", b""), message.get("more_body", False)
+
+
+async def aread_sync_head(receive, encoder: SyncStreamEncoder):
+    """
+    Async version of read_sync_head, reading from the ASGI receive channel. Returns
+    (head, more_body).
+    """
+    try:
+        out = [encoder.start()]
+        more_body = True
+        while more_body and not encoder.started:
+            data, more_body = await _receive_body(receive)
+            out.append(encoder.feed(data))
+        if not more_body and not encoder.finished:
+            out.append(encoder.finish())
+        return b"".join(out), more_body
+    except Exception as e:
+        encoder.error = e
+        raise
+
+
+async def aiter_sync_body(receive, encoder: SyncStreamEncoder, head: bytes, more_body: bool):
+    """
+    Async version of iter_sync_body, reading the rest of the body from the ASGI
+    receive channel.
+    """
+    try:
+        yield head
+        while more_body:
+            data, more_body = await _receive_body(receive)
+            out = encoder.feed(data)
+            if out:
+                yield out
+        if not encoder.finished:
+            yield encoder.finish()
+    except Exception as e:
+        encoder.error = e
+        raise
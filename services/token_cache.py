@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    TOKEN_CACHE_MAX_ENTRIES,
+    TOKEN_CACHE_TTL,
+    TOKEN_CACHE_NEGATIVE_TTL,
+    SHARED_TOKEN_CACHE_SLOTS,
+    SHARED_TOKEN_CACHE_SLOT_BYTES
+)
+from services.metrics import registry, cache_collector
+from services.shared_cache import open_store
+
+# Sentinel returned by TokenCache.get when the token is not cached.
+MISS = object()
+
+
+def token_digest(token: str) -> bytes:
+    """
+    Returns the cache key of a raw token, so tokens are never kept in memory as-is.
+    """
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+class TokenCache:
+    """
+    LRU cache of verified token claims keyed by the SHA-256 of the raw token.
+
+    Valid entries expire no later than the token's "exp" claim (and at most after
+    `ttl` seconds); invalid tokens are negative-cached for `negative_ttl` seconds.
+
+    With a `shared` store (see services.shared_cache) the results are also published
+    to the other worker processes: a local miss is looked up there before the token
+    is verified again, so a user's token is verified once per host, not per worker.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_MAX_ENTRIES, ttl=TOKEN_CACHE_TTL,
+                 negative_ttl=TOKEN_CACHE_NEGATIVE_TTL, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.shared_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        """
+        Returns the cached claims (None for a cached invalid token) or MISS.
+        """
+        key = token_digest(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                entry = self._get_shared(key)
+                if entry is None:
+                    self.misses += 1
+                    return MISS
+                self.shared_hits += 1
+                self._store(key, entry)
+            self._entries.move_to_end(key)
+            if entry[0] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[0]
+
+    def _get_shared(self, key):
+        if self.shared is None:
+            return None
+        found = self.shared.get(key)
+        if found is None:
+            return None
+        value, expires_at = found
+        return (json.loads(value) if value else None), expires_at
+
+    def __contains__(self, token: str) -> bool:
+        """
+        Tells whether a live entry exists for the token (locally or in the shared
+        store), without touching the counters.
+        """
+        key = token_digest(token)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.time():
+            return True
+        return self.shared is not None and self.shared.get(key) is not None
+
+    def put(self, token: str, claims):
+        """
+        Stores the verification result of a token (claims dict, or None when invalid).
+        """
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        if claims is None:
+            expires_at = now + self.negative_ttl
+        else:
+            expires_at = now + self.ttl
+            exp = claims.get("exp")
+            if isinstance(exp, (int, float)):
+                expires_at = min(expires_at, exp)
+            if expires_at <= now:
+                return
+        key = token_digest(token)
+        with self._lock:
+            self._store(key, (claims, expires_at))
+        if self.shared is not None:
+            self.shared.put(key, json.dumps(claims).encode("utf-8") if claims is not None else b"", expires_at)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        # Only the local entries: the shared store is what lets a new worker start warm.
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters and the current size of the cache.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "shared_hits": self.shared_hits,
+            "size": len(self._entries),
+            "max_entries": self.max_entries
+        }
+
+
+# Process-wide cache used by verify_token, backed by the cross-process store.
+token_cache = TokenCache(shared=open_store("tokens", SHARED_TOKEN_CACHE_SLOTS, SHARED_TOKEN_CACHE_SLOT_BYTES))
+registry.register_collector(cache_collector("token", token_cache))
@@ -1,29 +1,81 @@
-import requests
 from jose import jwt, JWTError
-from config import COGNITO_APP_CLIENT_ID, COGNITO_ISSUER, AWS_REGION, COGNITO_USER_POOL_ID
+from config import COGNITO_APP_CLIENT_ID, COGNITO_ISSUER, COGNITO_JWKS_URL, JWT_CRYPTO_BACKEND
+from services.http_client import get_client
+from services.jwks_cache import get_jwks_cache
+from services.jwt_verifier import JWTVerifier, load_backend
+from services.single_flight import get_single_flight
+from services.token_cache import token_cache, MISS
 
 def get_cognito_jwk():
     """
     Retrieve the Cognito public keys for validating JWT tokens.
+    Concurrent fetches share a single request.
     """
-    jwks_url = f"{COGNITO_ISSUER}/.well-known/jwks.json"
-    response = requests.get(jwks_url)
+    return get_single_flight("jwks").do(COGNITO_JWKS_URL, _fetch_cognito_jwk)
+
+def _fetch_cognito_jwk():
+    response = get_client("cognito").get(COGNITO_JWKS_URL)
     response.raise_for_status()
     return response.json()
 
+_verifier = None
+
+def get_jwks_store():
+    """
+    Returns the process-wide cache of the Cognito public keys.
+    """
+    global _verifier
+    store = get_jwks_cache(COGNITO_JWKS_URL, get_cognito_jwk)
+    if _verifier is None:
+        backend = load_backend(JWT_CRYPTO_BACKEND) if JWT_CRYPTO_BACKEND != "jose" else None
+        if backend is not None:
+            verifier = JWTVerifier(COGNITO_ISSUER, COGNITO_APP_CLIENT_ID, backend)
+            store.subscribe(verifier.load_keys)
+            _verifier = verifier
+        else:
+            _verifier = False
+    return store
+
+def get_verifier():
+    """
+    Returns the JWTVerifier fed with the Cognito keys, or None when the python-jose
+    path is configured (JWT_CRYPTO_BACKEND=jose) or no crypto backend is installed.
+    """
+    get_jwks_store()
+    return _verifier or None
+
 def verify_token(token: str) -> dict:
     """
     Verify and decode the JWT token using the Cognito public keys.
+    Results are cached per token, so repeated requests skip the signature check.
+    """
+    payload = token_cache.get(token)
+    if payload is MISS:
+        payload = decode_token(token)
+        token_cache.put(token, payload)
+    return payload
+
+def decode_token(token: str) -> dict:
+    """
+    Verify the token signature and claims, without going through the token cache.
+    """
+    verifier = get_verifier()
+    if verifier is None:
+        return decode_token_jose(token)
+    try:
+        return verifier.verify(token, get_jwks_store().get_key)
+    except Exception:
+        # JWKS endpoint unreachable: invalid (and negatively cached), as in the python-jose path.
+        return None
+
+def decode_token_jose(token: str) -> dict:
+    """
+    Same check with python-jose, which rebuilds the public key from the JWK on every call.
     """
     try:
-        jwks = get_cognito_jwk()
         headers = jwt.get_unverified_header(token)
         kid = headers.get("kid")
-        key = None
-        for jwk in jwks["keys"]:
-            if jwk["kid"] == kid:
-                key = jwk
-                break
+        key = get_jwks_store().get_key(kid)
         if key is None:
             return None
         payload = jwt.decode(
@@ -0,0 +1,213 @@
+import contextvars
+import json
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACE_SAMPLE_RATE, TRACE_EXPORTER, TRACE_MEMORY_MAX_SPANS
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header):
+    """
+    Returns (trace_id, parent_span_id, sampled) from a W3C traceparent header,
+    or None if the header is missing or malformed.
+    """
+    match = TRACEPARENT_RE.match((header or "").strip().lower())
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == INVALID_TRACE_ID or span_id == INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class Span:
+    """
+    One timed operation of a trace. Unsampled spans are never exported; they only
+    carry the ids that are propagated to the upstreams.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes", "start", "_t0", "duration")
+
+    def __init__(self, name, trace_id, span_id, parent_id, sampled, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration = None
+
+    def end(self):
+        self.duration = time.perf_counter() - self._t0
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+        }
+
+
+# ---- Exporters ----
+
+class NoopExporter:
+    def export(self, spans):
+        pass
+
+
+class InMemoryExporter:
+    """
+    Keeps the last `max_spans` finished spans, for tests and local debugging.
+    """
+
+    def __init__(self, max_spans=TRACE_MEMORY_MAX_SPANS):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, spans):
+        self.spans.extend(span.to_dict() for span in spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    """
+    Writes finished spans to TRACE_FILE, one JSON object per line, through the
+    "gateway.traces" logger: the request thread only queues them and the logger's
+    background thread writes them (see logger.py).
+    """
+
+    def __init__(self):
+        # Imported here: logger.py sets up the writer threads, which only the file exporter needs.
+        from logger import trace_logger
+        self._logger = trace_logger
+
+    def export(self, spans):
+        self._logger.info("\n".join(json.dumps(span.to_dict(), default=str) for span in spans))
+
+
+def build_exporter(name: str):
+    if name == "memory":
+        return InMemoryExporter()
+    if name == "file":
+        return FileExporter()
+    return NoopExporter()
+
+
+_exporter = build_exporter(TRACE_EXPORTER)
+_sample_rate = TRACE_SAMPLE_RATE
+
+
+def set_exporter(exporter, sample_rate=None):
+    """
+    Replaces the span exporter (any object with export(spans)) and optionally the sample rate.
+    """
+    global _exporter, _sample_rate
+    _exporter = exporter
+    if sample_rate is not None:
+        _sample_rate = sample_rate
+
+
+def get_exporter():
+    return _exporter
+
+
+# ---- Spans of the current request ----
+
+_current_span = contextvars.ContextVar("gateway_current_span", default=None)
+
+
+def start_trace(traceparent, name: str, **attributes) -> Span:
+    """
+    Starts the root span of a request, continuing the caller's trace when a valid
+    traceparent is given. Requests without one are sampled at the configured rate;
+    incoming requests keep the caller's sampling decision.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = new_trace_id(), None
+        sampled = _sample_rate > 0 and random.random() < _sample_rate
+    root = Span(name, trace_id, new_span_id(), parent_id, sampled, attributes)
+    _current_span.set(root)
+    return root
+
+
+def _recording(current: Span) -> bool:
+    # The sampled flag is always propagated; spans are only built when they are exported somewhere.
+    return current.sampled and not isinstance(_exporter, NoopExporter)
+
+
+def finish_trace(**attributes):
+    """
+    Ends (and exports, when sampled) the root span of the request and returns it.
+    """
+    root = _current_span.get()
+    if root is None:
+        return None
+    _current_span.set(None)
+    if _recording(root):
+        root.attributes.update(attributes)
+        root.end()
+        _exporter.export([root])
+    return root
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Records a child span of the current span. Yields None (and records nothing) when
+    the request is not sampled.
+    """
+    parent = _current_span.get()
+    if parent is None or not _recording(parent):
+        yield None
+        return
+    child = Span(name, parent.trace_id, new_span_id(), parent.span_id, True, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+        _exporter.export([child])
+
+
+def inject_headers(headers=None) -> dict:
+    """
+    Returns a copy of the outgoing headers with the traceparent of the current span.
+    """
+    headers = dict(headers or {})
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent()
+    return headers
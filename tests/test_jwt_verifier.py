@@ -0,0 +1,73 @@
+import base64
+import json
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.fixtures import LocalIssuer
+from services import token_service
+from services.jwt_verifier import CryptographyBackend, JWTVerifier
+
+ISSUER = "https://cognito-idp.local/pool"
+CLIENT_ID = "client"
+
+
+def b64url(value: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).rstrip(b"=").decode()
+
+
+class JWTVerifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.issuer = LocalIssuer(ISSUER, CLIENT_ID)
+        cls.other = LocalIssuer(ISSUER, CLIENT_ID)
+        cls.jwks = {jwk["kid"]: jwk for jwk in cls.issuer.jwks["keys"]}
+
+    def setUp(self):
+        self.verifier = JWTVerifier(ISSUER, CLIENT_ID, CryptographyBackend())
+        self.verifier.load_keys(self.jwks)
+
+    def verify(self, token):
+        return self.verifier.verify(token, self.jwks.get)
+
+    def test_valid_token(self):
+        claims = self.verify(self.issuer.sign(sub="user-1", aud=CLIENT_ID))
+        self.assertEqual(claims["sub"], "user-1")
+
+    def test_bad_signature(self):
+        # Same kid, signed with another key.
+        self.assertIsNone(self.verify(self.other.sign()))
+        header, payload, signature = self.issuer.sign().split(".")
+        tampered = b64url({**json.loads(base64.urlsafe_b64decode(payload + "==")), "sub": "admin"})
+        self.assertIsNone(self.verify(".".join((header, tampered, signature))))
+
+    def test_wrong_issuer_or_audience(self):
+        self.assertIsNone(self.verify(self.issuer.sign(iss="https://evil.local/pool")))
+        self.assertIsNone(self.verify(self.issuer.sign(aud="another-client")))
+
+    def test_expired(self):
+        self.assertIsNone(self.verify(self.issuer.sign(expires_in=-60)))
+        self.assertIsNone(self.verify(self.issuer.sign(nbf=int(time.time()) + 600)))
+
+    def test_unknown_kid(self):
+        stranger = LocalIssuer(ISSUER, CLIENT_ID, kid="other-key")
+        self.assertIsNone(self.verify(stranger.sign()))
+
+    def test_alg_none_and_non_rs256(self):
+        payload = b64url({"sub": "admin", "iss": ISSUER, "exp": int(time.time()) + 600})
+        for alg in ("none", "HS256", "RS512"):
+            header = b64url({"alg": alg, "kid": self.issuer.kid})
+            self.assertIsNone(self.verify("%s.%s." % (header, payload)), alg)
+            self.assertIsNone(self.verify("%s.%s.c2ln" % (header, payload)), alg)
+
+    def test_jwks_fetch_failure_is_an_invalid_token(self):
+        store = mock.Mock()
+        store.get_key.side_effect = ConnectionError("jwks unreachable")
+        with mock.patch.object(token_service, "get_verifier", return_value=self.verifier), \
+                mock.patch.object(token_service, "get_jwks_store", return_value=store):
+            self.assertIsNone(token_service.decode_token(self.issuer.sign()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import unittest
+
+from services.circuit_breaker import CircuitOpenError
+from services.sync_batching import plan_chunks, merge_results
+
+
+def item(item_id, n):
+    return {"id": item_id, "domain": "appointment", "action": "update", "data": {"n": n}}
+
+
+def echo(chunk):
+    # What micro-queue answers: one result per item, in the order they were sent.
+    items = json.loads(chunk.body())["items"]
+    return {"status": "ok", "data": [{"id": i["id"], "n": i["data"]["n"]} for i in items]}, 200
+
+
+class PlanChunksTest(unittest.TestCase):
+
+    def test_single_chunk_keeps_request_order(self):
+        chunks = plan_chunks([item("A", 1), item("B", 2), item("A", 3)])
+        self.assertEqual(len(chunks), 1)
+        sent = [i["data"]["n"] for i in json.loads(chunks[0].body())["items"]]
+        self.assertEqual(sent, [1, 2, 3])
+        self.assertEqual(chunks[0].indexes, [0, 1, 2])
+
+    def test_same_id_goes_to_the_same_chunk(self):
+        items = [item("A", 1), item("B", 2), item("C", 3), item("A", 4)]
+        chunks = plan_chunks(items, max_items=2)
+        placed = {tuple(sorted(set(chunk.ids))) for chunk in chunks}
+        self.assertIn(("A",), placed)
+        for chunk in chunks:
+            self.assertEqual(chunk.indexes, sorted(chunk.indexes))
+
+    def test_merge_restores_request_order(self):
+        items = [item("A", 1), item("B", 2), item("C", 3), item("A", 4)]
+        chunks = plan_chunks(items, max_items=2)
+        data, status = merge_results(chunks, [echo(chunk) for chunk in chunks], len(items))
+        self.assertEqual(status, 200)
+        self.assertEqual([result["n"] for result in data["data"]], [1, 2, 3, 4])
+
+
+class MergeFailuresTest(unittest.TestCase):
+
+    def test_every_chunk_failing_raises_the_upstream_error(self):
+        chunks = plan_chunks([item("A", 1), item("B", 2)], max_items=1)
+        outage = CircuitOpenError("queue", 5)
+        with self.assertRaises(CircuitOpenError):
+            merge_results(chunks, [outage, ConnectionError("refused")], 2)
+
+    def test_partial_failure_keeps_a_5xx_status(self):
+        chunks = plan_chunks([item("A", 1), item("B", 2)], max_items=1)
+        data, status = merge_results(chunks, [echo(chunks[0]), ConnectionError("refused")], 2)
+        self.assertEqual(status, 502)
+        self.assertNotIn("error", data["data"][0])
+        self.assertIn("error", data["data"][1])
+
+
+if __name__ == "__main__":
+    unittest.main()